@@ -0,0 +1,56 @@
+import sys
+import time
+import numpy as np
+import loter.locanc.local_ancestry as lc
+from loter.datastruct.panel import compact_panel
+
+# Speed and accuracy of loter_local_ancestry with the populations of the
+# reference panel represented by at most `budget` references (see
+# CompactPanel), on simulated populations of very different sizes.
+#
+# usage: python benchmarks/benchmark_panel_budget.py [num_threads]
+
+num_threads = int(sys.argv[1]) if len(sys.argv) > 1 else 1
+rs = np.random.RandomState(0)
+sizes, nb_founders, m, n = [2000, 500, 100], 40, 2000, 20
+
+# references of each population are noisy copies of its founders
+l_H = []
+for k in sizes:
+    founders = rs.randint(0, 2, size=(nb_founders, m)).astype(np.uint8)
+    H = founders[rs.randint(nb_founders, size=k)]
+    H[rs.rand(k, m) < 0.01] ^= 1
+    l_H.append(H)
+
+# admixed haplotypes switching population every 500 SNPs
+A = np.vstack(l_H)
+labels = np.repeat(np.arange(len(sizes)), sizes)
+truth = np.zeros((n, m), dtype=np.uint8)
+h_adm = np.zeros((n, m), dtype=np.uint8)
+for start in range(0, m, 500):
+    rows = rs.randint(len(A), size=n)
+    h_adm[:, start:start + 500] = A[rows, start:start + 500]
+    truth[:, start:start + 500] = labels[rows][:, None]
+h_adm[rs.rand(n, m) < 0.01] ^= 1
+
+t = time.time()
+full = lc.loter_local_ancestry(l_H, h_adm, seed=1, num_threads=num_threads)[0]
+t_full = time.time() - t
+print("full panel: %d references, %.2fs, accuracy %.4f"
+      % (sum(sizes), t_full, np.mean(full == truth)))
+
+for budget in [100, 40, 20, 10]:
+    t = time.time()
+    panel = compact_panel(l_H, budget, num_threads=num_threads)
+    t_panel = time.time() - t
+    t = time.time()
+    res = lc.loter_local_ancestry(panel, h_adm, seed=1, num_threads=num_threads)[0]
+    t_run = time.time() - t
+    print("budget %d: %d references, %.2fs (+%.2fs for the panel), speedup %.1f, "
+          "accuracy %.4f, agreement with the full panel %.4f"
+          % (budget, panel.nbref, t_run, t_panel, t_full / t_run,
+             np.mean(res == truth), np.mean(res == full)))
+    for pop, cov in enumerate(panel.coverage):
+        print("  population %d: %d -> %d references, mean distance %.4f, max %.4f, exact %.3f"
+              % (pop, cov["references"], cov["representatives"], cov["mean_distance"],
+                 cov["max_distance"], cov["exact"]))
@@ -0,0 +1,367 @@
+import ctypes as C
+import numpy as np
+
+import loter.errorhandler as errorhandler
+from loter.find_lib import _LIB
+
+@errorhandler.eh_fn
+def ReferencePanelErrorHandlerFn(error_message, user_data):
+    """Callback function for C api in errorhandler.c
+
+    """
+    print("Error ReferencePanel")
+    print(error_message)
+
+def _init_reference_panel():
+
+    # Constructor
+    _LIB.referencepanel_create.argtypes = [
+        np.ctypeslib.ndpointer(dtype = np.uint8,
+                               ndim=2,
+                               flags='C_CONTIGUOUS'),
+        np.ctypeslib.ndpointer(dtype = np.uint8,
+                               ndim=1,
+                               flags='C_CONTIGUOUS'),
+        C.c_int,
+        C.c_int,
+        C.c_int,
+        C.POINTER(errorhandler.ErrorHandler)
+    ]
+    _LIB.referencepanel_create.restype = C.c_void_p
+
+    # Destructor
+    _LIB.referencepanel_destroy.argtypes = [
+        C.c_void_p,
+        C.POINTER(errorhandler.ErrorHandler)
+    ]
+    _LIB.referencepanel_destroy.restype = None
+
+    # Getter binary
+    _LIB.referencepanel_is_binary.argtypes = [
+        C.c_void_p,
+        C.POINTER(errorhandler.ErrorHandler)
+    ]
+    _LIB.referencepanel_is_binary.restype = C.c_int
+
+    _LIB.referencepanel_rows.argtypes = [
+        C.c_void_p,
+        C.c_int,
+        C.c_int,
+        np.ctypeslib.ndpointer(dtype = np.uint8,
+                               ndim=2,
+                               flags='C_CONTIGUOUS'),
+        C.POINTER(errorhandler.ErrorHandler)
+    ]
+    _LIB.referencepanel_rows.restype = None
+
+    _LIB.referencepanel_set_draw_rows.argtypes = [
+        C.c_void_p,
+        np.ctypeslib.ndpointer(dtype = np.int32,
+                               ndim=1,
+                               flags='C_CONTIGUOUS'),
+        C.c_int,
+        C.POINTER(errorhandler.ErrorHandler)
+    ]
+    _LIB.referencepanel_set_draw_rows.restype = None
+
+    _LIB.referencepanel_medoids.argtypes = [
+        np.ctypeslib.ndpointer(dtype = np.uint8,
+                               ndim=2,
+                               flags='C_CONTIGUOUS'),
+        np.ctypeslib.ndpointer(dtype = np.int32,
+                               ndim=1,
+                               flags='C_CONTIGUOUS'),
+        C.c_int,
+        C.c_int,
+        C.c_int,
+        C.c_int,
+        C.c_uint,
+        C.c_int,
+        np.ctypeslib.ndpointer(dtype = np.int32,
+                               ndim=1,
+                               flags='C_CONTIGUOUS'),
+        np.ctypeslib.ndpointer(dtype = np.int32,
+                               ndim=1,
+                               flags='C_CONTIGUOUS'),
+        np.ctypeslib.ndpointer(dtype = np.int32,
+                               ndim=1,
+                               flags='C_CONTIGUOUS'),
+        C.POINTER(errorhandler.ErrorHandler)
+    ]
+    _LIB.referencepanel_medoids.restype = C.c_int
+
+class ReferencePanel(object):
+    """Reference haplotypes of several populations, copied once in the
+    native layouts of the Sknn kernels (column-major and packed as bits).
+
+    A panel can be given instead of the list of reference matrices `l_H`
+    to the local ancestry functions, so that the references are not
+    stacked and copied again at each call. The references are only kept
+    by the native panel, `A` and `populations` are copied from it.
+
+    Attributes:
+        sizes -- number of references of each population
+        labels -- population of each reference
+    """
+
+    def __init__(self, l_H):
+        self._EH = errorhandler.ErrorHandler(ReferencePanelErrorHandlerFn, None)
+
+        A = np.ascontiguousarray(np.vstack(l_H), dtype=np.uint8)
+        self.sizes = [len(H) for H in l_H]
+        self.labels = np.repeat(np.arange(len(l_H)), self.sizes).astype(np.uint8)
+        k, m = A.shape
+        self._nbsnp = m
+
+        self.obj = _LIB.referencepanel_create(A,
+                                              self.labels,
+                                              k,
+                                              m,
+                                              len(l_H),
+                                              C.byref(self._EH))
+
+    def references(self, start=0, stop=None):
+        """Copy of the references start to stop (all of them by default),
+        shape (stop - start, m)."""
+        stop = self.nbref if stop is None else stop
+        A = np.zeros((stop - start, self.nbsnp), dtype=np.uint8)
+        _LIB.referencepanel_rows(self.obj, start, stop - start, A, C.byref(self._EH))
+        return A
+
+    @property
+    def nb_pops(self):
+        return len(self.sizes)
+
+    @property
+    def A(self):
+        """Stacked reference haplotypes, shape (k, m)."""
+        return self.references()
+
+    @property
+    def populations(self):
+        """List of the reference matrices of each population."""
+        ends = np.cumsum(self.sizes)
+        return [self.references(end - size, end) for size, end in zip(self.sizes, ends)]
+
+    @property
+    def is_binary(self):
+        return bool(_LIB.referencepanel_is_binary(self.obj, C.byref(self._EH)))
+
+    @property
+    def nbref(self):
+        return sum(self.sizes)
+
+    @property
+    def nbsnp(self):
+        return self._nbsnp
+
+    def check_snps(self, m):
+        """Raise a ValueError if haplotypes of `m` SNPs do not have the
+        SNPs of the panel."""
+        if m != self.nbsnp:
+            raise ValueError("The haplotypes have %d SNPs and the reference panel %d"
+                             % (m, self.nbsnp))
+
+    def reduce(self, h_adm):
+        """Admixed haplotypes (n, m) on the SNPs solved with the panel, all
+        of them here (see CompactPanel)."""
+        self.check_snps(h_adm.shape[1])
+        return h_adm
+
+    def expand(self, X):
+        """Values (..., m) of the SNPs solved given back to all the SNPs,
+        X itself here (see CompactPanel)."""
+        return X
+
+    def full_rows(self, S):
+        """Rows of the whole reference panel of the rows S of the panel,
+        S itself here (see CompactPanel)."""
+        return S
+
+    def __del__(self):
+        _LIB.referencepanel_destroy(self.obj, C.byref(self._EH))
+
+class CompactPanel(ReferencePanel):
+    """Reference panel without its duplicated references and its invariant
+    SNPs, for the same local ancestry as the whole panel.
+
+    The references identical to a previous one of the same population have
+    the same costs as this one at every SNP, so the Sknn paths only go
+    through the first one (the first minimum wins ties). They are kept as
+    multiplicities: the bootstrap samples of LocalAncestryEnsemble draw the
+    references of the whole panel and map them to their rows here, the
+    votes are the same for the same seed.
+
+    A SNP where all the references carry the same allele adds the same
+    cost to every reference, whether the admixed haplotype matches it,
+    differs or is missing, and keeps the minimum. Its jumps are the ones
+    the next SNP would make without it (after them every cost is at most
+    the minimum plus the penalty), so the Sknn paths of the other SNPs are
+    the same without it and its reference is the one of the next SNP kept
+    (of the previous one after the last SNP kept). The first SNP is always
+    kept as it is not weighted. With integer costs (unit weights, as in the
+    ensemble) the result is exact.
+
+    With a `budget`, a population with more distinct references is
+    represented by at most `budget` of them, the weighted k-medoids of the
+    Hamming distance (see `hamming_medoids`, seeded by `seed` plus the
+    index of the population). Each reference is drawn as its
+    representative by the bootstrap samples, so that the populations keep
+    their composition, and the cost of Sknn no longer depends on the size
+    of the largest populations. The result is then approximate.
+
+    Attributes (besides the ones of ReferencePanel):
+        snps -- SNPs kept, increasing
+        nb_snps -- number of SNPs of the whole panel
+        rows -- references of the whole panel kept, increasing
+        draw_rows -- row here of each reference of the whole panel
+        multiplicity -- number of references of the whole panel of each row
+        full_sizes -- number of references of each population of the
+                      whole panel
+        budget -- the budget of the panel, None without budget
+        distance -- Hamming distance of each reference of the whole panel
+                    to its row here (0 without `budget`)
+        coverage -- for each population, a dict of the number of
+                    "references", of "distinct" ones and of
+                    "representatives", the "mean_distance" and
+                    "max_distance" of the references to their
+                    representative as a fraction of the SNPs, and the
+                    fraction of references kept "exact"
+    """
+
+    def __init__(self, l_H, budget=None, nb_iter=10, seed=0, num_threads=10):
+        A = np.vstack(l_H)
+        self.budget = budget
+        self.nb_snps = A.shape[1]
+        keep = np.any(A != A[:1], axis=0)
+        if self.nb_snps:
+            keep[0] = True
+        self.snps = np.flatnonzero(keep)
+        A = A[:, self.snps]
+
+        # distinct references of each population, in order of first
+        # occurrence, or their representatives
+        l_rows, l_draw, l_distance = [], [], []
+        self.coverage = []
+        offset, start = 0, 0
+        for p, H in enumerate(l_H):
+            k = len(H)
+            _, first, inverse = np.unique(A[start:start + k], axis=0,
+                                          return_index=True, return_inverse=True)
+            order = np.argsort(first)
+            rank = np.empty_like(order)
+            rank[order] = np.arange(len(order))
+            first, group = first[order], rank[inverse.ravel()]
+            nb_distinct = len(first)
+            distance = np.zeros(k, dtype=np.int32)
+            if budget is not None and nb_distinct > budget:
+                medoids, assignment, dist = hamming_medoids(A[start + first],
+                                                            np.bincount(group),
+                                                            budget, nb_iter, seed + p,
+                                                            num_threads)
+                order = np.argsort(medoids)
+                rank = np.empty_like(order)
+                rank[order] = np.arange(len(order))
+                first, group, distance = first[medoids[order]], rank[assignment[group]], dist[group]
+            l_rows.append(start + first)
+            l_draw.append(offset + group)
+            l_distance.append(distance)
+            self.coverage.append({"references": k,
+                                  "distinct": nb_distinct,
+                                  "representatives": len(first),
+                                  "mean_distance": distance.mean() / max(self.nb_snps, 1),
+                                  "max_distance": distance.max() / float(max(self.nb_snps, 1)),
+                                  "exact": np.mean(distance == 0)})
+            offset += len(first)
+            start += k
+        self.rows = np.concatenate(l_rows) if l_rows else np.zeros(0, dtype=np.intp)
+        self.draw_rows = np.ascontiguousarray(np.concatenate(l_draw) if l_draw else
+                                              np.zeros(0), dtype=np.int32)
+        self.distance = np.concatenate(l_distance) if l_distance else np.zeros(0, dtype=np.int32)
+        self.multiplicity = np.bincount(self.draw_rows, minlength=len(self.rows))
+        self.full_sizes = [len(H) for H in l_H]
+
+        super(CompactPanel, self).__init__(np.split(A[self.rows],
+                                                    np.cumsum([len(r) for r in l_rows])[:-1]))
+        if len(self.rows) < len(self.draw_rows):
+            _LIB.referencepanel_set_draw_rows(self.obj,
+                                              self.draw_rows,
+                                              len(self.draw_rows),
+                                              C.byref(self._EH))
+
+        # SNP kept giving its reference to each SNP
+        self.expand_snps = np.minimum(np.searchsorted(self.snps, np.arange(self.nb_snps)),
+                                      max(len(self.snps) - 1, 0))
+
+    def reduce(self, h_adm):
+        """Admixed haplotypes (n, nb_snps) restricted to the SNPs kept."""
+        if h_adm.shape[1] != self.nb_snps:
+            raise ValueError("The haplotypes have %d SNPs and the reference panel %d"
+                             % (h_adm.shape[1], self.nb_snps))
+        return h_adm[:, self.snps]
+
+    def expand(self, X):
+        """Values (..., len(snps)) of the SNPs kept, such as ancestries or
+        votes, given back to all the SNPs."""
+        return X[..., self.expand_snps]
+
+    def full_rows(self, S):
+        """Rows of the whole reference panel of the rows S of the panel
+        (their representatives with a budget)."""
+        return self.rows[S].astype(S.dtype)
+
+def hamming_medoids(A, weights, nb_medoids, nb_iter=10, seed=0, num_threads=10):
+    """Weighted k-medoids of the rows of A (k, m) for the Hamming distance
+    of the rows packed as bits, row r standing for weights[r] rows.
+
+    output:
+    (medoids, assignment, distance) -- rows of the medoids (fewer than
+    `nb_medoids` if fewer rows are distinct), medoid (index in `medoids`)
+    of each row and its Hamming distance to it
+    """
+    A = np.ascontiguousarray(A, dtype=np.uint8)
+    k, m = A.shape
+    EH = errorhandler.ErrorHandler(ReferencePanelErrorHandlerFn, None)
+    medoids = np.zeros(nb_medoids, dtype=np.int32)
+    assignment = np.zeros(k, dtype=np.int32)
+    distance = np.zeros(k, dtype=np.int32)
+    nb = _LIB.referencepanel_medoids(A,
+                                     np.ascontiguousarray(weights, dtype=np.int32),
+                                     k,
+                                     m,
+                                     nb_medoids,
+                                     nb_iter,
+                                     seed,
+                                     num_threads,
+                                     medoids,
+                                     assignment,
+                                     distance,
+                                     C.byref(EH))
+    return medoids[:nb], assignment, distance
+
+def compact_panel(l_H, budget=None, **kwargs):
+    """Return `l_H` if it is a CompactPanel, the compact panel of the list
+    or ReferencePanel `l_H` otherwise (see CompactPanel for `budget` and
+    the other arguments).
+
+    A CompactPanel keeps only its representatives, so it can not be
+    compacted again for another `budget`: this raises a ValueError, while
+    `budget=None` returns the panel whatever its budget.
+    """
+    if isinstance(l_H, CompactPanel):
+        if budget is not None and budget != l_H.budget:
+            raise ValueError("The panel is compacted with budget %s, not %s, compact the "
+                             "reference haplotypes again" % (l_H.budget, budget))
+        return l_H
+    if isinstance(l_H, ReferencePanel):
+        l_H = l_H.populations
+    return CompactPanel(l_H, budget, **kwargs)
+
+def as_panel(l_H):
+    """Return `l_H` if it is a ReferencePanel, a new panel otherwise."""
+    if isinstance(l_H, ReferencePanel):
+        return l_H
+    return ReferencePanel(l_H)
+
+#initialize
+_init_reference_panel()
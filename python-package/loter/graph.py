@@ -13,6 +13,15 @@ def EstimateSErrorHandlerFn(error_message, user_data):
     print("Error Estimation of S")
     print(error_message)
 
+SKNN_KERNELS = {
+    "auto": -1,
+    "full": 0,
+    "compact": 1,
+    "checkpoint": 2,
+    "bitparallel": 3,
+    "integer": 4,
+}
+
 class EstimateSException(Exception):
     """Exception raised for errors in EstimateS calls
 
@@ -171,11 +180,217 @@ def _init_estimatesknn():
         C.c_int,
         C.c_int,
         C.c_int,
+        C.c_int,
+        C.c_float,
+        C.c_int,
         C.c_void_p,
         C.POINTER(errorhandler.ErrorHandler)
     ]
     _LIB.estimatesknn_run.restype = None
 
+    _LIB.estimatesknn_run_multi.argtypes = [
+        C.c_void_p,
+        np.ctypeslib.ndpointer(dtype = np.uint8,
+                               ndim=2,
+                               flags='C_CONTIGUOUS'),
+        np.ctypeslib.ndpointer(dtype = np.uint8,
+                               ndim=2,
+                               flags='C_CONTIGUOUS'),
+        np.ctypeslib.ndpointer(dtype = np.int32,
+                               ndim=1,
+                               flags='C_CONTIGUOUS'),
+        C.c_int,
+        np.ctypeslib.ndpointer(dtype = np.uint32,
+                               ndim=3,
+                               flags='C_CONTIGUOUS'),
+        np.ctypeslib.ndpointer(dtype = np.float32,
+                               ndim=1,
+                               flags='C_CONTIGUOUS'),
+        np.ctypeslib.ndpointer(dtype = np.float32,
+                               ndim=1,
+                               flags='C_CONTIGUOUS'),
+        C.c_int,
+        C.c_int,
+        C.c_int,
+        C.c_int,
+        C.c_int,
+        C.c_float,
+        C.c_int,
+        C.c_void_p,
+        C.POINTER(errorhandler.ErrorHandler)
+    ]
+    _LIB.estimatesknn_run_multi.restype = None
+
+    _LIB.estimatesknn_run_panel.argtypes = [
+        C.c_void_p,
+        np.ctypeslib.ndpointer(dtype = np.uint8,
+                               ndim=2,
+                               flags='C_CONTIGUOUS'),
+        C.c_void_p,
+        np.ctypeslib.ndpointer(dtype = np.int32,
+                               ndim=1,
+                               flags='C_CONTIGUOUS'),
+        C.c_int,
+        np.ctypeslib.ndpointer(dtype = np.uint32,
+                               ndim=3,
+                               flags='C_CONTIGUOUS'),
+        np.ctypeslib.ndpointer(dtype = np.float32,
+                               ndim=1,
+                               flags='C_CONTIGUOUS'),
+        np.ctypeslib.ndpointer(dtype = np.float32,
+                               ndim=1,
+                               flags='C_CONTIGUOUS'),
+        C.c_int,
+        C.c_int,
+        C.c_int,
+        C.c_int,
+        C.c_int,
+        C.c_float,
+        C.c_int,
+        C.POINTER(errorhandler.ErrorHandler)
+    ]
+    _LIB.estimatesknn_run_panel.restype = None
+
+    _LIB.estimatesknn_run_panel_labels.argtypes = [
+        C.c_void_p,
+        np.ctypeslib.ndpointer(dtype = np.uint8,
+                               ndim=2,
+                               flags='C_CONTIGUOUS'),
+        C.c_void_p,
+        np.ctypeslib.ndpointer(dtype = np.int32,
+                               ndim=1,
+                               flags='C_CONTIGUOUS'),
+        C.c_int,
+        np.ctypeslib.ndpointer(dtype = np.uint8,
+                               ndim=3,
+                               flags='C_CONTIGUOUS'),
+        np.ctypeslib.ndpointer(dtype = np.float32,
+                               ndim=1,
+                               flags='C_CONTIGUOUS'),
+        np.ctypeslib.ndpointer(dtype = np.float32,
+                               ndim=1,
+                               flags='C_CONTIGUOUS'),
+        C.c_int,
+        C.c_int,
+        C.c_int,
+        C.c_int,
+        C.c_int,
+        C.c_float,
+        C.c_int,
+        C.POINTER(errorhandler.ErrorHandler)
+    ]
+    _LIB.estimatesknn_run_panel_labels.restype = None
+
+    _LIB.estimatesknn_run_panel_margins.argtypes = [
+        C.c_void_p,
+        np.ctypeslib.ndpointer(dtype = np.uint8,
+                               ndim=2,
+                               flags='C_CONTIGUOUS'),
+        C.c_void_p,
+        np.ctypeslib.ndpointer(dtype = np.uint8,
+                               ndim=2,
+                               flags='C_CONTIGUOUS'),
+        np.ctypeslib.ndpointer(dtype = np.float32,
+                               ndim=2,
+                               flags='C_CONTIGUOUS'),
+        np.ctypeslib.ndpointer(dtype = np.float32,
+                               ndim=1,
+                               flags='C_CONTIGUOUS'),
+        C.c_float,
+        C.c_int,
+        C.c_int,
+        C.c_int,
+        C.c_int,
+        C.POINTER(errorhandler.ErrorHandler)
+    ]
+    _LIB.estimatesknn_run_panel_margins.restype = None
+
+    _LIB.estimatesknn_run_panel_windows.argtypes = [
+        C.c_void_p,
+        np.ctypeslib.ndpointer(dtype = np.uint8,
+                               ndim=2,
+                               flags='C_CONTIGUOUS'),
+        C.c_void_p,
+        np.ctypeslib.ndpointer(dtype = np.uint32,
+                               ndim=2,
+                               flags='C_CONTIGUOUS'),
+        np.ctypeslib.ndpointer(dtype = np.uint8,
+                               ndim=2,
+                               flags='C_CONTIGUOUS'),
+        np.ctypeslib.ndpointer(dtype = np.int32,
+                               ndim=1,
+                               flags='C_CONTIGUOUS'),
+        np.ctypeslib.ndpointer(dtype = np.float32,
+                               ndim=1,
+                               flags='C_CONTIGUOUS'),
+        C.c_float,
+        C.c_int,
+        C.c_int,
+        C.c_int,
+        C.c_int,
+        C.c_int,
+        C.c_int,
+        C.POINTER(errorhandler.ErrorHandler)
+    ]
+    _LIB.estimatesknn_run_panel_windows.restype = None
+
+    _LIB.estimatesknn_run_panel_refine.argtypes = [
+        C.c_void_p,
+        np.ctypeslib.ndpointer(dtype = np.uint8,
+                               ndim=2,
+                               flags='C_CONTIGUOUS'),
+        C.c_void_p,
+        np.ctypeslib.ndpointer(dtype = np.uint32,
+                               ndim=2,
+                               flags='C_CONTIGUOUS'),
+        np.ctypeslib.ndpointer(dtype = np.int32,
+                               ndim=2,
+                               flags='C_CONTIGUOUS'),
+        C.c_int,
+        np.ctypeslib.ndpointer(dtype = np.float32,
+                               ndim=1,
+                               flags='C_CONTIGUOUS'),
+        C.c_float,
+        C.c_int,
+        C.c_int,
+        C.c_int,
+        C.POINTER(errorhandler.ErrorHandler)
+    ]
+    _LIB.estimatesknn_run_panel_refine.restype = None
+
+    _LIB.estimatesknn_run_panel_pbwt.argtypes = [
+        C.c_void_p,
+        np.ctypeslib.ndpointer(dtype = np.uint8,
+                               ndim=2,
+                               flags='C_CONTIGUOUS'),
+        C.c_void_p,
+        np.ctypeslib.ndpointer(dtype = np.uint32,
+                               ndim=2,
+                               flags='C_CONTIGUOUS'),
+        np.ctypeslib.ndpointer(dtype = np.float32,
+                               ndim=1,
+                               flags='C_CONTIGUOUS'),
+        C.c_float,
+        C.c_int,
+        C.c_int,
+        C.c_int,
+        C.c_int,
+        C.c_int,
+        C.c_int,
+        C.c_uint,
+        C.c_int,
+        C.POINTER(errorhandler.ErrorHandler)
+    ]
+    _LIB.estimatesknn_run_panel_pbwt.restype = None
+
+def nb_windows(m, window, overlap):
+    """Number of windows of `window` SNPs overlapping by `overlap` SNPs
+    covering m SNPs."""
+    step = window - overlap
+    if m <= window or step <= 0:
+        return 1
+    return (m - window + step - 1) // step + 1
+
 class EstimateS(object):
 
     def __init__(self):
@@ -293,6 +508,7 @@ class EstimateSknn(object):
 
         G, H, A, S = data["G"], data["H"], data["A"], data["S"]
         n, m = G.shape
+        kernel = SKNN_KERNELS[param.get("kernel", "auto")]
 
         _LIB.estimatesknn_run(self.obj,
                               np.ascontiguousarray(H.T),
@@ -302,9 +518,237 @@ class EstimateSknn(object):
                               n,
                               m,
                               param["num_threads"],
+                              kernel,
+                              param.get("quant_tol", 0.0),
+                              param.get("block_size", 1),
                               param_opti.obj,
                               C.byref(self._EH))
 
+    def run_multi(self, data, param):
+        """Run the Sknn recurrence for all the penalties of
+        `param["penalties"]` in a single pass over A, `data["S"]` is
+        set to an array of shape (len(penalties), 2n, m).
+
+        If `param["rows"]` is given, only these rows of A are used as
+        references (e.g. the distinct rows of a bootstrap sample) and S
+        holds row indices of A.
+        """
+
+        param_opti = parameter.ParameterOptimization(param["penalty"],
+                                                     param["nbclust"],
+                                                     param["w_h"],
+                                                     param["nb_iter"])
+
+        G, H, A = data["G"], data["H"], data["A"]
+        n, m = G.shape
+        penalties = np.ascontiguousarray(param["penalties"], dtype=np.float32)
+        kernel = SKNN_KERNELS[param.get("kernel", "auto")]
+        S = np.zeros((len(penalties), 2*n, m), dtype=np.uint32)
+        rows = np.ascontiguousarray(param.get("rows", np.arange(len(A))), dtype=np.int32)
+
+        _LIB.estimatesknn_run_multi(self.obj,
+                                    np.ascontiguousarray(H.T),
+                                    np.ascontiguousarray(A.T),
+                                    rows,
+                                    len(rows),
+                                    S,
+                                    np.ascontiguousarray(param["weights"]).astype(np.float32),
+                                    penalties,
+                                    n,
+                                    m,
+                                    len(penalties),
+                                    param["num_threads"],
+                                    kernel,
+                                    param.get("quant_tol", 0.0),
+                                    param.get("block_size", 1),
+                                    param_opti.obj,
+                                    C.byref(self._EH))
+        data["S"] = S
+
+    def run_panel(self, data, param, panel, labels=False):
+        """Same as `run_multi` with the references of a ReferencePanel
+        instead of `data["A"]`, which are not copied. `data["S"]` holds
+        row indices of the panel.
+
+        If `labels` is True, the traceback gives the populations of the
+        references instead: `data["L"]` is set to a uint8 array of shape
+        (len(penalties), 2n, m) and `data["S"]` is not computed.
+
+        `data["H"]` is transposed at each call unless it is stored in
+        Fortran order.
+        """
+
+        H = data["H"]
+        n, m = H.shape[0] // 2, H.shape[1]
+        panel.check_snps(m)
+        penalties = np.ascontiguousarray(param["penalties"], dtype=np.float32)
+        rows = np.ascontiguousarray(param.get("rows", np.arange(panel.nbref)), dtype=np.int32)
+        kernel = SKNN_KERNELS[param.get("kernel", "auto")]
+        if labels:
+            run, key, dtype = _LIB.estimatesknn_run_panel_labels, "L", np.uint8
+        else:
+            run, key, dtype = _LIB.estimatesknn_run_panel, "S", np.uint32
+        out = np.zeros((len(penalties), 2*n, m), dtype=dtype)
+
+        run(self.obj,
+            np.ascontiguousarray(H.T),
+            panel.obj,
+            rows,
+            len(rows),
+            out,
+            np.ascontiguousarray(param["weights"], dtype=np.float32),
+            penalties,
+            n,
+            m,
+            len(penalties),
+            param["num_threads"],
+            kernel,
+            param.get("quant_tol", 0.0),
+            param.get("block_size", 1),
+            C.byref(self._EH))
+        data[key] = out
+
+    def run_margins(self, data, param, panel):
+        """Populations of the references of the Viterbi path of each
+        haplotype of `data["H"]` for `param["penalty"]`, in `data["L"]`
+        (uint8, shape (2n, m)), and the confidence of each of them in
+        `data["margins"]` (float32, shape (2n, m)): the cost of the best
+        path going through another population at the SNP minus the cost
+        of the best path. A margin of 0 means that another population is
+        as good, the margins are infinite with a single population.
+
+        The margins take a forward and a backward pass of the recurrence
+        over all the references of `panel`.
+        """
+
+        H = data["H"]
+        n, m = H.shape[0] // 2, H.shape[1]
+        panel.check_snps(m)
+        L = np.zeros((2*n, m), dtype=np.uint8)
+        margins = np.zeros((2*n, m), dtype=np.float32)
+
+        _LIB.estimatesknn_run_panel_margins(self.obj,
+                                            np.ascontiguousarray(H.T),
+                                            panel.obj,
+                                            L,
+                                            margins,
+                                            np.ascontiguousarray(param["weights"], dtype=np.float32),
+                                            param["penalty"],
+                                            n,
+                                            m,
+                                            param["num_threads"],
+                                            SKNN_KERNELS[param.get("kernel", "auto")],
+                                            C.byref(self._EH))
+        data["L"] = L
+        data["margins"] = margins
+
+    def run_windows(self, data, param, panel):
+        """Same as `run_panel` for `param["penalty"]` with the SNPs split
+        into windows of `param["window"]` SNPs overlapping by
+        `param["overlap"]` SNPs, solved independently and in parallel, so
+        that the memory of the traceback depends on the window size and not
+        on the number of SNPs.
+
+        The paths of consecutive windows are stitched at a SNP of the
+        overlap where they are on the same reference. `data["S"]` holds the
+        stitched paths and `data["seams"]` (bool, shape (2n, nb_windows - 1))
+        is True where the paths of two windows never met in the overlap,
+        the seam is then the middle of the overlap.
+
+        The haplotypes identical over a window are solved once in this
+        window: `data["unique"]` holds the number of distinct haplotypes of
+        each window and `data["dedup_ratio"]` the number of haplotype
+        windows over the number solved.
+        """
+
+        H = data["H"]
+        n, m = H.shape[0] // 2, H.shape[1]
+        panel.check_snps(m)
+        window, overlap = param["window"], param.get("overlap", param["window"] // 10)
+        S = np.zeros((2*n, m), dtype=np.uint32)
+        failed = np.zeros((2*n, nb_windows(m, window, overlap) - 1), dtype=np.uint8)
+        unique = np.zeros(nb_windows(m, window, overlap), dtype=np.int32)
+
+        _LIB.estimatesknn_run_panel_windows(self.obj,
+                                            np.ascontiguousarray(H.T),
+                                            panel.obj,
+                                            S,
+                                            failed,
+                                            unique,
+                                            np.ascontiguousarray(param["weights"], dtype=np.float32),
+                                            param["penalty"],
+                                            n,
+                                            m,
+                                            window,
+                                            overlap,
+                                            param["num_threads"],
+                                            SKNN_KERNELS[param.get("kernel", "auto")],
+                                            C.byref(self._EH))
+        data["S"] = S
+        data["seams"] = failed.astype(bool)
+        data["unique"] = unique
+        data["dedup_ratio"] = 2*n * len(unique) / float(max(unique.sum(), 1))
+
+    def run_refine(self, data, param, panel, windows):
+        """Solve again the paths of `data["S"]` (panel rows, uint32, shape
+        (2n, m)) in place in the `windows` (i, start, end), for
+        `param["penalty"]`, with the references of the path between
+        start - 1 and end as the only candidates and the references of the
+        path at start - 1 and at end kept. The windows of a haplotype must
+        be separated by at least one SNP.
+        """
+
+        H = data["H"]
+        n, m = H.shape[0] // 2, H.shape[1]
+        panel.check_snps(m)
+        windows = np.ascontiguousarray(windows, dtype=np.int32).reshape(-1, 3)
+
+        _LIB.estimatesknn_run_panel_refine(self.obj,
+                                           np.ascontiguousarray(H.T),
+                                           panel.obj,
+                                           data["S"],
+                                           windows,
+                                           len(windows),
+                                           np.ascontiguousarray(param["weights"], dtype=np.float32),
+                                           param["penalty"],
+                                           n,
+                                           m,
+                                           param["num_threads"],
+                                           C.byref(self._EH))
+
+    def run_pbwt(self, data, param, panel):
+        """Same as `run_panel` for `param["penalty"]` with, in each window
+        of `param["window"]` SNPs, the candidate references of a positional
+        Burrows-Wheeler transform of the panel and of the haplotypes only:
+        the `param["neighbours"]` references with the longest matches
+        ending at the end of each of the `param["checkpoints"]` parts of
+        the window, and `param["random"]` references drawn at random (with
+        `param["seed"]`). The panel must be binary. `data["S"]` holds the
+        best paths through the candidates.
+        """
+
+        H = data["H"]
+        n, m = H.shape[0] // 2, H.shape[1]
+        panel.check_snps(m)
+        S = np.zeros((2*n, m), dtype=np.uint32)
+
+        _LIB.estimatesknn_run_panel_pbwt(self.obj,
+                                         np.ascontiguousarray(H.T),
+                                         panel.obj,
+                                         S,
+                                         np.ascontiguousarray(param["weights"], dtype=np.float32),
+                                         param["penalty"],
+                                         n,
+                                         m,
+                                         param.get("window", 1000),
+                                         param.get("checkpoints", 50),
+                                         param.get("neighbours", 4),
+                                         param.get("random", 4),
+                                         param.get("seed", 0),
+                                         param["num_threads"],
+                                         C.byref(self._EH))
+        data["S"] = S
+
     def __del__(self):
         _LIB.estimatesknn_destroy(self.obj, C.byref(self._EH))
 
@@ -313,6 +757,11 @@ def optimize_Sknn(data, param):
     estsknn.run(data, param)
     return (data, param)
 
+def optimize_Sknn_multi(data, param):
+    estsknn = EstimateSknn()
+    estsknn.run_multi(data, param)
+    return (data, param)
+
 #initialize
 _init_estimates()
 _init_estimatesh()
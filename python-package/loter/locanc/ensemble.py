@@ -0,0 +1,213 @@
+import ctypes as C
+import numpy as np
+
+import loter.errorhandler as errorhandler
+from loter.graph import SKNN_KERNELS
+from loter.datastruct.panel import CompactPanel, as_panel
+from loter.find_lib import _LIB
+
+@errorhandler.eh_fn
+def EnsembleErrorHandlerFn(error_message, user_data):
+    """Callback function for C api in errorhandler.c
+
+    """
+    print("Error Local Ancestry Ensemble")
+    print(error_message)
+
+def _init_ensemble():
+
+    # Constructor
+    _LIB.ensemble_create.argtypes = [
+        C.POINTER(errorhandler.ErrorHandler)
+    ]
+    _LIB.ensemble_create.restype = C.c_void_p
+
+    # Destructor
+    _LIB.ensemble_destroy.argtypes = [
+        C.c_void_p,
+        C.POINTER(errorhandler.ErrorHandler)
+    ]
+    _LIB.ensemble_destroy.restype = None
+
+    _LIB.ensemble_run.argtypes = [
+        C.c_void_p,
+        np.ctypeslib.ndpointer(dtype = np.uint8,
+                               ndim=2,
+                               flags='C_CONTIGUOUS'),
+        C.c_void_p,
+        np.ctypeslib.ndpointer(dtype = np.float32,
+                               ndim=1,
+                               flags='C_CONTIGUOUS'),
+        np.ctypeslib.ndpointer(dtype = np.uint8,
+                               ndim=2,
+                               flags='C_CONTIGUOUS'),
+        np.ctypeslib.ndpointer(dtype = np.uint16,
+                               ndim=2,
+                               flags='C_CONTIGUOUS'),
+        np.ctypeslib.ndpointer(dtype = np.int32,
+                               ndim=1,
+                               flags='C_CONTIGUOUS'),
+        C.c_int,
+        C.c_int,
+        C.c_int,
+        C.c_int,
+        C.c_uint,
+        C.c_int,
+        C.c_float,
+        C.c_int,
+        C.c_int,
+        C.c_float,
+        C.c_int,
+        C.POINTER(errorhandler.ErrorHandler)
+    ]
+    _LIB.ensemble_run.restype = None
+
+    _LIB.ensemble_bootstrap_rows.argtypes = [
+        C.c_void_p,
+        C.c_uint,
+        C.c_int,
+        np.ctypeslib.ndpointer(dtype = np.int32,
+                               ndim=1,
+                               flags='C_CONTIGUOUS'),
+        C.POINTER(errorhandler.ErrorHandler)
+    ]
+    _LIB.ensemble_bootstrap_rows.restype = C.c_int
+
+    _LIB.ensemble_unique_rows.argtypes = [
+        np.ctypeslib.ndpointer(dtype = np.uint8,
+                               ndim=2,
+                               flags='C_CONTIGUOUS'),
+        C.c_int,
+        C.c_int,
+        np.ctypeslib.ndpointer(dtype = np.int32,
+                               ndim=1,
+                               flags='C_CONTIGUOUS'),
+        np.ctypeslib.ndpointer(dtype = np.int32,
+                               ndim=1,
+                               flags='C_CONTIGUOUS'),
+        C.POINTER(errorhandler.ErrorHandler)
+    ]
+    _LIB.ensemble_unique_rows.restype = C.c_int
+
+class LocalAncestryEnsemble(object):
+
+    def __init__(self):
+        self._EH = errorhandler.ErrorHandler(EnsembleErrorHandlerFn, None)
+        self.obj = _LIB.ensemble_create(C.byref(self._EH))
+
+    def run(self, l_H, h_adm, range_lambda, nb_bagging=20, seed=0, num_threads=10,
+            kernel="auto", block_size=1, adaptive=False, confidence=None, unique=True):
+        """Bagging of Sknn over bootstrap samples of the reference panel
+        and the penalties of `range_lambda`, in a single native call.
+
+        input:
+        l_H -- list of the reference haplotypes of each population or ReferencePanel
+        h_adm -- admixed haplotypes, shape (n, m)
+        range_lambda -- penalties
+        nb_bagging -- number of bootstrap samples, the whole panel is used
+                      once if nb_bagging <= 1. Each sample is shared by
+                      all the penalties, the `nb_bagging * len(range_lambda)`
+                      votes are therefore correlated by sample
+        seed -- seed of the bootstrap samples
+        adaptive -- stop drawing bootstrap samples for a haplotype once
+                    the remaining runs can no longer change its ancestry at
+                    any SNP (the ancestry is the same as without `adaptive`)
+        confidence -- with `adaptive`, also stop once the population with
+                      the most votes has at least this fraction of the
+                      votes at every SNP
+        unique -- solve the identical haplotypes once, their ancestries
+                  and votes are the same. The number of haplotypes over
+                  the number solved is kept in `self.dedup_ratio`
+
+        output:
+        (ancestry, votes) -- population with the most votes for each
+        haplotype and SNP (the first one on ties) and its number of votes,
+        scaled to `nb_bagging` runs for the haplotypes stopped early.
+        The number of runs of each haplotype is kept in `self.runs`.
+
+        With a CompactPanel, the haplotypes are solved on the SNPs it keeps
+        and the output is given back on all the SNPs.
+        """
+        if confidence is not None and not adaptive:
+            raise ValueError("`confidence` can only be used with `adaptive`")
+        panel = as_panel(l_H)
+        compact = isinstance(panel, CompactPanel)
+        if compact:
+            h_adm = panel.reduce(h_adm)
+        nb_haplotypes = len(h_adm)
+        if unique:
+            first, inverse = unique_rows(h_adm)
+            h_adm = h_adm[first]
+        self.dedup_ratio = nb_haplotypes / float(max(len(h_adm), 1))
+        n, m = h_adm.shape
+        panel.check_snps(m)
+        penalties = np.ascontiguousarray(range_lambda, dtype=np.float32)
+        if max(nb_bagging, 1) * len(penalties) > np.iinfo(np.uint16).max:
+            raise ValueError("`nb_bagging * len(range_lambda)` votes do not fit in 16 bits")
+
+        ancestry = np.zeros((n, m), dtype=np.uint8)
+        votes = np.zeros((n, m), dtype=np.uint16)
+        self.runs = np.zeros(n, dtype=np.int32)
+
+        _LIB.ensemble_run(self.obj,
+                          np.ascontiguousarray(np.asarray(h_adm, dtype=np.uint8).T),
+                          panel.obj,
+                          penalties,
+                          ancestry,
+                          votes,
+                          self.runs,
+                          n,
+                          m,
+                          len(penalties),
+                          nb_bagging,
+                          seed,
+                          adaptive,
+                          2.0 if confidence is None else confidence,
+                          num_threads,
+                          SKNN_KERNELS[kernel],
+                          0.0,
+                          block_size,
+                          C.byref(self._EH))
+
+        if unique:
+            ancestry, votes, self.runs = ancestry[inverse], votes[inverse], self.runs[inverse]
+        if compact:
+            return panel.expand(ancestry), panel.expand(votes)
+        return ancestry, votes
+
+    def __del__(self):
+        _LIB.ensemble_destroy(self.obj, C.byref(self._EH))
+
+def bootstrap_rows(panel, seed, b):
+    """Distinct rows of the bootstrap sample `b` of the ReferencePanel
+    `panel` drawn by LocalAncestryEnsemble.run with `seed`, in order of
+    first draw."""
+    EH = errorhandler.ErrorHandler(EnsembleErrorHandlerFn, None)
+    rows = np.zeros(panel.nbref, dtype=np.int32)
+    nb = _LIB.ensemble_bootstrap_rows(panel.obj, seed, b, rows, C.byref(EH))
+    return rows[:nb]
+
+def unique_rows(X):
+    """Distinct rows of the uint8 array X (n, m), grouped by the native
+    hash of the rows (the one of the windows of Sknn), the rows of a group
+    being compared only with its first one.
+
+    output:
+    (first, inverse) -- the first row of each group of identical rows, in
+    order of first occurrence, and the group of each row, so that
+    X[first][inverse] is X.
+    """
+    n, m = X.shape
+    EH = errorhandler.ErrorHandler(EnsembleErrorHandlerFn, None)
+    first = np.zeros(n, dtype=np.int32)
+    inverse = np.zeros(n, dtype=np.int32)
+    nb = _LIB.ensemble_unique_rows(np.ascontiguousarray(np.asarray(X, dtype=np.uint8).T),
+                                   n,
+                                   m,
+                                   first,
+                                   inverse,
+                                   C.byref(EH))
+    return first[:nb], inverse
+
+#initialize
+_init_ensemble()
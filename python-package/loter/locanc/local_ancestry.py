@@ -1,6 +1,5 @@
 import numpy as np
 import scipy.stats as stats
-import pandas as pd
 
 import loter.pipeline as lt
 import loter.initparam as initparam
@@ -9,6 +8,9 @@ import loter.opti as opti
 import loter.estimatea as esta
 import loter.estimateh as esth
 import loter.graph as ests
+from loter.datastruct.panel import CompactPanel, ReferencePanel, as_panel, compact_panel
+import loter.locanc.ensemble as ensemble
+import loter.locanc.phase_correction as phase_correction
 
 ##################################################################
 #                                                                #
@@ -87,7 +89,8 @@ fixa_pip_AH_knn = lt.Pipeline(
     opti_AH_fix_knn
 )
 
-def learn_Sknn(pop, A_in, H_in, weights, penalty=40, num_threads=10):
+def learn_Sknn(pop, A_in, H_in, weights, penalty=40, num_threads=10,
+               kernel="auto"):
     G_pop = pop["G"]
     H_pop = H_in
 
@@ -95,6 +98,7 @@ def learn_Sknn(pop, A_in, H_in, weights, penalty=40, num_threads=10):
                                 nb_iter=1, nbclust=len(A_in), penalty=penalty,
                                 num_threads=num_threads,
                                 weights=weights,
+                                kernel=kernel,
                                 A_in=A_in,
                                 H_in=H_pop
     )
@@ -128,43 +132,312 @@ def clusters_to_list_pop(S, l_k):
     S -- matrix where we are copying
     l_k -- populations sizes
     """
-    res = np.copy(S)
+    labels = np.repeat(np.arange(len(l_k)), l_k).astype(S.dtype)
+    return labels[S]
 
-    a = np.repeat(np.arange(len(l_k)), l_k)
-    b = np.arange(sum(l_k))
-    d = {k: v for v, k in zip(a, b)}
-    for k, v in get_items(d): res[S==k] = v
-    return res
+def populations(l_h):
+    """
+    List of the reference matrices of each population, `l_h` is such a
+    list or a ReferencePanel. A CompactPanel no longer has the references
+    of all the SNPs, it is solved by the functions that take a panel.
+    """
+    if isinstance(l_h, CompactPanel):
+        raise ValueError("A CompactPanel does not hold the whole reference haplotypes")
+    if isinstance(l_h, ReferencePanel):
+        return l_h.populations
+    return l_h
 
 def locanc_g_knn(l_h, g_adm, penalty=40, small_penalty=0, num_threads=10):
+    l_h = populations(l_h)
     A_in = np.ascontiguousarray(np.vstack(l_h))
     S_adm, H = learn_S_join({"G": g_adm}, A_in, penalty, small_penalty, num_threads)
     result = clusters_to_list_pop(S_adm, [len(A) for A in l_h])
 
     return result, S_adm, H
 
-def locanc_h_knn(l_h, h_adm, penalty=40, num_threads=10):
+def locanc_h_knn(l_h, h_adm, penalty=40, num_threads=10, kernel="auto"):
+    l_h = populations(l_h)
     A_in = np.ascontiguousarray(np.vstack(l_h))
     g_adm = h_adm[::2] + h_adm[1::2]
     n, m = h_adm.shape
     weights = np.ones(m)
-    S_adm = learn_Sknn({"G": g_adm, "H": h_adm}, A_in, h_adm, weights, penalty, num_threads)
+    S_adm = learn_Sknn({"G": g_adm, "H": h_adm}, A_in, h_adm, weights, penalty, num_threads,
+                       kernel)
     result = clusters_to_list_pop(S_adm, [len(A) for A in l_h])
 
     return result, S_adm
 
+def locanc_h_knn_multi(l_h, h_adm, penalties, num_threads=10, kernel="auto"):
+    """Same as `locanc_h_knn` for all the `penalties` at once, `l_h` can be
+    a ReferencePanel. A CompactPanel is solved on the SNPs it keeps, the
+    output is given back on all the SNPs and `S_adm` holds rows of the
+    whole panel.
+    """
+    panel = as_panel(l_h)
+    h_adm = panel.reduce(h_adm)
+    n, m = h_adm.shape
+    data = {"H": np.asfortranarray(h_adm, dtype=np.uint8)}
+    param = {"penalties": penalties,
+             "num_threads": num_threads,
+             "weights": np.ones(m, dtype=np.float32),
+             "kernel": kernel}
+    ests.EstimateSknn().run_panel(data, param, panel)
+    S_adm = data["S"]
+    result = clusters_to_list_pop(S_adm, panel.sizes)
+
+    return panel.expand(result), panel.full_rows(panel.expand(S_adm))
+
+def locanc_h_knn_margins(l_h, h_adm, penalty, num_threads=10, kernel="auto"):
+    """Ancestry of a single Sknn run for `penalty` and its per-SNP margins
+    (see `EstimateSknn.run_margins`), a confidence in about two passes of
+    the recurrence instead of the votes of a bagging ensemble. A
+    CompactPanel is solved on the SNPs it keeps, a SNP it removes gets
+    the margin of the SNP giving it its reference (see CompactPanel).
+    """
+    panel = as_panel(l_h)
+    h_adm = panel.reduce(h_adm)
+    n, m = h_adm.shape
+    data = {"H": np.asfortranarray(h_adm, dtype=np.uint8)}
+    param = {"penalty": penalty,
+             "num_threads": num_threads,
+             "weights": np.ones(m, dtype=np.float32),
+             "kernel": kernel}
+    ests.EstimateSknn().run_margins(data, param, panel)
+
+    return panel.expand(data["L"]), panel.expand(data["margins"])
+
+def locanc_h_knn_windowed(l_h, h_adm, penalty, window=10000, overlap=1000,
+                          num_threads=10, kernel="auto"):
+    """Same as `locanc_h_knn_multi` for a single penalty, with the SNPs
+    solved by overlapping windows (see `EstimateSknn.run_windows`).
+
+    output:
+    (result, S_adm, seams) -- `seams` is True for the haplotypes and
+    seams between windows where the paths of the two windows never met.
+
+    With a CompactPanel, the windows are counted in the SNPs it keeps.
+    """
+    panel = as_panel(l_h)
+    h_adm = panel.reduce(h_adm)
+    n, m = h_adm.shape
+    data = {"H": np.asfortranarray(h_adm, dtype=np.uint8)}
+    param = {"penalty": penalty,
+             "window": window,
+             "overlap": overlap,
+             "num_threads": num_threads,
+             "weights": np.ones(m, dtype=np.float32),
+             "kernel": kernel}
+    ests.EstimateSknn().run_windows(data, param, panel)
+    S_adm = data["S"]
+    result = clusters_to_list_pop(S_adm, panel.sizes)
+
+    return panel.expand(result), panel.full_rows(panel.expand(S_adm)), data["seams"]
+
+def locanc_h_knn_pbwt(l_h, h_adm, penalty, window=1000, checkpoints=50, neighbours=4,
+                      random=4, seed=0, num_threads=10):
+    """Same as `locanc_h_knn_multi` for a single penalty, with each window
+    of `window` SNPs solved on the candidate references given by a
+    positional Burrows-Wheeler transform (see `EstimateSknn.run_pbwt`),
+    so that the cost of a haplotype hardly depends on the number of
+    references. The references must be binary. With a CompactPanel, the
+    windows are counted in the SNPs it keeps.
+    """
+    panel = as_panel(l_h)
+    h_adm = panel.reduce(h_adm)
+    n, m = h_adm.shape
+    data = {"H": np.asfortranarray(h_adm, dtype=np.uint8)}
+    param = {"penalty": penalty,
+             "window": window,
+             "checkpoints": checkpoints,
+             "neighbours": neighbours,
+             "random": random,
+             "seed": seed,
+             "num_threads": num_threads,
+             "weights": np.ones(m, dtype=np.float32)}
+    ests.EstimateSknn().run_pbwt(data, param, panel)
+    S_adm = data["S"]
+    result = clusters_to_list_pop(S_adm, panel.sizes)
+
+    return panel.expand(result), panel.full_rows(panel.expand(S_adm))
+
+def breakpoint_windows(S_coarse, cols, m, margin):
+    """Windows (i, start, end) of the SNPs around the changes of reference
+    of the coarse paths `S_coarse` on the SNPs `cols`, extended by
+    `margin` SNPs on both sides, the windows of a haplotype that overlap or
+    touch being merged."""
+    i, t = np.nonzero(S_coarse[:, 1:] != S_coarse[:, :-1])
+    if len(i) == 0:
+        return np.zeros((0, 3), dtype=np.int32)
+    start = np.maximum(cols[t] - margin, 0)
+    end = np.minimum(cols[t + 1] + margin + 1, m)
+    new = np.r_[True, (i[1:] != i[:-1]) | (start[1:] > end[:-1])]
+    first = np.flatnonzero(new)
+    last = np.r_[first[1:], len(i)] - 1
+    return np.column_stack([i[first], start[first], end[last]]).astype(np.int32)
+
+def coarse_to_fine(panel, coarse_panel, data, penalties, stride, margin, rows=None,
+                   num_threads=10, kernel="auto"):
+    """Sknn paths (panel rows) of the haplotypes `data["H"]` for each penalty
+    of `penalties`, solved on every `stride` SNP with the references
+    `coarse_panel` (the SNPs of `panel` thinned), then at full resolution
+    in the windows around the coarse changes of reference (see
+    `breakpoint_windows` and `EstimateSknn.run_refine`).
+
+    The coarse penalty is not divided by `stride`: the SNP of a change of
+    reference is placed by the recurrence whatever the penalty, while a
+    smaller penalty lets the coarse paths jump over every error.
+
+    output:
+    (l_S, refined) -- paths of each penalty and number of SNPs refined
+    """
+    H = data["H"]
+    m = H.shape[1]
+    cols = np.arange(0, m, stride)
+    weights = np.ones(m, dtype=np.float32)
+    estsknn = ests.EstimateSknn()
+
+    coarse = {"H": np.asfortranarray(H[:, cols])}
+    param = {"penalties": penalties,
+             "num_threads": num_threads,
+             "weights": np.ones(len(cols), dtype=np.float32),
+             "kernel": kernel}
+    if rows is not None:
+        param["rows"] = rows
+    estsknn.run_panel(coarse, param, coarse_panel)
+
+    l_S, refined = [], 0
+    for penalty, S_coarse in zip(penalties, coarse["S"]):
+        windows = breakpoint_windows(S_coarse, cols, m, margin)
+        fine = {"H": data["H"],
+                "S": np.ascontiguousarray(np.repeat(S_coarse, stride, axis=1)[:, :m])}
+        param = {"penalty": penalty, "num_threads": num_threads, "weights": weights}
+        estsknn.run_refine(fine, param, panel, windows)
+        l_S.append(fine["S"])
+        refined += int(np.sum(windows[:, 2] - windows[:, 1]))
+
+    return l_S, refined
+
+def thin_panel(panel, stride):
+    """Reference panel of every `stride` SNP of `panel`."""
+    return ReferencePanel([A[:, ::stride] for A in panel.populations])
+
+def locanc_h_knn_coarse(l_h, h_adm, penalty, stride=16, margin=None, num_threads=10,
+                        kernel="auto"):
+    """Same as `locanc_h_knn_multi` for a single penalty, solved coarse to
+    fine (see `coarse_to_fine`), with windows extended by `margin` SNPs
+    (`stride` by default) around the coarse breakpoints.
+
+    output:
+    (result, S_adm, refined) -- `refined` is the fraction of the SNPs of
+    the haplotypes solved again at full resolution
+
+    With a CompactPanel, the stride and the margin are counted in the SNPs
+    it keeps.
+    """
+    panel = as_panel(l_h)
+    h_adm = panel.reduce(h_adm)
+    n, m = h_adm.shape
+    data = {"H": np.asfortranarray(h_adm, dtype=np.uint8)}
+    l_S, refined = coarse_to_fine(panel, thin_panel(panel, stride), data, [penalty],
+                                  stride, stride if margin is None else margin,
+                                  num_threads=num_threads, kernel=kernel)
+    S_adm = l_S[0]
+    result = clusters_to_list_pop(S_adm, panel.sizes)
+
+    return (panel.expand(result), panel.full_rows(panel.expand(S_adm)),
+            refined / float(S_adm.size))
+
+def loter_local_ancestry_coarse(l_H, h_adm, range_lambda=np.arange(1.5, 5.5, 0.5),
+                                nb_bagging=20, stride=16, margin=None, num_threads=10,
+                                seed=None, kernel="auto"):
+    """Bagging of `loter_local_ancestry` with each run solved coarse to
+    fine (see `coarse_to_fine`). The bootstrap samples are the ones of
+    LocalAncestryEnsemble.run for the same `seed`, and a CompactPanel is
+    solved on the SNPs it keeps (see CompactPanel).
+
+    output:
+    (ancestry, votes, refined) -- as `loter_local_ancestry` with
+    `default=True`, and the fraction of the SNPs of the haplotypes solved
+    again at full resolution over all the runs
+    """
+    panel = as_panel(l_H)
+    compact = isinstance(panel, CompactPanel)
+    if compact:
+        h_adm = panel.reduce(h_adm)
+    coarse_panel = thin_panel(panel, stride)
+    n, m = h_adm.shape
+    data = {"H": np.asfortranarray(np.vstack([h_adm, np.zeros((n % 2, m))]), dtype=np.uint8)}
+    if seed is None:
+        seed = np.random.randint(np.iinfo(np.int32).max)
+    nb_runs = max(nb_bagging, 1)
+    counts = new_counts(panel.nb_pops, n, m, nb_runs * len(range_lambda))
+
+    refined = 0
+    for b in range(nb_runs):
+        rows = ensemble.bootstrap_rows(panel, seed, b) if nb_bagging > 1 else None
+        l_S, nb = coarse_to_fine(panel, coarse_panel, data, range_lambda, stride,
+                                 stride if margin is None else margin, rows, num_threads,
+                                 kernel)
+        for S in l_S:
+            counts = update_counts(counts, panel.labels[S[:n]], panel.nb_pops)
+        refined += nb
+    ancestry, votes = mode(counts)
+    if compact:
+        ancestry, votes = panel.expand(ancestry), panel.expand(votes)
+
+    return ancestry, votes, refined / float(nb_runs * len(range_lambda) * data["H"].size)
+
+def new_counts(k, n, m, nb_votes):
+    """Vote counts of `k` populations for (n, m) haplotypes and SNPs, in
+    the smallest unsigned type that holds `nb_votes` votes."""
+    dtype = np.uint8 if nb_votes <= np.iinfo(np.uint8).max else np.uint16
+    if nb_votes > np.iinfo(dtype).max:
+        dtype = np.uint32
+    return np.zeros((k, n, m), dtype=dtype)
+
 def update_counts(counts, arr, k=2):
-    for p in range(k):
-        counts[p,:,:][arr == p] += 1
+    """Add a vote for population arr[i, j] to counts[arr[i, j], i, j], in
+    place when `counts` is C contiguous. Values of `arr` >= k get no vote.
+
+    The votes are added by a single scatter over the flattened counts,
+    by chunks of rows so that the indices stay small.
+    """
+    _, n, m = counts.shape
+    if not counts.flags.c_contiguous:
+        for p in range(k):
+            counts[p,:,:][arr == p] += 1
+        return counts
+
+    flat = counts.reshape(-1)
+
+    chunk = max(1, (1 << 20) // max(m, 1))
+    offsets = np.arange(min(chunk, n) * m, dtype=np.intp)
+    for start in range(0, n, chunk):
+        rows = arr[start:start+chunk].reshape(-1)
+        idx = rows.astype(np.intp) * (n * m)
+        idx += offsets[:len(rows)]
+        idx += start * m
+        if np.any(rows >= k):
+            idx = idx[rows < k]
+        # (i, j) is voted once, no repeated index in idx
+        flat[idx] += 1
     return counts
 
 def mode(counts):
-    argmax = np.argmax(counts, axis=0)
-    return argmax, argmax.choose(counts)
+    """Population with the most votes (the first one on ties) and its
+    number of votes for each haplotype and SNP."""
+    argmax = np.zeros(counts.shape[1:], dtype=np.uint8)
+    votes = counts[0].copy()
+    for p in range(1, counts.shape[0]):
+        better = counts[p] > votes
+        argmax[better] = p
+        np.maximum(votes, counts[p], out=votes)
+    return argmax, votes
 
 def encode_haplo(H):
     H1, H2 = H[::2], H[1::2]
-    return ((np.maximum(H1, H2) * (np.maximum(H1, H2) + 1)) / 2) + np.minimum(H1, H2)
+    hi = np.maximum(H1, H2).astype(np.uint16)
+    return hi * (hi + 1) // 2 + np.minimum(H1, H2)
 
 def loter_multiple_pops(l_H, h_adm, lambd, num_threads=10, default=True):
     odd = False
@@ -172,7 +445,7 @@ def loter_multiple_pops(l_H, h_adm, lambd, num_threads=10, default=True):
         odd = True
         h_adm = np.vstack([h_adm, np.repeat(0, h_adm.shape[1])])
 
-    res_loter, _= locanc_h_knn([h.astype(np.uint8) for h in l_H],
+    res_loter, _= locanc_h_knn([h.astype(np.uint8) for h in populations(l_H)],
                                h_adm.astype(np.uint8), lambd, num_threads)
 
     if odd & default:
@@ -180,52 +453,98 @@ def loter_multiple_pops(l_H, h_adm, lambd, num_threads=10, default=True):
 
     return res_loter
 
-def boostrap_loter_multiple_pops(l_H, h_adm, lambd, counts, nbrun=20, num_threads=10):
-
-    def shuffle(H):
-        n, m = H.shape
-        return H[np.random.randint(n, size=n), :]
-
-    if nbrun > 1:
-        for i in range(nbrun):
-            shuffled_H = [shuffle(h) for h in l_H]
-            counts = update_counts(counts,
-                                   loter_multiple_pops(shuffled_H,
-                                                       h_adm,
-                                                       lambd,
-                                                       num_threads,
-                                                       False),
-                                   len(l_H)
-            )
-    else:
-        counts = update_counts(counts,
-                               loter_multiple_pops(l_H,
-                                                   h_adm,
-                                                   lambd,
-                                                   num_threads,
-                                                   False),
-                               len(l_H)
-        )
+def boostrap_loter_multiple_pops(l_H, h_adm, lambd, counts, nbrun=20, num_threads=10,
+                                 seed=None):
+    return boostrap_loter_multiple_lambdas(l_H, h_adm, [lambd], counts, nbrun, num_threads,
+                                           seed)
 
+def boostrap_loter_multiple_lambdas(l_H, h_adm, range_lambda, counts, nbrun=20,
+                                    num_threads=10, seed=None):
+    """
+    Same as `boostrap_loter_multiple_pops` for all the values of
+    `range_lambda` at once: each bootstrap sample of the reference
+    haplotypes is shared by all the penalties, which are solved in a single
+    pass over the data. This is not the estimator of calling
+    `boostrap_loter_multiple_pops` for each penalty: there are `nbrun`
+    resamples instead of `nbrun * len(range_lambda)`, the votes of a
+    resample are correlated and the vote fractions vary more between
+    seeds.
+
+    The bootstrap samples are the ones of LocalAncestryEnsemble.run for
+    the same `seed` (see `ensemble.bootstrap_rows`), `seed` defaults to a
+    draw of numpy global random state. `l_H` can be a ReferencePanel to
+    reuse it between calls. If `counts` is None, compact vote counts are allocated (see
+    `new_counts`). A CompactPanel is solved on the SNPs it keeps and its
+    votes are added to all the SNPs of `counts`.
+    """
+    panel = as_panel(l_H)
+    h_adm = panel.reduce(h_adm)
+    n, m = h_adm.shape
+    full_counts = counts
+    compact = isinstance(panel, CompactPanel)
+    if counts is None or compact:
+        counts = new_counts(panel.nb_pops, n, m, max(nbrun, 1) * len(range_lambda))
+    data = {"H": np.asfortranarray(h_adm, dtype=np.uint8)}
+    param = {"penalties": range_lambda,
+             "num_threads": num_threads,
+             "weights": np.ones(m, dtype=np.float32)}
+    estsknn = ests.EstimateSknn()
+    if seed is None:
+        seed = np.random.randint(np.iinfo(np.int32).max)
+
+    for b in range(max(nbrun, 1)):
+        param["rows"] = (ensemble.bootstrap_rows(panel, seed, b) if nbrun > 1
+                         else np.arange(panel.nbref))
+        estsknn.run_panel(data, param, panel, labels=True)
+        for L in data["L"]:
+            counts = update_counts(counts, L, panel.nb_pops)
+
+    if compact:
+        counts = panel.expand(counts)
+        if full_counts is not None:
+            full_counts += counts
+            counts = full_counts
     return counts
 
 def loter_local_ancestry(l_H, h_adm, range_lambda=np.arange(1.5, 5.5, 0.5),
                          rate_vote=0.5, nb_bagging=20, num_threads=10,
-                         default=True):
+                         default=True, seed=None, adaptive=False, confidence=None,
+                         stride=None, compact=True, budget=None):
 
     odd = False
     if h_adm.shape[0] % 2 != 0 & default:
         odd = True
         h_adm = np.vstack([h_adm, np.repeat(0, h_adm.shape[1])])
 
-    input_loter = (l_H, h_adm)
-    n, m = h_adm.shape
-    counts = np.zeros((len(l_H), n, m))
-    for l in range_lambda:
-        res_boostrap = boostrap_loter_multiple_pops(*input_loter, lambd=l,
-                                                    counts=counts, nbrun=nb_bagging,
-                                                    num_threads=num_threads)
-    res_tmp = mode(counts)
+    # the bootstrap samples are drawn natively, `seed` defaults to a draw
+    # of numpy global random state so that np.random.seed still applies.
+    # A sample is shared by all the values of `range_lambda`, `nb_bagging`
+    # resamples vote len(range_lambda) times each
+    if seed is None:
+        seed = np.random.randint(np.iinfo(np.int32).max)
+    if stride is not None and (adaptive or confidence is not None):
+        raise ValueError("`adaptive` and `confidence` can not be used with `stride`")
+    if confidence is not None and not adaptive:
+        raise ValueError("`confidence` can only be used with `adaptive`")
+    # with `compact`, the duplicated references and the invariant SNPs of the
+    # panel are removed, for the same result, and with `budget` the
+    # populations are represented by at most `budget` references (see
+    # CompactPanel)
+    if compact or budget is not None:
+        l_H = compact_panel(l_H, budget, num_threads=num_threads)
+    if stride is not None:
+        # coarse to fine runs, the fraction of the SNPs solved again at
+        # full resolution is given by loter_local_ancestry_coarse
+        res_tmp = loter_local_ancestry_coarse(l_H, h_adm, range_lambda, nb_bagging,
+                                              stride, num_threads=num_threads,
+                                              seed=seed)[:2]
+    else:
+        # with `adaptive`, haplotypes get no more bootstrap samples once their
+        # ancestry is decided (see LocalAncestryEnsemble.run)
+        res_tmp = ensemble.LocalAncestryEnsemble().run(l_H, h_adm, range_lambda,
+                                                       nb_bagging, seed, num_threads,
+                                                       adaptive=adaptive,
+                                                       confidence=confidence)
 
     if default:
         if odd:
@@ -261,29 +580,64 @@ def find_lambda(s_in, threshold = 0.90, min_lambda = 1,
                                max_lambda = max_lambda  - ((max_lambda - min_lambda) / 2),
                                num_threads=num_threads)
 
-def vote_and_impute(s, percent_threshold=0.5):
-    def select_val(s, percent_threshold):
-        max_s, min_s = np.max(s[1]), np.min(s[1])
-        threshold = percent_threshold*(max_s - min_s) + min_s
-        select = np.logical_and(s[1][::2] >= threshold,
-                                s[1][1::2] >= threshold)
-        arr = encode_haplo(s[0])
-        arr[np.logical_not(select)] = 255
-        return arr
-
-    arr = select_val(s, percent_threshold)
+def fill_nearest(arr, missing=255, chunk_size=1 << 22):
+    """Replace the values `missing` of each row of `arr` by the nearest
+    other value of the row, the one on the right on ties (as pandas
+    reindex with method='nearest'). Rows without any value are kept.
 
+    The rows are processed by chunks of about `chunk_size` values.
+    """
     n, m = arr.shape
-    res = np.copy(arr)
+    res = np.array(arr)
+    cols = np.arange(m, dtype=np.int32)
+    step = max(1, chunk_size // max(m, 1))
+    for start in range(0, n, step):
+        block = res[start:start+step]
+        valid = block != missing
+        # index of the closest value on the left and on the right, -1 and
+        # m if there is none
+        left = np.where(valid, cols, -1)
+        np.maximum.accumulate(left, axis=1, out=left)
+        right = np.where(valid, cols, m)
+        np.minimum.accumulate(right[:, ::-1], axis=1, out=right[:, ::-1])
+        use_left = (left >= 0) & ((right == m) | (cols - left < right - cols))
+        nearest = np.where(use_left, left, right)
+        np.minimum(nearest, m - 1, out=nearest)
+        filled = np.take_along_axis(block, nearest, axis=1)
+        # rows without values give back missing values
+        block[...] = np.where(valid.any(axis=1, keepdims=True), filled, block)
+    return res
+
+def _vote_and_impute(s, percent_threshold=0.5):
+    """Same as `vote_and_impute`, in the smallest unsigned integers holding
+    the encoded ancestries and a missing value, the largest one (255 in
+    uint8), given back for the individuals without any ancestry kept.
+
+    output:
+    (arr, missing) -- the imputed ancestries and the missing value
+    """
+    ancestry, votes = s
+    max_s, min_s = np.max(votes), np.min(votes)
+    threshold = percent_threshold*(max_s - min_s) + min_s
+    select = np.minimum(votes[::2], votes[1::2]) >= threshold
+
+    arr = encode_haplo(ancestry)
+    dtype = np.uint8 if arr.size == 0 or arr.max() < 255 else np.uint16
+    arr = arr.astype(dtype)
+    missing = np.iinfo(dtype).max
+    arr[~select] = missing
 
-    for i in range(n):
-        serie = pd.Series(arr[i])
-        serie.loc[serie == 255] = np.nan
-        try:
-            res[i] = serie.dropna().reindex(range(m), method='nearest').values
-        except:
-            res[i] = arr[i]
+    return fill_nearest(arr, missing), missing
 
+def vote_and_impute(s, percent_threshold=0.5):
+    """Encoded ancestries of the pairs of haplotypes (see `encode_haplo`),
+    where the votes of both haplotypes are below `percent_threshold` of the
+    range of the votes replaced by the nearest ancestry kept on the SNPs.
+    Individuals without any ancestry kept are all NaN.
+    """
+    arr, missing = _vote_and_impute(s, percent_threshold)
+    res = arr.astype(np.float64)
+    res[arr == missing] = np.nan
     return res
 
 def loter_smooth(l_H, h_adm, range_lambda=np.arange(1.5, 5.5, 0.5),
@@ -295,12 +649,10 @@ def loter_smooth(l_H, h_adm, range_lambda=np.arange(1.5, 5.5, 0.5),
     res_impute, res_raw = loter_local_ancestry(l_H, h_adm, range_lambda,
                                                rate_vote, nb_bagging, num_threads,
                                                False)
-    result = np.copy(res_impute)
-    result_hap = []
-    for i in range(len(res_impute)):
-        arr_input = np.ascontiguousarray(np.array([res_impute[i]])).astype(np.uint8)
-        r, _, _ = find_lambda(arr_input, threshold=threshold, num_threads=num_threads)
-        result_hap.append(r)
-        result[i] = r[::2] + r[1::2]
-
-    return np.vstack(result_hap)
+    # same result as `find_lambda` on each individual, unknown ancestries
+    # are 255 for the phase correction
+    result_hap, _ = phase_correction.PhaseCorrection().run(np.nan_to_num(res_impute, nan=255),
+                                                          threshold,
+                                                          num_threads=num_threads)
+
+    return result_hap
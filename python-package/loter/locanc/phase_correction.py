@@ -0,0 +1,92 @@
+import ctypes as C
+import numpy as np
+
+import loter.errorhandler as errorhandler
+from loter.find_lib import _LIB
+
+@errorhandler.eh_fn
+def PhaseCorrectionErrorHandlerFn(error_message, user_data):
+    """Callback function for C api in errorhandler.c
+
+    """
+    print("Error Phase Correction")
+    print(error_message)
+
+def _init_phase_correction():
+
+    # Constructor
+    _LIB.phasecorrection_create.argtypes = [
+        C.POINTER(errorhandler.ErrorHandler)
+    ]
+    _LIB.phasecorrection_create.restype = C.c_void_p
+
+    # Destructor
+    _LIB.phasecorrection_destroy.argtypes = [
+        C.c_void_p,
+        C.POINTER(errorhandler.ErrorHandler)
+    ]
+    _LIB.phasecorrection_destroy.restype = None
+
+    _LIB.phasecorrection_run.argtypes = [
+        C.c_void_p,
+        np.ctypeslib.ndpointer(dtype = np.uint8,
+                               ndim=2,
+                               flags='C_CONTIGUOUS'),
+        np.ctypeslib.ndpointer(dtype = np.uint8,
+                               ndim=2,
+                               flags='C_CONTIGUOUS'),
+        np.ctypeslib.ndpointer(dtype = np.float64,
+                               ndim=1,
+                               flags='C_CONTIGUOUS'),
+        C.c_int,
+        C.c_int,
+        C.c_double,
+        C.c_double,
+        C.c_double,
+        C.c_int,
+        C.POINTER(errorhandler.ErrorHandler)
+    ]
+    _LIB.phasecorrection_run.restype = None
+
+class PhaseCorrection(object):
+
+    def __init__(self):
+        self._EH = errorhandler.ErrorHandler(PhaseCorrectionErrorHandlerFn, None)
+        self.obj = _LIB.phasecorrection_create(C.byref(self._EH))
+
+    def run(self, g_adm, threshold=0.90, min_lambda=1, max_lambda=500, num_threads=10):
+        """Phase the ancestries of every individual, with the penalty
+        chosen as in `find_lambda`, in a single native call.
+
+        input:
+        g_adm -- ancestry genotypes of the individuals (number of
+                 haplotypes from the population 1, 255 if unknown), shape (n, m)
+
+        output:
+        (S, lambdas) -- phased ancestries, shape (2n, m), and the penalty
+        found for each individual
+        """
+        G = np.ascontiguousarray(g_adm, dtype=np.uint8)
+        n, m = G.shape
+        S = np.zeros((2*n, m), dtype=np.uint8)
+        lambdas = np.zeros(n, dtype=np.float64)
+
+        _LIB.phasecorrection_run(self.obj,
+                                 G,
+                                 S,
+                                 lambdas,
+                                 n,
+                                 m,
+                                 threshold,
+                                 min_lambda,
+                                 max_lambda,
+                                 num_threads,
+                                 C.byref(self._EH))
+
+        return S, lambdas
+
+    def __del__(self):
+        _LIB.phasecorrection_destroy(self.obj, C.byref(self._EH))
+
+#initialize
+_init_phase_correction()
@@ -0,0 +1,147 @@
+import ctypes as C
+import numpy as np
+
+import loter.errorhandler as errorhandler
+from loter.find_lib import _LIB
+
+@errorhandler.eh_fn
+def SknnStreamErrorHandlerFn(error_message, user_data):
+    """Callback function for C api in errorhandler.c
+
+    """
+    print("Error Sknn Stream")
+    print(error_message)
+
+def _init_sknn_stream():
+
+    # Constructor
+    _LIB.sknnstream_create.argtypes = [
+        C.c_int,
+        C.c_int,
+        C.c_float,
+        C.c_int,
+        C.POINTER(errorhandler.ErrorHandler)
+    ]
+    _LIB.sknnstream_create.restype = C.c_void_p
+
+    # Destructor
+    _LIB.sknnstream_destroy.argtypes = [
+        C.c_void_p,
+        C.POINTER(errorhandler.ErrorHandler)
+    ]
+    _LIB.sknnstream_destroy.restype = None
+
+    _LIB.sknnstream_push.argtypes = [
+        C.c_void_p,
+        np.ctypeslib.ndpointer(dtype = np.uint8,
+                               ndim=2,
+                               flags='C_CONTIGUOUS'),
+        np.ctypeslib.ndpointer(dtype = np.uint8,
+                               ndim=2,
+                               flags='C_CONTIGUOUS'),
+        np.ctypeslib.ndpointer(dtype = np.float32,
+                               ndim=1,
+                               flags='C_CONTIGUOUS'),
+        C.c_int,
+        C.c_int,
+        C.c_int,
+        C.c_int,
+        C.POINTER(errorhandler.ErrorHandler)
+    ]
+    _LIB.sknnstream_push.restype = None
+
+    _LIB.sknnstream_finish.argtypes = [
+        C.c_void_p,
+        C.c_int,
+        C.POINTER(errorhandler.ErrorHandler)
+    ]
+    _LIB.sknnstream_finish.restype = None
+
+    _LIB.sknnstream_ready.argtypes = [
+        C.c_void_p,
+        C.POINTER(errorhandler.ErrorHandler)
+    ]
+    _LIB.sknnstream_ready.restype = C.c_int
+
+    _LIB.sknnstream_pop.argtypes = [
+        C.c_void_p,
+        np.ctypeslib.ndpointer(dtype = np.uint32,
+                               ndim=2,
+                               flags='C_CONTIGUOUS'),
+        C.c_int,
+        C.c_int,
+        C.POINTER(errorhandler.ErrorHandler)
+    ]
+    _LIB.sknnstream_pop.restype = None
+
+class SknnStream(object):
+    """Sknn paths of `n` haplotypes over `k` references whose SNPs are
+    given chunk by chunk, for instance while reading a VCF file.
+
+    The reference of a haplotype at a SNP is final, and returned by `push`,
+    once the paths ending at every reference of the last SNP go through
+    the same reference at this SNP, it is then the one of the path over the
+    whole stream (the same as `EstimateSknn` with the "compact" kernel).
+    With `lag` > 0, the SNPs more than `lag` SNPs behind the last one are
+    made final from the best path ending at the last SNP, so that the
+    memory does not depend on the number of SNPs.
+    """
+
+    def __init__(self, n, k, penalty, lag=0, num_threads=10):
+        self._EH = errorhandler.ErrorHandler(SknnStreamErrorHandlerFn, None)
+        self.n, self.k = n, k
+        self.num_threads = num_threads
+        self.obj = _LIB.sknnstream_create(n, k, penalty, lag, C.byref(self._EH))
+
+    def push(self, h_chunk, a_chunk, weights=None):
+        """Next SNPs of the haplotypes `h_chunk` (shape (n, c)) and of the
+        references `a_chunk` (shape (k, c)), return the references of the
+        SNPs that became final for all the haplotypes, shape (n, c')."""
+        c = h_chunk.shape[1]
+        if weights is None:
+            weights = np.ones(c, dtype=np.float32)
+        _LIB.sknnstream_push(self.obj,
+                             np.ascontiguousarray(np.asarray(h_chunk, dtype=np.uint8).T),
+                             np.ascontiguousarray(np.asarray(a_chunk, dtype=np.uint8).T),
+                             np.ascontiguousarray(weights, dtype=np.float32),
+                             self.n,
+                             self.k,
+                             c,
+                             self.num_threads,
+                             C.byref(self._EH))
+        return self._pop()
+
+    def finish(self):
+        """End of the stream, return the references of the remaining SNPs."""
+        _LIB.sknnstream_finish(self.obj, self.num_threads, C.byref(self._EH))
+        return self._pop()
+
+    def _pop(self):
+        c = _LIB.sknnstream_ready(self.obj, C.byref(self._EH))
+        S = np.zeros((self.n, c), dtype=np.uint32)
+        _LIB.sknnstream_pop(self.obj, S, self.n, c, C.byref(self._EH))
+        return S
+
+    def __del__(self):
+        _LIB.sknnstream_destroy(self.obj, C.byref(self._EH))
+
+def locanc_stream(chunks, sizes, penalty, lag=0, num_threads=10):
+    """Local ancestry of the admixed haplotypes of a stream of chunks
+    (h_chunk, a_chunk), with `a_chunk` the references of the populations
+    of sizes `sizes` stacked, yielding the ancestries of the SNPs as soon
+    as they are final (see SknnStream)."""
+    labels = np.repeat(np.arange(len(sizes)), sizes).astype(np.uint8)
+    stream = None
+    for h_chunk, a_chunk in chunks:
+        if stream is None:
+            stream = SknnStream(len(h_chunk), len(a_chunk), penalty, lag, num_threads)
+        S = stream.push(h_chunk, a_chunk)
+        if S.shape[1]:
+            yield labels[S]
+    if stream is not None:
+        S = stream.finish()
+        if S.shape[1]:
+            yield labels[S]
+
+#initialize
+_init_sknn_stream()
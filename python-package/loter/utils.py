@@ -22,4 +22,3 @@ def build_SA(S, A):
     x = np.arange(m)
     # x will be broadcast to the size of S
     return A[S, x]
-
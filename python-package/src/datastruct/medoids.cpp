@@ -0,0 +1,131 @@
+#include <stdint.h>
+#include <vector>
+#include <random>
+#include <limits>
+#include <stdexcept>
+
+#include "../omp.h"
+#include "medoids.hpp"
+
+static inline int hamming(const uint64_t* x, const uint64_t* y, int nwords) {
+  int d = 0;
+  for(int w = 0; w < nwords; ++w) {
+    d += __builtin_popcountll(x[w] ^ y[w]);
+  }
+  return d;
+}
+
+int hamming_medoids(Ref< Matrixu8Row> A, Ref< VectorXi> weights, int nb_iter,
+                    unsigned int seed, int num_threads, Ref< VectorXi> medoids,
+                    Ref< VectorXi> assignment, Ref< VectorXi> distance) {
+  int k = A.rows();
+  int m = A.cols();
+  int nb_max = medoids.size();
+  if(nb_max <= 0 || k <= 0) {
+    throw std::invalid_argument("The medoids need at least one row and one medoid");
+  }
+  int nwords = (m + 63) / 64;
+  std::vector<uint64_t> bits(static_cast<size_t>(k) * nwords, 0);
+  for(int r = 0; r < k; ++r) {
+    uint64_t* b = &bits[static_cast<size_t>(r) * nwords];
+    for(int j = 0; j < m; ++j) {
+      b[j >> 6] |= static_cast<uint64_t>(A(r, j) == 1) << (j & 63);
+    }
+  }
+  const uint64_t* B = &bits[0];
+  omp_set_num_threads(num_threads);
+
+  // k-means++ seeding, dist is the distance to the closest medoid so far
+  std::mt19937 rng(seed);
+  std::vector<int> dist(k, std::numeric_limits<int>::max());
+  std::vector<double> prob(k);
+  int nb = 0;
+  while(nb < nb_max) {
+    double total = 0.0;
+    for(int r = 0; r < k; ++r) {
+      double d = (nb == 0) ? 1.0 : static_cast<double>(dist[r]);
+      prob[r] = weights(r) * d * d;
+      total += prob[r];
+    }
+    if(total <= 0.0) {
+      break; // every row is a medoid or a copy of one
+    }
+    std::uniform_real_distribution<double> draw(0.0, total);
+    double x = draw(rng);
+    int c = 0;
+    while(c + 1 < k && (x >= prob[c] || prob[c] == 0.0)) {
+      x -= prob[c];
+      ++c;
+    }
+    while(prob[c] == 0.0) { // rounding past the last row that can be drawn
+      --c;
+    }
+    medoids(nb++) = c;
+    #pragma omp parallel for schedule(static)
+    for(int r = 0; r < k; ++r) {
+      int d = hamming(B + static_cast<size_t>(r) * nwords, B + static_cast<size_t>(c) * nwords, nwords);
+      dist[r] = (d < dist[r]) ? d : dist[r];
+    }
+  }
+
+  std::vector<std::vector<int> > members(nb);
+  for(int it = 0; ; ++it) {
+    // closest medoid of each row, the first one on ties
+    #pragma omp parallel for schedule(static)
+    for(int r = 0; r < k; ++r) {
+      int best = 0;
+      int d_best = std::numeric_limits<int>::max();
+      for(int c = 0; c < nb; ++c) {
+        int d = hamming(B + static_cast<size_t>(r) * nwords,
+                        B + static_cast<size_t>(medoids(c)) * nwords, nwords);
+        if(d < d_best) {
+          d_best = d;
+          best = c;
+        }
+      }
+      assignment(r) = best;
+      distance(r) = d_best;
+    }
+    if(it >= nb_iter) {
+      break;
+    }
+
+    for(int c = 0; c < nb; ++c) {
+      members[c].clear();
+    }
+    for(int r = 0; r < k; ++r) {
+      members[assignment(r)].push_back(r);
+    }
+    bool changed = false;
+    #pragma omp parallel for schedule(dynamic) reduction(||:changed)
+    for(int c = 0; c < nb; ++c) {
+      const std::vector<int>& mb = members[c];
+      // the current medoid is kept on ties
+      int best = medoids(c);
+      long best_cost = 0;
+      for(size_t y = 0; y < mb.size(); ++y) {
+        best_cost += static_cast<long>(weights(mb[y])) *
+          hamming(B + static_cast<size_t>(best) * nwords,
+                  B + static_cast<size_t>(mb[y]) * nwords, nwords);
+      }
+      for(size_t x = 0; x < mb.size(); ++x) {
+        long cost = 0;
+        for(size_t y = 0; y < mb.size() && cost < best_cost; ++y) {
+          cost += static_cast<long>(weights(mb[y])) *
+            hamming(B + static_cast<size_t>(mb[x]) * nwords,
+                    B + static_cast<size_t>(mb[y]) * nwords, nwords);
+        }
+        if(cost < best_cost) {
+          best_cost = cost;
+          best = mb[x];
+        }
+      }
+      changed = changed || (best != medoids(c));
+      medoids(c) = best;
+    }
+    if(!changed) {
+      break;
+    }
+  }
+  return nb;
+}
@@ -0,0 +1,32 @@
+#ifndef MEDOIDS_HPP
+#define MEDOIDS_HPP
+
+#include <stdint.h>
+
+#include "../Eigen/Core"
+#include "../utils/matrixtype.hpp"
+
+using namespace Eigen;
+
+/*
+ * Weighted k-medoids of the rows of A (k x m) for the Hamming distance,
+ * computed on the rows packed as bits (a value of 1 is the bit 1, any
+ * other value the bit 0). Row r stands for weights(r) references.
+ *
+ * The medoids are seeded as k-means++ (a row is drawn with probability
+ * proportional to its weight times its squared distance to the closest
+ * medoid, from `seed`), then each row is assigned to its closest medoid
+ * and the medoid of each cluster is replaced by the member with the least
+ * weighted sum of distances to the others, at most `nb_iter` times or
+ * until the medoids do not change.
+ *
+ * `medoids` receives the rows of the medoids, `assignment` the medoid
+ * (index in `medoids`) of each row and `distance` its distance to it.
+ * Return the number of medoids, less than medoids.size() when fewer rows
+ * are distinct.
+ */
+int hamming_medoids(Ref< Matrixu8Row> A, Ref< VectorXi> weights, int nb_iter,
+                    unsigned int seed, int num_threads, Ref< VectorXi> medoids,
+                    Ref< VectorXi> assignment, Ref< VectorXi> distance);
+
+#endif
@@ -0,0 +1,39 @@
+#include <stdexcept>
+
+#include "panel.hpp"
+#include "../utils/tostring.hpp"
+#include "../graph/sknn_bitparallel.hpp"
+
+ReferencePanel::ReferencePanel(const uint8_t* A, const uint8_t* labels, int k, int m, int nb_pops) {
+  // A is given row-major (one row per reference)
+  this->A = Map<const Matrix<uint8_t, Dynamic, Dynamic, RowMajor> >(A, k, m);
+  this->labels.assign(labels, labels + k);
+  this->nb_pops = nb_pops;
+  if(!sknn_pack_binary(this->A, this->A_packed)) {
+    this->A_packed.resize(0, 0);
+  }
+}
+
+void ReferencePanel::check_snps(int m) const {
+  if(m != this->nbsnp()) {
+    throw std::invalid_argument("The haplotypes have " + patch::to_string(m) +
+                                " SNPs and the reference panel " +
+                                patch::to_string(this->nbsnp()));
+  }
+}
+
+void ReferencePanel::subset(const VectorXi& rows, Matrixu8Col& A_sub,
+                            std::vector<uint8_t>& labels_sub) const {
+  int k = rows.size();
+  int m = this->nbsnp();
+  A_sub.resize(k, m);
+  labels_sub.resize(k);
+  for(int l = 0; l < k; ++l) {
+    labels_sub[l] = this->labels[rows(l)];
+  }
+  for(int j = 0; j < m; ++j) {
+    for(int l = 0; l < k; ++l) {
+      A_sub(l, j) = this->A(rows(l), j);
+    }
+  }
+}
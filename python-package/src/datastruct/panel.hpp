@@ -0,0 +1,44 @@
+#ifndef PANEL_HPP
+#define PANEL_HPP
+
+#include <stdint.h>
+#include <vector>
+
+#include "../Eigen/Core"
+#include "../utils/matrixtype.hpp"
+#include "../utils/bitmatrix.hpp"
+
+using namespace Eigen;
+
+/*
+ * Reference haplotypes of all the populations, stacked population after
+ * population, in the layouts of the Sknn kernels: column-major (one
+ * reference column per SNP) and packed as bits when the panel is binary.
+ */
+class ReferencePanel {
+public:
+  ReferencePanel(const uint8_t* A, const uint8_t* labels, int k, int m, int nb_pops);
+
+  int nbref() const { return this->A.rows(); }
+  int nbsnp() const { return this->A.cols(); }
+  bool is_binary() const { return this->A_packed.rows() == this->A.rows(); }
+
+  // Throw std::invalid_argument if the haplotypes given with the panel do
+  // not have its m SNPs.
+  void check_snps(int m) const;
+
+  // Copy the references rows(0), rows(1), ... and their populations.
+  void subset(const VectorXi& rows, Matrixu8Col& A_sub, std::vector<uint8_t>& labels_sub) const;
+
+  Matrixu8Col A;       // k x m reference haplotypes
+  BitMatrix A_packed;  // A packed as bits, 0 x 0 if A is not binary
+  std::vector<uint8_t> labels; // population of each reference
+  int nb_pops;
+  // When the duplicated references were removed, row of A of each
+  // reference before (stacked by population), so that the bootstrap
+  // samples draw the references with their multiplicities. Empty
+  // otherwise.
+  std::vector<int> draw_rows;
+};
+
+#endif
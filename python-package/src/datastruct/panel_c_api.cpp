@@ -0,0 +1,136 @@
+#include <exception>
+#include <stdexcept>
+
+#include "panel.hpp"
+#include "medoids.hpp"
+
+#include "panel_c_api.h"
+#include "../errorhandler/errorhandler.h"
+
+HReferencePanelPtr referencepanel_create(uint8_t* A,
+                                         uint8_t* labels,
+                                         int k,
+                                         int m,
+                                         int nb_pops,
+                                         ErrorHandler* eh) {
+  try {
+    ReferencePanel* panel = new ReferencePanel(A, labels, k, m, nb_pops);
+    return reinterpret_cast<HReferencePanelPtr>(panel);
+  } catch (std::exception const& e) {
+    if(!eh) {
+      basic_eh(e.what(), NULL);
+      return NULL;
+    } else {
+      eh->eh(e.what(), eh->user_data);
+      return NULL;
+    }
+  }
+}
+
+void referencepanel_destroy(HReferencePanelPtr p,
+                            ErrorHandler* eh) {
+  try {
+    delete reinterpret_cast<ReferencePanel*>(p);
+  } catch (std::exception const& e) {
+    if(!eh) {
+      basic_eh(e.what(), NULL);
+      return;
+    } else {
+      eh->eh(e.what(), eh->user_data);
+      return;
+    }
+  }
+}
+
+int referencepanel_is_binary(HReferencePanelPtr p,
+                             ErrorHandler* eh) {
+  try {
+    return reinterpret_cast<ReferencePanel*>(p)->is_binary();
+  } catch (std::exception const& e) {
+    if(!eh) {
+      basic_eh(e.what(), NULL);
+      return 0;
+    } else {
+      eh->eh(e.what(), eh->user_data);
+      return 0;
+    }
+  }
+}
+
+void referencepanel_rows(HReferencePanelPtr p,
+                         int start,
+                         int nb_rows,
+                         uint8_t* out,
+                         ErrorHandler* eh) {
+  try {
+    ReferencePanel* panel = reinterpret_cast<ReferencePanel*>(p);
+    if(start < 0 || nb_rows < 0 || start + nb_rows > panel->nbref()) {
+      throw std::out_of_range("Row of the reference panel out of range");
+    }
+    MapMatrixu8Row out_mat(out, nb_rows, panel->nbsnp());
+    out_mat = panel->A.middleRows(start, nb_rows);
+  } catch (std::exception const& e) {
+    if(!eh) {
+      basic_eh(e.what(), NULL);
+      return;
+    } else {
+      eh->eh(e.what(), eh->user_data);
+      return;
+    }
+  }
+}
+
+void referencepanel_set_draw_rows(HReferencePanelPtr p,
+                                  int* rows,
+                                  int nb_rows,
+                                  ErrorHandler* eh) {
+  try {
+    ReferencePanel* panel = reinterpret_cast<ReferencePanel*>(p);
+    for(int r = 0; r < nb_rows; ++r) {
+      if(rows[r] < 0 || rows[r] >= panel->nbref()) {
+        throw std::out_of_range("Row of the reference panel out of range");
+      }
+    }
+    panel->draw_rows.assign(rows, rows + nb_rows);
+  } catch (std::exception const& e) {
+    if(!eh) {
+      basic_eh(e.what(), NULL);
+      return;
+    } else {
+      eh->eh(e.what(), eh->user_data);
+      return;
+    }
+  }
+}
+
+int referencepanel_medoids(uint8_t* A,
+                           int* weights,
+                           int k,
+                           int m,
+                           int nb_medoids,
+                           int nb_iter,
+                           unsigned int seed,
+                           int num_threads,
+                           int* medoids,
+                           int* assignment,
+                           int* distance,
+                           ErrorHandler* eh) {
+  try {
+    MapMatrixu8Row A_mat(A, k, m);
+    Map< VectorXi> weights_vec(weights, k);
+    Map< VectorXi> medoids_vec(medoids, nb_medoids);
+    Map< VectorXi> assignment_vec(assignment, k);
+    Map< VectorXi> distance_vec(distance, k);
+
+    return hamming_medoids(A_mat, weights_vec, nb_iter, seed, num_threads,
+                           medoids_vec, assignment_vec, distance_vec);
+  } catch (std::exception const& e) {
+    if(!eh) {
+      basic_eh(e.what(), NULL);
+      return 0;
+    } else {
+      eh->eh(e.what(), eh->user_data);
+      return 0;
+    }
+  }
+}
@@ -0,0 +1,54 @@
+#ifndef PANEL_C_API_H
+#define PANEL_C_API_H
+
+#include <stdint.h>
+
+#include "../errorhandler/errorhandler.h"
+
+struct HReferencePanel;
+typedef struct HReferencePanel* HReferencePanelPtr;
+
+#ifdef __cplusplus
+extern "C" {
+#endif
+  HReferencePanelPtr referencepanel_create(uint8_t* A,
+                                           uint8_t* labels,
+                                           int k,
+                                           int m,
+                                           int nb_pops,
+                                           ErrorHandler* eh);
+
+  void referencepanel_destroy(HReferencePanelPtr p,
+                              ErrorHandler* eh);
+
+  int referencepanel_is_binary(HReferencePanelPtr p,
+                               ErrorHandler* eh);
+
+  void referencepanel_rows(HReferencePanelPtr p,
+                           int start,
+                           int nb_rows,
+                           uint8_t* out,
+                           ErrorHandler* eh);
+
+  void referencepanel_set_draw_rows(HReferencePanelPtr p,
+                                    int* rows,
+                                    int nb_rows,
+                                    ErrorHandler* eh);
+
+  int referencepanel_medoids(uint8_t* A,
+                             int* weights,
+                             int k,
+                             int m,
+                             int nb_medoids,
+                             int nb_iter,
+                             unsigned int seed,
+                             int num_threads,
+                             int* medoids,
+                             int* assignment,
+                             int* distance,
+                             ErrorHandler* eh);
+#ifdef __cplusplus
+}
+#endif
+
+#endif
@@ -0,0 +1,132 @@
+#include <stdint.h>
+#include <vector>
+#include <algorithm>
+#include <random>
+
+#include "pbwt.hpp"
+
+// Add to `cands` the `nb` references (indices < k) with the longest matches
+// ending at the current SNP with the sequence at position `pos` of the
+// order `a`, d being the divergences of a.
+static void pbwt_neighbours(const std::vector<int>& a, const std::vector<int>& d,
+                            int pos, int k, int nb, std::vector<int>& cands) {
+  int N = a.size();
+  int up = pos - 1, down = pos + 1;
+  // start of the matches with a[up] and a[down]
+  int start_up = d[pos];
+  int start_down = (down < N) ? d[down] : 0;
+  int found = 0;
+  while(found < nb && (up >= 0 || down < N)) {
+    bool take_up = (up >= 0) && (down >= N || start_up <= start_down);
+    if(take_up) {
+      if(a[up] < k) {
+        cands.push_back(a[up]);
+        ++found;
+      }
+      start_up = std::max(start_up, d[up]);
+      --up;
+    } else {
+      if(a[down] < k) {
+        cands.push_back(a[down]);
+        ++found;
+      }
+      ++down;
+      if(down < N) {
+        start_down = std::max(start_down, d[down]);
+      }
+    }
+  }
+}
+
+void pbwt_candidates(Ref< Matrixu8Col> A, Ref< Matrixu8Col> H,
+                     int window, int nb_checkpoints, int nb_neighbours, int nb_random,
+                     unsigned int seed, int first_row, Ref< MatrixiCol> candidates) {
+  int k = A.rows();
+  int n = H.rows();
+  int m = A.cols();
+  int N = k + n;
+  int nb_windows = (m + window - 1) / window;
+  int nb_max = candidates.rows();
+
+  // sequences 0 to k-1 are the references, k to k+n-1 the haplotypes.
+  // a is sorted by reversed prefixes, d[x] is the first SNP of the match
+  // between a[x] and a[x-1] (Durbin, 2014)
+  std::vector<int> a(N), d(N, 0), a0(N), d0(N), a1(N), d1(N), pos(n);
+  for(int s = 0; s < N; ++s) {
+    a[s] = s;
+  }
+  std::vector<std::vector<int> > cands(n);
+
+  for(int w = 0; w < nb_windows; ++w) {
+    int start = w * window;
+    int len = std::min(m, start + window) - start;
+    for(int i = 0; i < n; ++i) {
+      cands[i].clear();
+    }
+
+    for(int j = start; j < start + len; ++j) {
+      int u = 0, v = 0, p = j + 1, q = j + 1;
+      for(int x = 0; x < N; ++x) {
+        int s = a[x];
+        p = std::max(p, d[x]);
+        q = std::max(q, d[x]);
+        uint8_t allele = (s < k) ? A(s, j) : H(s - k, j);
+        if(allele == 1) {
+          a1[v] = s;
+          d1[v] = q;
+          ++v;
+          q = 0;
+        } else {
+          a0[u] = s;
+          d0[u] = p;
+          ++u;
+          p = 0;
+        }
+      }
+      std::copy(a0.begin(), a0.begin() + u, a.begin());
+      std::copy(a1.begin(), a1.begin() + v, a.begin() + u);
+      std::copy(d0.begin(), d0.begin() + u, d.begin());
+      std::copy(d1.begin(), d1.begin() + v, d.begin() + u);
+
+      // last SNP of each of the nb_checkpoints parts of the window
+      if(((j - start + 1) * nb_checkpoints) / len != ((j - start) * nb_checkpoints) / len) {
+        for(int x = 0; x < N; ++x) {
+          if(a[x] >= k) {
+            pos[a[x] - k] = x;
+          }
+        }
+        for(int i = 0; i < n; ++i) {
+          pbwt_neighbours(a, d, pos[i], k, nb_neighbours, cands[i]);
+        }
+      }
+    }
+
+    for(int i = 0; i < n; ++i) {
+      std::vector<int>& c = cands[i];
+      std::sort(c.begin(), c.end());
+      c.erase(std::unique(c.begin(), c.end()), c.end());
+      if(static_cast<int>(c.size()) + nb_random > nb_max) {
+        c.resize(nb_max - nb_random);
+      }
+      if(nb_random > 0) {
+        std::seed_seq seq = {seed, static_cast<unsigned int>(first_row + i),
+                                static_cast<unsigned int>(w)};
+        std::mt19937 rng(seq);
+        std::uniform_int_distribution<int> draw(0, k - 1);
+        int nb_drawn = std::min(nb_random, k - static_cast<int>(c.size()));
+        for(int t = 0; t < nb_drawn; ) {
+          int r = draw(rng);
+          if(std::find(c.begin(), c.end(), r) == c.end()) {
+            c.push_back(r);
+            ++t;
+          }
+        }
+        std::sort(c.begin(), c.end());
+      }
+      int col = i * nb_windows + w;
+      for(int t = 0; t < nb_max; ++t) {
+        candidates(t, col) = (t < static_cast<int>(c.size())) ? c[t] : -1;
+      }
+    }
+  }
+}
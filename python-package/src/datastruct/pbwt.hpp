@@ -0,0 +1,35 @@
+#ifndef PBWT_HPP
+#define PBWT_HPP
+
+#include <stdint.h>
+
+#include "../Eigen/Core"
+#include "../utils/matrixtype.hpp"
+
+using namespace Eigen;
+
+/*
+ * Candidate references of the haplotypes H (n x m) for each window of
+ * `window` SNPs, from the positional Burrows-Wheeler transform of the
+ * binary references A (k x m) and of the haplotypes together: at the last
+ * SNP of each of the `nb_checkpoints` parts of a window, the
+ * `nb_neighbours` references next to a haplotype in the order of the
+ * reversed prefixes are the ones with the longest matches ending at this
+ * SNP. `nb_random` references drawn at random are added.
+ *
+ * Column i * nb_windows + w of `candidates` receives the distinct
+ * candidates of haplotype i for window w in increasing order, -1 after the
+ * last one, so it needs nb_checkpoints * nb_neighbours + nb_random rows.
+ * Missing values of H (> 1) are matched as 0. The transform keeps
+ * O(k + n) values and its cost is O((k + n) m), shared by all the
+ * haplotypes.
+ *
+ * The candidates of a haplotype do not depend on the other haplotypes,
+ * so H can be a block of rows of a larger matrix starting at row
+ * `first_row`, which seeds the random candidates.
+ */
+void pbwt_candidates(Ref< Matrixu8Col> A, Ref< Matrixu8Col> H,
+                     int window, int nb_checkpoints, int nb_neighbours, int nb_random,
+                     unsigned int seed, int first_row, Ref< MatrixiCol> candidates);
+
+#endif
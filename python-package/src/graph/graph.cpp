@@ -1,12 +1,22 @@
 #include <stdint.h>
 #include <vector>
 #include <algorithm>
+#include <cmath>
+#include <stdexcept>
 
 #include "../omp.h"
 #include "graph.hpp"
+#include "sknn_kernel.hpp"
+#include "sknn_bitparallel.hpp"
+#include "sknn_integer.hpp"
+#include "sknn_engines.hpp"
+#include "shknn_kernel.hpp"
+#include "../utils/bitmatrix.hpp"
 #include "../utils/matrixtype.hpp"
 #include "../datastruct/parameter_opti.hpp"
+#include "../datastruct/pbwt.hpp"
 #include "../utils/missingdata.hpp"
+#include "../utils/uniquerows.hpp"
 #include <iostream>
 
 #define NORM(X) ((X) * (X))
@@ -112,20 +122,124 @@ void EstimateS::Run(Ref< Matrixu8Row> G, Ref< Matrixu8Row> H, Ref< MatrixfRow> A
 }
 
 void EstimateSknn::Run(Ref< Matrixu8Col> H, Ref< Matrixu8Col> A, Ref< Matrixu32Row> S,
-                       ParameterOptimization &p, Ref< VectorXf> weights, int num_threads) const {
+                       ParameterOptimization &p, Ref< VectorXf> weights, int num_threads,
+                       int kernel, float tolerance, int block_size) const {
+  VectorXf penalties = VectorXf::Constant(1, p.penalty);
+  this->RunMultiPenalty(H, A, S, penalties, weights, num_threads,
+                        kernel, tolerance, block_size);
+}
+
+void EstimateSknn::RunMultiPenalty(Ref< Matrixu8Col> H, Ref< Matrixu8Col> A, Ref< Matrixu32Row> S,
+                                   Ref< VectorXf> penalties, Ref< VectorXf> weights,
+                                   int num_threads, int kernel, float tolerance,
+                                   int block_size, const BitMatrix* A_packed) const {
   int n = H.rows();
 
-  float penalty = p.penalty;
-  VectorXf differentiate(H.cols());
+  SknnEngines engines;
+  this->init_engines(engines, A, penalties, weights, kernel, tolerance, A_packed);
+
+  // haplotypes are processed by blocks of `block_size` advancing together,
+  // for all the penalties, through each reference column, which stays in
+  // cache for the block
+  block_size = std::max(1, block_size);
+  int nb_blocks = (n + block_size - 1) / block_size;
 
   omp_set_num_threads(num_threads);
-  #pragma omp parallel for
-  for(int i = 0; i < n; ++i) {
+  #pragma omp parallel for schedule(dynamic)
+  for(int b = 0; b < nb_blocks; ++b) {
+    int i_start = b * block_size;
+    int i_end = std::min(n, i_start + block_size);
+    this->s_cost_engines(H, A, S, penalties, weights, engines, i_start, i_end);
+  }
+}
+
+void EstimateSknn::init_engines(SknnEngines& engines, Ref< Matrixu8Col> A,
+                                Ref< VectorXf> penalties, Ref< VectorXf> weights,
+                                int kernel, float tolerance, const BitMatrix* A_packed) const {
+  int nb_penalties = penalties.size();
+
+  // the same kernel is used for every penalty. The bit-parallel kernel
+  // needs unit weights, binary references and penalties that are
+  // multiples of 1/16
+  std::vector<int> scale(nb_penalties), penalty_scaled(nb_penalties), nb_planes(nb_penalties);
+  if(kernel == SKNN_KERNEL_AUTO || kernel == SKNN_KERNEL_BITPARALLEL) {
+    bool scalable = true;
+    for(int p = 0; p < nb_penalties && scalable; ++p) {
+      scalable = sknn_bitparallel_scale(penalties(p), scale[p], penalty_scaled[p], nb_planes[p]);
+    }
+    bool unit_weights = (weights.array() == 1.0f).all();
+    if(scalable && unit_weights && !A_packed &&
+       sknn_pack_binary(A, engines.A_packed)) {
+      A_packed = &engines.A_packed;
+    }
+    if(scalable && unit_weights &&
+       A_packed && A_packed->rows() == A.rows()) {
+      kernel = SKNN_KERNEL_BITPARALLEL;
+    } else {
+      kernel = (kernel == SKNN_KERNEL_AUTO) ? SKNN_KERNEL_INTEGER : SKNN_KERNEL_COMPACT;
+    }
+  }
 
-    this->s_cost_i(H, A, S,
-                   i,
-                   weights,
-                   penalty);
+  // the integer kernel falls back to the float compact kernel when the
+  // quantisation error of a penalty or the weights exceeds `tolerance`
+  engines.quant.resize(nb_penalties);
+  engines.max_cost = 0;
+  for(int p = 0; p < nb_penalties && kernel == SKNN_KERNEL_INTEGER; ++p) {
+    if(sknn_quantize(penalties(p), weights, tolerance, engines.quant[p])) {
+      engines.max_cost = std::max(engines.max_cost, engines.quant[p].max_cost);
+    } else {
+      kernel = SKNN_KERNEL_COMPACT;
+    }
+  }
+  engines.kernel = kernel;
+
+  for(int p = 0; p < nb_penalties; ++p) {
+    if(kernel == SKNN_KERNEL_BITPARALLEL) {
+      engines.bitplanes.push_back(SknnBitPlanes(*A_packed, scale[p], penalty_scaled[p],
+                                                nb_planes[p]));
+    } else if(kernel == SKNN_KERNEL_INTEGER && engines.max_cost <= 255) {
+      engines.intlanes8.push_back(SknnIntLanes<uint8_t>(A.data(), A.rows(), A.outerStride(),
+                                                        engines.quant[p]));
+    } else if(kernel == SKNN_KERNEL_INTEGER) {
+      engines.intlanes16.push_back(SknnIntLanes<uint16_t>(A.data(), A.rows(), A.outerStride(),
+                                                          engines.quant[p]));
+    } else {
+      engines.floatlanes.push_back(SknnFloatLanes(A.data(), A.rows(), A.outerStride(),
+                                                  weights.data(), penalties(p)));
+    }
+  }
+}
+
+void EstimateSknn::s_cost_engines(Ref< Matrixu8Col> H, Ref< Matrixu8Col> A, Ref< Matrixu32Row> S,
+                                  Ref< VectorXf> penalties, Ref< VectorXf> weights,
+                                  const SknnEngines& engines, int i_start, int i_end) const {
+  int n = H.rows();
+  int kernel = engines.kernel;
+
+  if(kernel == SKNN_KERNEL_FULL || kernel == SKNN_KERNEL_CHECKPOINT) {
+    for(int p = 0; p < penalties.size(); ++p) {
+      for(int i = i_start; i < i_end; ++i) {
+        if(kernel == SKNN_KERNEL_FULL) {
+          this->s_cost_i(H, A, S.middleRows(p * n, n),
+                         i,
+                         weights,
+                         penalties(p));
+        } else {
+          this->s_cost_i_checkpoint(H, A, S.middleRows(p * n, n),
+                                    i,
+                                    weights,
+                                    penalties(p));
+        }
+      }
+    }
+  } else if(kernel == SKNN_KERNEL_BITPARALLEL) {
+    this->s_cost_block(H, S, engines.bitplanes, i_start, i_end);
+  } else if(kernel == SKNN_KERNEL_INTEGER && engines.max_cost <= 255) {
+    this->s_cost_block(H, S, engines.intlanes8, i_start, i_end);
+  } else if(kernel == SKNN_KERNEL_INTEGER) {
+    this->s_cost_block(H, S, engines.intlanes16, i_start, i_end);
+  } else {
+    this->s_cost_block(H, S, engines.floatlanes, i_start, i_end);
   }
 }
 
@@ -170,249 +284,726 @@ void EstimateSknn::s_cost_i(Ref< Matrixu8Col> H, Ref< Matrixu8Col> A,
   }
 }
 
-inline int compact_k1k2(int k1, int k2, int k) {
-  return k1 * (k) + k2;
-}
+void EstimateSknn::RunSubset(Ref< Matrixu8Col> H, Ref< Matrixu8Col> A, Ref< VectorXi> rows,
+                             Ref< Matrixu32Row> S, Ref< VectorXf> penalties,
+                             Ref< VectorXf> weights, int num_threads, int kernel,
+                             float tolerance, int block_size) const {
+  int k = rows.size();
+  int m = A.cols();
+
+  if(k == A.rows() && (rows.array() == VectorXi::LinSpaced(k, 0, k-1).array()).all()) {
+    this->RunMultiPenalty(H, A, S, penalties, weights, num_threads,
+                          kernel, tolerance, block_size);
+    return;
+  }
 
-inline int get_k1(int k1k2, int k) {
-  return k1k2 / (k);
+  Matrixu8Col A_sub(k, m);
+  for(int j = 0; j < m; ++j) {
+    for(int l = 0; l < k; ++l) {
+      A_sub(l, j) = A(rows(l), j);
+    }
+  }
+
+  this->RunMultiPenalty(H, A_sub, S, penalties, weights, num_threads,
+                        kernel, tolerance, block_size);
+
+  for(int i = 0; i < S.rows(); ++i) {
+    for(int j = 0; j < m; ++j) {
+      S(i, j) = rows(S(i, j));
+    }
+  }
 }
 
-inline int get_k2(int k1k2, int k) {
-  return k1k2 % (k);
+void EstimateSknn::RunPanel(Ref< Matrixu8Col> H, ReferencePanel& panel, Ref< VectorXi> rows,
+                            Ref< Matrixu32Row> S, Ref< VectorXf> penalties,
+                            Ref< VectorXf> weights, int num_threads, int kernel,
+                            float tolerance, int block_size) const {
+  panel.check_snps(H.cols());
+  int k = rows.size();
+
+  if(k == panel.nbref() && (rows.array() == VectorXi::LinSpaced(k, 0, k-1).array()).all()) {
+    this->RunMultiPenalty(H, panel.A, S, penalties, weights, num_threads,
+                          kernel, tolerance, block_size, &panel.A_packed);
+  } else {
+    this->RunSubset(H, panel.A, rows, S, penalties, weights, num_threads,
+                    kernel, tolerance, block_size);
+  }
 }
 
-inline int other_ind(int k) {
-  if(k % 2 == 0) {
-    return k + 1;
+void EstimateSknn::RunPanelLabels(Ref< Matrixu8Col> H, ReferencePanel& panel, Ref< VectorXi> rows,
+                                  Ref< Matrixu8Row> L, Ref< VectorXf> penalties,
+                                  Ref< VectorXf> weights, int num_threads, int kernel,
+                                  float tolerance, int block_size) const {
+  panel.check_snps(H.cols());
+  int n = H.rows();
+  int m = H.cols();
+  int k = rows.size();
+  int nb_penalties = penalties.size();
+
+  Matrixu8Col A_sub;
+  Matrixu8Col* A_run = &panel.A;
+  std::vector<uint8_t> labels(panel.labels);
+  SknnEngines engines;
+  if(k == panel.nbref() && (rows.array() == VectorXi::LinSpaced(k, 0, k-1).array()).all()) {
+    this->init_engines(engines, panel.A, penalties, weights, kernel, tolerance,
+                       &panel.A_packed);
   } else {
-    return k - 1;
+    panel.subset(rows, A_sub, labels);
+    A_run = &A_sub;
+    this->init_engines(engines, A_sub, penalties, weights, kernel, tolerance, NULL);
+  }
+
+  block_size = std::max(1, block_size);
+  int nb_blocks = (n + block_size - 1) / block_size;
+
+  omp_set_num_threads(num_threads);
+  #pragma omp parallel
+  {
+    Matrixu32Row S(nb_penalties * block_size, m);
+
+    #pragma omp for schedule(dynamic)
+    for(int b = 0; b < nb_blocks; ++b) {
+      int i_start = b * block_size;
+      int nb = std::min(n, i_start + block_size) - i_start;
+      this->s_cost_engines(H.middleRows(i_start, nb), *A_run, S.topRows(nb_penalties * nb),
+                           penalties, weights, engines, 0, nb);
+
+      for(int t = 0; t < nb_penalties * nb; ++t) {
+        int row = (t / nb) * n + i_start + t % nb;
+        for(int j = 0; j < m; ++j) {
+          L(row, j) = labels[S(t, j)];
+        }
+      }
+    }
   }
 }
 
-int EstimateSH::s_cost_i(Ref< Matrixu8Row> G, Ref< Matrixu8Row> H, Ref< MatrixfRow> A,
-                         MatrixXf& graph_s_i_cost,
-                         MatrixiCol& graph_s_i_path,
-                         int i, int k, int m,
-                         float penalty) const {
+void EstimateSknn::RunPanelMargins(Ref< Matrixu8Col> H, ReferencePanel& panel,
+                                   Ref< Matrixu8Row> L, Ref< MatrixfRow> margins,
+                                   float penalty, Ref< VectorXf> weights, int num_threads,
+                                   int kernel) const {
+  panel.check_snps(H.cols());
+  int n = H.rows();
+  int k = panel.nbref();
+  VectorXi rows = VectorXi::LinSpaced(k, 0, k-1);
+  VectorXf penalties = VectorXf::Constant(1, penalty);
+  this->RunPanelLabels(H, panel, rows, L, penalties, weights, num_threads, kernel);
 
-  VectorXf min_k_1 = VectorXf::Constant(k, std::numeric_limits<float>::max());
-  VectorXi argmin_k_1 = VectorXi::Zero(k);
+  omp_set_num_threads(num_threads);
+  #pragma omp parallel
+  {
+    std::vector<float> forward, backward, checkpoints;
+
+    #pragma omp for schedule(dynamic)
+    for(int i = 0; i < n; ++i) {
+      this->margins_i(H, panel, L, margins, i, penalty, weights,
+                      forward, backward, checkpoints);
+    }
+  }
+}
+
+void EstimateSknn::RunPanelWindows(Ref< Matrixu8Col> H, ReferencePanel& panel,
+                                   Ref< Matrixu32Row> S, Ref< Matrixu8Row> failed,
+                                   Ref< VectorXi> nb_unique, float penalty, Ref< VectorXf> weights, int window,
+                                   int overlap, int num_threads, int kernel) const {
+  panel.check_snps(H.cols());
+  int n = H.rows();
+  int m = H.cols();
+  int step = window - overlap;
+  if(overlap < 0 || step <= 0) {
+    throw std::invalid_argument("The overlap of the windows must be between 0 and the window size");
+  }
+  int nb_windows = sknn_nb_windows(m, window, overlap);
+
+  // the windows only share the references, the traceback of each of them
+  // needs k * window bits per haplotype instead of k * m. Row group[w][i]
+  // of S_windows[w] is the path of haplotype i in window w
+  VectorXf penalties = VectorXf::Constant(1, penalty);
+  std::vector<Matrixu32Row> S_windows(nb_windows);
+  std::vector<std::vector<int> > group(nb_windows);
+  omp_set_num_threads(num_threads);
+  #pragma omp parallel for schedule(dynamic)
+  for(int w = 0; w < nb_windows; ++w) {
+    int start = w * step;
+    int len = std::min(m, start + window) - start;
+    VectorXf weights_w = weights.segment(start, len);
+    std::vector<int> first;
+    int nb = unique_rows(H.middleCols(start, len), first, group[w]);
+    nb_unique(w) = nb;
+    S_windows[w].resize(nb, len);
+    if(nb == n) {
+      this->RunMultiPenalty(H.middleCols(start, len), panel.A.middleCols(start, len),
+                            S_windows[w], penalties, weights_w, 1, kernel);
+    } else {
+      Matrixu8Col H_unique(nb, len);
+      for(int g = 0; g < nb; ++g) {
+        H_unique.row(g) = H.block(first[g], start, 1, len);
+      }
+      this->RunMultiPenalty(H_unique, panel.A.middleCols(start, len),
+                            S_windows[w], penalties, weights_w, 1, kernel);
+    }
+  }
 
-  VectorXf min_k_2 = VectorXf::Constant(k, std::numeric_limits<float>::max());
-  VectorXi argmin_k_2 = VectorXi::Zero(k);
+  #pragma omp parallel for schedule(static)
+  for(int i = 0; i < n; ++i) {
+    int from = 0;
+    for(int w = 0; w < nb_windows; ++w) {
+      int start = w * step;
+      int to = m;
+      if(w + 1 < nb_windows) {
+        // overlap of windows w and w+1: [start + step, start + window)
+        int o_start = start + step;
+        int o_end = std::min(m, start + window);
+        int middle = (o_start + o_end) / 2;
+        int seam = -1;
+        for(int d = 0; d < o_end - o_start && seam < 0; ++d) {
+          for(int j = middle - d; j <= middle + d; j += std::max(1, 2 * d)) {
+            if(j >= o_start && j < o_end &&
+               S_windows[w](group[w][i], j - start) ==
+               S_windows[w + 1](group[w + 1][i], j - o_start)) {
+              seam = j;
+              break;
+            }
+          }
+        }
+        failed(i, w) = (seam < 0);
+        to = (seam < 0) ? middle : seam;
+      }
+      for(int j = from; j < to; ++j) {
+        S(i, j) = S_windows[w](group[w][i], j - start);
+      }
+      from = to;
+    }
+  }
+}
 
-  float min_both_hap = std::numeric_limits<float>::max();
-  int argmin_both_hap = 0;
-  float cost_k1_k2 = 0;
+void EstimateSknn::RunPanelRefine(Ref< Matrixu8Col> H, ReferencePanel& panel,
+                                  Ref< Matrixu32Row> S, Ref< MatrixiCol> windows,
+                                  float penalty, Ref< VectorXf> weights,
+                                  int num_threads) const {
+  panel.check_snps(H.cols());
+  int m = H.cols();
+  int k = panel.nbref();
+  int nb_windows = windows.cols();
+  const uint8_t* A = panel.A.data();
 
-  for(int k1 = 0; k1 < k; ++k1) {
-    for(int k2 = 0; k2 < k; ++k2) {
+  omp_set_num_threads(num_threads);
+  #pragma omp parallel
+  {
+    std::vector<uint32_t> cands;
+    std::vector<uint8_t> a_col;
+    std::vector<float> cost;
+    std::vector<uint64_t> jump;
+    std::vector<int> jump_to;
+
+    #pragma omp for schedule(dynamic)
+    for(int w = 0; w < nb_windows; ++w) {
+      int i = windows(0, w), start = windows(1, w), end = windows(2, w);
+      if(start >= end) {
+        continue;
+      }
 
-      // Case of Homozygous Site
-      int Hi1 = 0;
-      int Hi2 = 0;
-      if(G(i, 0) == 0 || G(i,0) == 2) {
-        Hi1 = G(i, 0) / 2;
-        Hi2 = G(i, 0) / 2;
-      } else {
-        if(A(k1, 0) >= A(k2, 0)) {
-          Hi1 = 1;
-          Hi2 = 0;
+      // the kept references are the first and the last candidates
+      cands.clear();
+      for(int j = std::max(0, start - 1); j <= std::min(m - 1, end); ++j) {
+        if(std::find(cands.begin(), cands.end(), S(i, j)) == cands.end()) {
+          cands.push_back(S(i, j));
+        }
+      }
+      int c = cands.size();
+      int nwords = (c + 63) / 64;
+      int kept_start = (start > 0) ? 0 : -1;
+      int kept_end = (end < m) ? std::find(cands.begin(), cands.end(), S(i, end)) - cands.begin() : -1;
+      a_col.resize(c);
+      cost.resize(c);
+      jump.assign(static_cast<size_t>(end - start) * nwords, 0);
+      jump_to.resize(end - start);
+
+      float mini = 0.0f;
+      int minIndex = 0;
+      for(int j = start; j < end; ++j) {
+        const uint8_t* a_j = A + static_cast<size_t>(j) * k;
+        for(int l = 0; l < c; ++l) {
+          a_col[l] = a_j[cands[l]];
+        }
+        uint8_t h = H(i, j);
+        if(j > start) {
+          jump_to[j - start] = minIndex;
+          sknn_next_col(&a_col[0], h, weights(j), penalty, c, &cost[0], mini, minIndex,
+                        &jump[static_cast<size_t>(j - start) * nwords]);
+        } else if(kept_start < 0) {
+          sknn_first_col(&a_col[0], h, c, &cost[0], mini, minIndex);
         } else {
-          Hi1 = 0;
-          Hi2 = 1;
+          // from the kept reference of SNP start - 1
+          float w_eff = (h > 1) ? 0.0f : weights(j);
+          for(int l = 0; l < c; ++l) {
+            cost[l] = ((l == kept_start) ? 0.0f : penalty) + ((a_col[l] != h) ? w_eff : 0.0f);
+          }
+          sknn_min_col(&cost[0], c, mini, minIndex);
+        }
+      }
+
+      // to the kept reference of SNP end
+      int state = minIndex;
+      if(kept_end >= 0) {
+        float best = cost[kept_end];
+        state = kept_end;
+        for(int l = 0; l < c; ++l) {
+          if(cost[l] + penalty < best) {
+            best = cost[l] + penalty;
+            state = l;
+          }
         }
       }
-      cost_k1_k2 =  NORM(Hi1 - A(k1, 0)) + NORM(Hi2 - A(k2, 0));
+      for(int j = end - 1; j >= start; --j) {
+        S(i, j) = cands[state];
+        if(j > start && sknn_jumped(&jump[static_cast<size_t>(j - start) * nwords], state)) {
+          state = jump_to[j - start];
+        }
+      }
+    }
+  }
+}
 
-      graph_s_i_cost(compact_k1k2(k1, k2, k), 0) = cost_k1_k2;
+void EstimateSknn::RunPanelPbwt(Ref< Matrixu8Col> H, ReferencePanel& panel,
+                                Ref< Matrixu32Row> S, float penalty, Ref< VectorXf> weights,
+                                int window, int nb_checkpoints, int nb_neighbours,
+                                int nb_random, unsigned int seed, int num_threads) const {
+  panel.check_snps(H.cols());
+  if(!panel.is_binary()) {
+    throw std::invalid_argument("The PBWT candidates need a binary reference panel");
+  }
+  if(window <= 0 || nb_checkpoints <= 0 || nb_neighbours < 0 || nb_random < 0 ||
+     nb_neighbours + nb_random == 0) {
+    throw std::invalid_argument("The window size and the number of candidates must be positive");
+  }
+  int n = H.rows();
+  int m = H.cols();
+  int nb_windows = (m + window - 1) / window;
+  int nb_max = nb_checkpoints * nb_neighbours + nb_random;
+
+  // The candidates of all the haplotypes would take nb_max * n * nb_windows
+  // ints, each thread builds the ones of a block of haplotypes at a time
+  // instead (the transform of the references is computed again for each
+  // block). The blocks keep at most about 2^24 candidates.
+  num_threads = std::max(1, num_threads);
+  long per_row = std::max(1L, static_cast<long>(nb_max) * nb_windows);
+  int block = static_cast<int>(std::min<long>((n + num_threads - 1) / num_threads,
+                                              std::max(1L, (1L << 24) / per_row)));
+  block = std::max(1, block);
+  int nb_blocks = (n + block - 1) / block;
 
-      // jump on k1
-      if(min_k_1(k2) >= cost_k1_k2) {
-        min_k_1(k2) = cost_k1_k2;
-        argmin_k_1(k2) = k1;
+  omp_set_num_threads(num_threads);
+  #pragma omp parallel
+  {
+    MatrixiCol candidates(nb_max, static_cast<size_t>(block) * nb_windows);
+
+    #pragma omp for schedule(dynamic)
+    for(int b = 0; b < nb_blocks; ++b) {
+      int i_start = b * block;
+      int nb = std::min(n, i_start + block) - i_start;
+      pbwt_candidates(panel.A, H.middleRows(i_start, nb), window, nb_checkpoints,
+                      nb_neighbours, nb_random, seed, i_start,
+                      candidates.leftCols(static_cast<size_t>(nb) * nb_windows));
+      for(int l = 0; l < nb; ++l) {
+        this->s_cost_candidates(H, panel, S,
+                                candidates.middleCols(static_cast<size_t>(l) * nb_windows,
+                                                      nb_windows),
+                                i_start + l, penalty, weights, window);
       }
+    }
+  }
+}
 
-      // jump on k2
-      if(min_k_2(k1) >= cost_k1_k2) {
-        min_k_2(k1) = cost_k1_k2;
-        argmin_k_2(k1) = k2;
+void EstimateSknn::s_cost_candidates(Ref< Matrixu8Col> H, const ReferencePanel& panel,
+                                     Ref< Matrixu32Row> S, Ref< MatrixiCol> candidates, int i,
+                                     float penalty, Ref< VectorXf> weights, int window) const {
+  int m = H.cols();
+  int k = panel.nbref();
+  int nb_max = candidates.rows();
+  int nwords = (nb_max + 63) / 64;
+  int nb_windows = (m + window - 1) / window;
+  const uint8_t* A = panel.A.data();
+  const float inf = std::numeric_limits<float>::infinity();
+
+  // candidates of window w: cand(w), ..., cand(w) + size(w) - 1, sorted
+  std::vector<int> size(nb_windows);
+  for(int w = 0; w < nb_windows; ++w) {
+    const int* c = &candidates(0, w);
+    size[w] = std::find(c, c + nb_max, -1) - c;
+  }
+  auto cand_of = [&](int w) { return &candidates(0, w); };
+
+  std::vector<float> cost(nb_max), cost_prev(nb_max);
+  std::vector<uint8_t> a_col(nb_max);
+  std::vector<uint64_t> jump(static_cast<size_t>(m) * nwords, 0);
+  std::vector<int> jump_to(m, 0);
+  float mini = 0.0f;
+  int minIndex = 0;
+
+  for(int w = 0; w < nb_windows; ++w) {
+    const int* cand = cand_of(w);
+    int c = size[w];
+    if(w > 0) {
+      // carry the costs of the candidates of the previous window
+      const int* prev = cand_of(w - 1);
+      int c_prev = size[w - 1];
+      std::copy(cost.begin(), cost.begin() + c_prev, cost_prev.begin());
+      for(int l = 0, t = 0; l < c; ++l) {
+        while(t < c_prev && prev[t] < cand[l]) {
+          ++t;
+        }
+        cost[l] = (t < c_prev && prev[t] == cand[l]) ? cost_prev[t] : inf;
       }
+    }
 
-      // 2 jumps
-      if(min_both_hap >= cost_k1_k2) {
-        min_both_hap = cost_k1_k2;
-        argmin_both_hap = compact_k1k2(k1, k2, k);
+    int start = w * window;
+    int end = std::min(m, start + window);
+    for(int j = start; j < end; ++j) {
+      const uint8_t* a_j = A + static_cast<size_t>(j) * k;
+      for(int l = 0; l < c; ++l) {
+        a_col[l] = a_j[cand[l]];
+      }
+      if(j == 0) {
+        sknn_first_col(&a_col[0], H(i, 0), c, &cost[0], mini, minIndex);
+      } else {
+        jump_to[j] = minIndex;
+        sknn_next_col(&a_col[0], H(i, j), weights(j), penalty, c, &cost[0], mini, minIndex,
+                      &jump[static_cast<size_t>(j) * nwords]);
+        if(j == start && H(i, j) > 1) {
+          // the argmin is an index among the candidates of the window
+          sknn_min_col(&cost[0], c, mini, minIndex);
+        }
       }
     }
   }
 
-  for(int j = 1; j < m; ++j) {
-    VectorXf new_min_k_1 = VectorXf::Constant(k, std::numeric_limits<float>::max());
-    VectorXi new_argmin_k_1 = VectorXi::Zero(k);
-
-    VectorXf new_min_k_2 = VectorXf::Constant(k, std::numeric_limits<float>::max());
-    VectorXi new_argmin_k_2 = VectorXi::Zero(k);
+  int state = minIndex;
+  for(int j = m - 1; j >= 0; --j) {
+    int w = j / window;
+    const int* cand = cand_of(w);
+    S(i, j) = cand[state];
+    if(j == 0) {
+      break;
+    }
+    if(sknn_jumped(&jump[static_cast<size_t>(j) * nwords], state)) {
+      state = jump_to[j];
+    } else if(j == w * window) {
+      const int* prev = cand_of(w - 1);
+      state = std::lower_bound(prev, prev + size[w - 1], cand[state]) - prev;
+    }
+  }
+}
 
-    float new_min_both_hap = std::numeric_limits<float>::max();
-    int new_argmin_both_hap = 0;
+void EstimateSknn::margins_i(Ref< Matrixu8Col> H, const ReferencePanel& panel,
+                             Ref< Matrixu8Row> L, Ref< MatrixfRow> margins, int i,
+                             float penalty, Ref< VectorXf> weights, std::vector<float>& forward,
+                             std::vector<float>& backward, std::vector<float>& checkpoints) const {
+
+  // forward(l) + backward(l) at SNP j is the cost of the best path going
+  // through reference l at SNP j. The SNPs are split in blocks of C, the
+  // backward costs of the last SNP of each block are kept by a first
+  // backward sweep and the ones of a block are recomputed from them
+  // before the forward pass goes through it.
+  int m = H.cols();
+  int k = panel.nbref();
+  int nb_pops = panel.nb_pops;
+  int C = std::max(1, static_cast<int>(std::ceil(std::sqrt(static_cast<double>(m)))));
+  int nb_blocks = (m + C - 1) / C;
+  const uint8_t* A = panel.A.data();
+  const float inf = std::numeric_limits<float>::infinity();
+
+  forward.resize(k);
+  backward.resize(static_cast<size_t>(C) * k);
+  checkpoints.resize(static_cast<size_t>(nb_blocks) * k);
+
+  float* b = &backward[0];
+  std::fill(b, b + k, 0.0f);
+  for(int j = m - 1; j >= 0; --j) {
+    if(j % C == C - 1 || j == m - 1) {
+      std::copy(b, b + k, &checkpoints[static_cast<size_t>(j / C) * k]);
+    }
+    if(j > 0) {
+      sknn_prev_col(A + static_cast<size_t>(j) * k, H(i, j), weights(j), penalty, k, b);
+    }
+  }
 
-    for(int k1 = 0; k1 < k; ++k1) {
-      for(int k2 = 0; k2 < k; ++k2) {
+  float* f = &forward[0];
+  float mini = 0.0f;
+  int minIndex = 0;
+  // the references are stacked population after population
+  std::vector<int> pop_start(nb_pops + 1, 0);
+  for(int l = 0; l < k; ++l) {
+    pop_start[panel.labels[l] + 1] = l + 1;
+  }
+  for(int p = 0; p < nb_pops; ++p) {
+    pop_start[p + 1] = std::max(pop_start[p + 1], pop_start[p]);
+  }
+  std::vector<float> pop_min(nb_pops), total(k);
+  for(int blk = 0; blk < nb_blocks; ++blk) {
+    int s = blk * C;
+    int e = std::min(m, s + C);
+    std::copy(&checkpoints[static_cast<size_t>(blk) * k],
+              &checkpoints[static_cast<size_t>(blk) * k] + k,
+              b + static_cast<size_t>(e - 1 - s) * k);
+    for(int j = e - 1; j > s; --j) {
+      float* b_prev = b + static_cast<size_t>(j - 1 - s) * k;
+      std::copy(b_prev + k, b_prev + 2 * k, b_prev);
+      sknn_prev_col(A + static_cast<size_t>(j) * k, H(i, j), weights(j), penalty, k, b_prev);
+    }
 
-        int Hi1 = 0;
-        int Hi2 = 0;
-        if(G(i, j) == 0 || G(i, j) == 2) {
-          Hi1 = G(i, j) / 2;
-          Hi2 = Hi1;
-        } else {
-          if(A(k1, j) >= A(k2, j)) {
-            Hi1 = 1;
-            Hi2 = 0;
-          } else {
-            Hi1 = 0;
-            Hi2 = 1;
-          }
-        }
+    for(int j = s; j < e; ++j) {
+      if(j == 0) {
+        sknn_first_col(A, H(i, 0), k, f, mini, minIndex);
+      } else {
+        sknn_next_col(A + static_cast<size_t>(j) * k, H(i, j), weights(j), penalty, k,
+                      f, mini, minIndex, NULL);
+      }
 
-        if(G(i, j) == NaN) {
-          graph_s_i_cost(compact_k1k2(k1, k2, k), j) = graph_s_i_cost(compact_k1k2(k1, k2, k), j - 1);
-          graph_s_i_path(compact_k1k2(k1, k2, k), j) = compact_k1k2(k1, k2, k);
-        } else {
-          float error = NORM(Hi1 - A(k1, j)) + NORM(Hi2 - A(k2, j));
-
-          std::vector<float> possibles_jump_cost(4);
-          std::vector<int> possibles_jump_k1(4);
-          std::vector<int> possibles_jump_k2(4);
-          // cost no jump
-          float cost_no_jump = graph_s_i_cost(compact_k1k2(k1, k2, k), j - 1);
-          possibles_jump_cost[0] = cost_no_jump;
-          possibles_jump_k1[0] = k1;
-          possibles_jump_k2[0] = k2;
-
-          // cost jump on k1
-          float min_k1 = min_k_1(k2);
-          int argmin_k1 = argmin_k_1(k2);
-          float cost_jump_k1 = penalty + min_k1;
-          possibles_jump_cost[1] = cost_jump_k1;
-          possibles_jump_k1[1] = argmin_k1;
-          possibles_jump_k2[1] = k2;
-
-          // cost jump on k2
-          float min_k2 = min_k_2(k1);
-          int argmin_k2 = argmin_k_2(k1);
-          float cost_jump_k2 = penalty + min_k2;
-          possibles_jump_cost[2] = cost_jump_k2;
-          possibles_jump_k1[2] = k1;
-          possibles_jump_k2[2] = argmin_k2;
-
-          // cost 2 jumps
-          float min_both = min_both_hap;
-          int argmin_both = argmin_both_hap;
-          float cost_jump_both = 2 * penalty + min_both;
-          possibles_jump_cost[3] = cost_jump_both;
-          possibles_jump_k1[3] = get_k1(argmin_both, k);
-          possibles_jump_k2[3] = get_k2(argmin_both, k);
-
-          int argmin = std::distance(possibles_jump_cost.begin(),
-                                     std::min_element(possibles_jump_cost.begin(),
-                                                      possibles_jump_cost.end()));
-
-          cost_k1_k2 = possibles_jump_cost[argmin] + error;
-          graph_s_i_cost(compact_k1k2(k1, k2, k), j) = cost_k1_k2;
-          graph_s_i_path(compact_k1k2(k1, k2, k), j) = compact_k1k2(possibles_jump_k1[argmin],
-                                                                    possibles_jump_k2[argmin],
-                                                                    k);
+      const float* b_j = b + static_cast<size_t>(j - s) * k;
+      for(int l = 0; l < k; ++l) {
+        total[l] = f[l] + b_j[l];
+      }
+      for(int p = 0; p < nb_pops; ++p) {
+        pop_min[p] = (pop_start[p] < pop_start[p + 1]) ?
+          sknn_min_value(&total[pop_start[p]], pop_start[p + 1] - pop_start[p]) : inf;
+      }
 
+      int p_best = L(i, j);
+      float other = inf;
+      for(int p = 0; p < nb_pops; ++p) {
+        if(p != p_best) {
+          other = std::min(other, pop_min[p]);
         }
+      }
+      margins(i, j) = std::max(0.0f, other - pop_min[p_best]);
+    }
+  }
+}
 
-        // jump on k1
-        if(new_min_k_1(k2) >= cost_k1_k2) {
-          new_min_k_1(k2) = cost_k1_k2;
-          new_argmin_k_1(k2) = k1;
-        }
+template <typename ENGINE>
+void EstimateSknn::s_cost_block(Ref< Matrixu8Col> H, Ref< Matrixu32Row> S,
+                                const std::vector<ENGINE>& engines, int i_start, int i_end) const {
+
+  // The back-pointer of reference l at SNP j is either l (stay) or the
+  // argmin of SNP j-1 (jump), so one bit per (reference, SNP) and one
+  // argmin per SNP are enough for the traceback.
+  // Task t = p * nb + q is haplotype i_start + q with the penalty of
+  // engines[p], the tasks of a group read the same reference column j in
+  // turn. A group holds as many tasks as tracebacks of k * m bits fit in
+  // SKNN_TRACEBACK_BITS (at least one), its tracebacks are reused by the
+  // next group.
+  int n = H.rows();
+  int nb = i_end - i_start;
+  int nb_tasks = nb * engines.size();
+  int k = engines[0].size();
+  int m = H.cols();
+  size_t task_bits = std::max<size_t>(1, static_cast<size_t>(k) * m);
+  int group = static_cast<int>(std::max<size_t>(1, std::min<size_t>(nb_tasks,
+                                                                     SKNN_TRACEBACK_BITS / task_bits)));
+  std::vector<ENGINE> tasks;
+  tasks.reserve(group);
+  std::vector<BitMatrix> jump(group, BitMatrix(k, m));
+  MatrixiCol jump_to(m, group);
+  VectorXi minIndex(group);
+
+  for(int t0 = 0; t0 < nb_tasks; t0 += group) {
+    int g = std::min(group, nb_tasks - t0);
+    tasks.clear();
+    for(int t = t0; t < t0 + g; ++t) {
+      tasks.push_back(engines[t / nb]);
+    }
 
-        // jump on k2
-        if(new_min_k_2(k1) >= cost_k1_k2) {
-          new_min_k_2(k1) = cost_k1_k2;
-          new_argmin_k_2(k1) = k2;
-        }
+    for(int t = 0; t < g; ++t) {
+      minIndex(t) = tasks[t].first_col(H(i_start + (t0 + t) % nb, 0));
+    }
 
-        // 2 jumps
-        if(new_min_both_hap >= cost_k1_k2) {
-          new_min_both_hap = cost_k1_k2;
-          new_argmin_both_hap = compact_k1k2(k1, k2, k);
-        }
+    for(int j = 1; j < m; ++j) {
+      for(int t = 0; t < g; ++t) {
+        jump_to(j, t) = minIndex(t);
+        tasks[t].next_col(j, H(i_start + (t0 + t) % nb, j), minIndex(t), jump[t].col(j));
       }
     }
-    argmin_k_1 = new_argmin_k_1;
-    min_k_1 = new_min_k_1;
-    argmin_k_2 = new_argmin_k_2;
-    min_k_2 = new_min_k_2;
-    argmin_both_hap = new_argmin_both_hap;
-    min_both_hap = new_min_both_hap;
 
+    for(int t = 0; t < g; ++t) {
+      int row = ((t0 + t) / nb) * n + i_start + (t0 + t) % nb;
+      int idx = minIndex(t);
+      for(int j = m-1; j >= 0; --j) {
+        S(row, j) = idx;
+        if(j > 0 && jump[t].get(idx, j)) {
+          idx = jump_to(j, t);
+        }
+      }
+    }
   }
-  return argmin_both_hap;
 }
 
-void EstimateSH::min_path_ind(int idx_min, Ref< Matrixu8Row> S,
-                              MatrixiCol& graph_s_i_path,
-                              int i, int m, int k) const {
-  int mini_idx = idx_min;
+void EstimateSknn::s_cost_i_checkpoint(Ref< Matrixu8Col> H, Ref< Matrixu8Col> A,
+                                       Ref< Matrixu32Row> S,
+                                       int i,
+                                       Ref< VectorXf> weights,
+                                       float penalty) const {
+
+  // The forward pass only keeps the cost column every `step` SNPs. The
+  // traceback recomputes the back-pointers of one segment at a time from
+  // its checkpoint, which needs O(k * sqrt(m)) memory for twice the work.
+  int k = A.rows();
+  int m = H.cols();
+  int step = std::max(1, static_cast<int>(std::ceil(std::sqrt(static_cast<double>(m)))));
+  int nb_checkpoints = (m - 1) / step + 1;
+  float mini;
+  int minIndex;
+  VectorXf cost(k);
+  MatrixXf checkpoint_cost(k, nb_checkpoints);
+  VectorXf checkpoint_mini(nb_checkpoints);
+  VectorXi checkpoint_minIndex(nb_checkpoints);
 
-  for(int j = m-1; j >= 0; --j) {
-    int k1 = get_k1(mini_idx, k);
-    int k2 = get_k2(mini_idx, k);
-    S(2*i,j) = k1;
-    S(2*i + 1,j) = k2;
-    mini_idx = graph_s_i_path(mini_idx, j);
+  sknn_first_col(A.col(0).data(), H(i, 0), k, cost.data(), mini, minIndex);
+  checkpoint_cost.col(0) = cost;
+  checkpoint_mini(0) = mini;
+  checkpoint_minIndex(0) = minIndex;
+
+  for(int j = 1; j < m; ++j) {
+    sknn_next_col(A.col(j).data(), H(i, j), weights(j), penalty, k,
+                  cost.data(), mini, minIndex, NULL);
+    if(j % step == 0) {
+      checkpoint_cost.col(j / step) = cost;
+      checkpoint_mini(j / step) = mini;
+      checkpoint_minIndex(j / step) = minIndex;
+    }
   }
-}
 
-void EstimateSH::Run(Ref< Matrixu8Row> G, Ref< Matrixu8Row> H, Ref< MatrixfRow> A, Ref< Matrixu8Row> S,
-                    ParameterOptimization &p) const {
-  int n = G.rows();
-  int m = G.cols();
+  BitMatrix jump(k, step);
+  VectorXi jump_to(step);
+  int idx = minIndex;
+
+  for(int c = nb_checkpoints - 1; c >= 0; --c) {
+    // segment of SNPs (start, end] recomputed from the checkpoint at start
+    int start = c * step;
+    int end = std::min(start + step, m - 1);
+
+    cost = checkpoint_cost.col(c);
+    mini = checkpoint_mini(c);
+    minIndex = checkpoint_minIndex(c);
+    for(int j = start + 1; j <= end; ++j) {
+      jump_to(j - start - 1) = minIndex;
+      sknn_next_col(A.col(j).data(), H(i, j), weights(j), penalty, k,
+                    cost.data(), mini, minIndex, jump.col(j - start - 1));
+    }
 
-  int k = p.nbclust;
-  float penalty = p.penalty;
+    for(int j = end; j > start; --j) {
+      S(i,j) = idx;
+      if(jump.get(idx, j - start - 1)) {
+        idx = jump_to(j - start - 1);
+      }
+    }
+  }
+  S(i,0) = idx;
+}
 
-  MatrixXf graph_s_i_cost = MatrixXf::Zero(k*k, m);
-  MatrixiCol graph_s_i_path = MatrixiCol::Zero(k*k, m);
+inline int compact_k1k2(int k1, int k2, int k) {
+  return k1 * (k) + k2;
+}
 
-  for(int i = 0; i < n; ++i) {
+inline int get_k1(int k1k2, int k) {
+  return k1k2 / (k);
+}
 
-      int idx_min = this->s_cost_i(G, H, A,
-                                 graph_s_i_cost,
-                                 graph_s_i_path,
-                                 i, k, m,
-                                 penalty);
-    this->min_path_ind(idx_min, S,
-                       graph_s_i_path,
-                       i, m, k);
+inline int get_k2(int k1k2, int k) {
+  return k1k2 % (k);
+}
+
+inline int other_ind(int k) {
+  if(k % 2 == 0) {
+    return k + 1;
+  } else {
+    return k - 1;
   }
 }
 
-int EstimateSHknn::s_cost_i(Ref< Matrixu8Row> G, Ref< Matrixu8Row> H, Ref< MatrixfRow> A,
-                         MatrixXf& graph_s_i_cost,
-                         MatrixiCol& graph_s_i_path,
-                         int i, int k, int m,
-                         float penalty, float small_penalty) const {
+// Index of the unordered pair {lo, hi}, lo <= hi, in the upper triangle
+// of the k x k pairs, row by row.
+inline int compact_pair(int lo, int hi, int k) {
+  return lo * k - lo * (lo - 1) / 2 + hi - lo;
+}
 
-  VectorXf min_k_1 = VectorXf::Constant(k, std::numeric_limits<float>::max());
-  VectorXi argmin_k_1 = VectorXi::Zero(k);
+inline float pair_cost(const VectorXf& cost, int k1, int k2, int k) {
+  return cost(compact_pair(std::min(k1, k2), std::max(k1, k2), k));
+}
 
-  VectorXf min_k_2 = VectorXf::Constant(k, std::numeric_limits<float>::max());
-  VectorXi argmin_k_2 = VectorXi::Zero(k);
+// Min tracking of the pair {lo, hi} of cost c, for the states (lo, hi) and
+// (hi, lo). The updates of min_k(l) come by increasing index of the other
+// reference, and the last argmin of the k x k order is the state (hi, lo).
+inline void track_pair(VectorXf& min_k, VectorXi& argmin_k,
+                       float& min_both, int& argmin_both,
+                       int lo, int hi, int k, float c) {
+  if(min_k(hi) >= c) {
+    min_k(hi) = c;
+    argmin_k(hi) = lo;
+  }
+  if(min_k(lo) >= c) {
+    min_k(lo) = c;
+    argmin_k(lo) = hi;
+  }
+  if(c < min_both) {
+    min_both = c;
+    argmin_both = compact_k1k2(hi, lo, k);
+  } else if(c == min_both) {
+    argmin_both = std::max(argmin_both, compact_k1k2(hi, lo, k));
+  }
+}
+
+// Joint diploid recurrence of EstimateSH and EstimateSHknn for haplotype
+// pair i, the small jumps being those of EstimateSHknn only. Return the
+// last state (k x k index).
+static int shknn_pairs_cost(Ref< Matrixu8Row> G, Ref< MatrixfRow> A,
+                            Matrixu8Col& path_code,
+                            MatrixiCol& path_argmin,
+                            int i, int k, int m,
+                            float penalty, float small_penalty, bool small_jumps) {
+
+  // States are the pairs (k1, k2). The genotype error of (k1, k2) and
+  // (k2, k1) is the same, so are their costs (the candidates of one are
+  // those of the other with k1 and k2 swapped): only the pairs k1 <= k2 are
+  // computed, and the argmin over k1 for a given k2 is the argmin over k2
+  // for the same k1. Costs are kept for the previous and the current SNP
+  // only. The back-pointer of a state is one of 7 moves, the moves 1 to 3
+  // go to the argmins of the previous SNP, which are kept in path_argmin:
+  //   0: (k1, k2), no jump
+  //   1: (argmin(k2), k2), jump on k1          -- path_argmin(k2, j)
+  //   2: (k1, argmin(k1)), jump on k2          -- path_argmin(k1, j)
+  //   3: argmin_both_hap, 2 jumps              -- path_argmin(k, j)
+  //   4: (other_ind(k1), k2), small jump on k1
+  //   5: (k1, other_ind(k2)), small jump on k2
+  //   6: (other_ind(k1), other_ind(k2)), 2 small jumps
+  // The moves of (k1, k2) and (k2, k1), k1 <= k2, are packed in the low and
+  // high 3 bits of path_code(compact_pair(k1, k2, k), j). Ties are broken
+  // as in the k x k recurrence: first move, last argmin.
+  //
+  // Every pair is computed at every SNP, O(k^2 m). A state of cost above
+  // the double jump bound (2 penalty + min) can only jump, so the pairs
+  // could be split into an implicit "jumped" state plus their genotype
+  // error and a sparse list of the states below the bound. With similar
+  // references the list is not sparse: for 200 references copied from 20
+  // founders it holds about a third of the pairs at penalty 40 and 5 to
+  // 10% at penalty 5, and the paths must stay the ones of this recurrence
+  // on ties. This pruning is not implemented.
+  const float inf = std::numeric_limits<float>::infinity();
+  int nb_pairs = k * (k + 1) / 2;
+  VectorXf cost(nb_pairs), cost_new(nb_pairs);
+  VectorXf a(k), err_h(k), err_0(k), err_1(k);
+
+  VectorXf min_k = VectorXf::Constant(k, std::numeric_limits<float>::max());
+  VectorXi argmin_k = VectorXi::Zero(k);
+  VectorXf new_min_k(k);
+  VectorXi new_argmin_k(k);
 
   float min_both_hap = std::numeric_limits<float>::max();
   int argmin_both_hap = 0;
-  float cost_k1_k2 = 0;
 
-  for(int k1 = 0; k1 < k; ++k1) {
-    for(int k2 = 0; k2 < k; ++k2) {
+  a = A.col(0);
+  for(int lo = 0; lo < k; ++lo) {
+    for(int hi = lo; hi < k; ++hi) {
 
       // Case of Homozygous Site
       int Hi1 = 0;
@@ -421,7 +1012,7 @@ int EstimateSHknn::s_cost_i(Ref< Matrixu8Row> G, Ref< Matrixu8Row> H, Ref< Matri
         Hi1 = G(i, 0) / 2;
         Hi2 = G(i, 0) / 2;
       } else {
-        if(A(k1, 0) >= A(k2, 0)) {
+        if(a(lo) >= a(hi)) {
           Hi1 = 1;
           Hi2 = 0;
         } else {
@@ -429,168 +1020,147 @@ int EstimateSHknn::s_cost_i(Ref< Matrixu8Row> G, Ref< Matrixu8Row> H, Ref< Matri
           Hi2 = 1;
         }
       }
-      cost_k1_k2 =  NORM(Hi1 - A(k1, 0)) + NORM(Hi2 - A(k2, 0));
-
-      graph_s_i_cost(compact_k1k2(k1, k2, k), 0) = cost_k1_k2;
-
-      // jump on k1
-      if(min_k_1(k2) >= cost_k1_k2) {
-        min_k_1(k2) = cost_k1_k2;
-        argmin_k_1(k2) = k1;
-      }
-
-      // jump on k2
-      if(min_k_2(k1) >= cost_k1_k2) {
-        min_k_2(k1) = cost_k1_k2;
-        argmin_k_2(k1) = k2;
-      }
-
-      // 2 jumps
-      if(min_both_hap >= cost_k1_k2) {
-        min_both_hap = cost_k1_k2;
-        argmin_both_hap = compact_k1k2(k1, k2, k);
-      }
+      float cost_k1_k2 =  NORM(Hi1 - a(lo)) + NORM(Hi2 - a(hi));
+      cost(compact_pair(lo, hi, k)) = cost_k1_k2;
+      track_pair(min_k, argmin_k, min_both_hap, argmin_both_hap, lo, hi, k, cost_k1_k2);
     }
   }
 
   for(int j = 1; j < m; ++j) {
-    VectorXf new_min_k_1 = VectorXf::Constant(k, std::numeric_limits<float>::max());
-    VectorXi new_argmin_k_1 = VectorXi::Zero(k);
-
-    VectorXf new_min_k_2 = VectorXf::Constant(k, std::numeric_limits<float>::max());
-    VectorXi new_argmin_k_2 = VectorXi::Zero(k);
+    path_argmin.col(j).head(k) = argmin_k;
+    path_argmin(k, j) = argmin_both_hap;
+    uint8_t* code = path_code.col(j).data();
+
+    if(G(i, j) == NaN) {
+      // the costs are kept and the min tracking of the k x k recurrence
+      // sees the cost of its last state (k - 1, k - 1) everywhere
+      std::fill(code, code + nb_pairs, 0);
+      min_k.setConstant(cost(nb_pairs - 1));
+      argmin_k.setConstant(k - 1);
+      min_both_hap = cost(nb_pairs - 1);
+      argmin_both_hap = compact_k1k2(k - 1, k - 1, k);
+      continue;
+    }
 
+    new_min_k.setConstant(std::numeric_limits<float>::max());
+    new_argmin_k.setZero();
     float new_min_both_hap = std::numeric_limits<float>::max();
     int new_argmin_both_hap = 0;
 
-    for(int k1 = 0; k1 < k; ++k1) {
-      for(int k2 = 0; k2 < k; ++k2) {
-
-        int Hi1 = 0;
-        int Hi2 = 0;
-        if(G(i, j) == 0 || G(i, j) == 2) {
-          Hi1 = G(i, j) / 2;
-          Hi2 = Hi1;
-        } else {
-          if(A(k1, j) >= A(k2, j)) {
-            Hi1 = 1;
-            Hi2 = 0;
-          } else {
-            Hi1 = 0;
-            Hi2 = 1;
-          }
-        }
+    // genotype error of each reference as a homozygous site, or as the
+    // allele 0 or 1 of a heterozygous site
+    a = A.col(j);
+    bool homozygous = G(i, j) == 0 || G(i, j) == 2;
+    int Hh = G(i, j) / 2;
+    for(int l = 0; l < k; ++l) {
+      err_h(l) = NORM(Hh - a(l));
+      err_0(l) = NORM(0 - a(l));
+      err_1(l) = NORM(1 - a(l));
+    }
 
-        if(G(i, j) == NaN) {
-          graph_s_i_cost(compact_k1k2(k1, k2, k), j) = graph_s_i_cost(compact_k1k2(k1, k2, k), j - 1);
-          graph_s_i_path(compact_k1k2(k1, k2, k), j) = compact_k1k2(k1, k2, k);
+    float cand[7];
+    cand[3] = 2 * penalty + min_both_hap;
+    for(int lo = 0; lo < k; ++lo) {
+      // other_ind(k - 1) is out of the panel when k is odd
+      int o1 = other_ind(lo);
+      const float* cost_lo = cost.data() + compact_pair(lo, lo, k) - lo;
+      const float* cost_o1 = (o1 < k) ? cost.data() + compact_pair(o1, o1, k) - o1 : NULL;
+      cand[2] = penalty + min_k(lo);
+
+      for(int hi = lo; hi < k; ++hi) {
+        int o2 = other_ind(hi);
+        float error = homozygous ? err_h(lo) + err_h(hi) :
+          (a(lo) >= a(hi) ? err_1(lo) + err_0(hi) : err_0(lo) + err_1(hi));
+
+        cand[0] = cost_lo[hi];
+        cand[1] = penalty + min_k(hi);
+        if(!small_jumps) {
+          cand[4] = cand[5] = cand[6] = inf;
+        } else if(hi > (lo | 1)) {
+          // o1 <= hi and lo <= o2, no need to sort the pairs
+          cand[4] = (o1 < k) ? cost_o1[hi] + small_penalty : inf;
+          cand[5] = (o2 < k) ? cost_lo[o2] + small_penalty : inf;
+          cand[6] = (o1 < k && o2 < k) ? cost_o1[o2] + small_penalty : inf;
         } else {
-          float error = NORM(Hi1 - A(k1, j)) + NORM(Hi2 - A(k2, j));
-
-          std::vector<float> possibles_jump_cost(7);
-          std::vector<int> possibles_jump_k1(7);
-          std::vector<int> possibles_jump_k2(7);
-          // cost no jump
-          float cost_no_jump = graph_s_i_cost(compact_k1k2(k1, k2, k), j - 1);
-          possibles_jump_cost[0] = cost_no_jump;
-          possibles_jump_k1[0] = k1;
-          possibles_jump_k2[0] = k2;
-
-          // cost jump on k1
-          float min_k1 = min_k_1(k2);
-          int argmin_k1 = argmin_k_1(k2);
-          float cost_jump_k1 = penalty + min_k1;
-          possibles_jump_cost[1] = cost_jump_k1;
-          possibles_jump_k1[1] = argmin_k1;
-          possibles_jump_k2[1] = k2;
-
-          // cost jump on k2
-          float min_k2 = min_k_2(k1);
-          int argmin_k2 = argmin_k_2(k1);
-          float cost_jump_k2 = penalty + min_k2;
-          possibles_jump_cost[2] = cost_jump_k2;
-          possibles_jump_k1[2] = k1;
-          possibles_jump_k2[2] = argmin_k2;
-
-          // cost 2 jumps
-          float min_both = min_both_hap;
-          int argmin_both = argmin_both_hap;
-          float cost_jump_both = 2 * penalty + min_both;
-          possibles_jump_cost[3] = cost_jump_both;
-          possibles_jump_k1[3] = get_k1(argmin_both, k);
-          possibles_jump_k2[3] = get_k2(argmin_both, k);
-
-          float cost_small_jump = graph_s_i_cost(compact_k1k2(other_ind(k1), k2, k), j - 1) + small_penalty;
-          possibles_jump_cost[4] = cost_small_jump;
-          possibles_jump_k1[4] = other_ind(k1);
-          possibles_jump_k2[4] = k2;
-
-          cost_small_jump = graph_s_i_cost(compact_k1k2(k1, other_ind(k2), k), j - 1) + small_penalty;
-          possibles_jump_cost[5] = cost_small_jump;
-          possibles_jump_k1[5] = k1;
-          possibles_jump_k2[5] = other_ind(k2);
-
-          cost_small_jump = graph_s_i_cost(compact_k1k2(other_ind(k1), other_ind(k2), k), j - 1) + small_penalty;
-          possibles_jump_cost[6] = cost_small_jump;
-          possibles_jump_k1[6] = other_ind(k1);
-          possibles_jump_k2[6] = other_ind(k2);
-
-
-          int argmin = std::distance(possibles_jump_cost.begin(),
-                                     std::min_element(possibles_jump_cost.begin(),
-                                                      possibles_jump_cost.end()));
-
-          cost_k1_k2 = possibles_jump_cost[argmin] + error;
-          graph_s_i_cost(compact_k1k2(k1, k2, k), j) = cost_k1_k2;
-          graph_s_i_path(compact_k1k2(k1, k2, k), j) = compact_k1k2(possibles_jump_k1[argmin],
-                                                                    possibles_jump_k2[argmin],
-                                                                    k);
-
+          cand[4] = (o1 < k) ? pair_cost(cost, o1, hi, k) + small_penalty : inf;
+          cand[5] = (o2 < k) ? pair_cost(cost, lo, o2, k) + small_penalty : inf;
+          cand[6] = (o1 < k && o2 < k) ? pair_cost(cost, o1, o2, k) + small_penalty : inf;
         }
 
-        // jump on k1
-        if(new_min_k_1(k2) >= cost_k1_k2) {
-          new_min_k_1(k2) = cost_k1_k2;
-          new_argmin_k_1(k2) = k1;
-        }
-
-        // jump on k2
-        if(new_min_k_2(k1) >= cost_k1_k2) {
-          new_min_k_2(k1) = cost_k1_k2;
-          new_argmin_k_2(k1) = k2;
-        }
+        float mini = shknn_min7(cand);
 
-        // 2 jumps
-        if(new_min_both_hap >= cost_k1_k2) {
-          new_min_both_hap = cost_k1_k2;
-          new_argmin_both_hap = compact_k1k2(k1, k2, k);
-        }
+        float cost_k1_k2 = mini + error;
+        int idx = compact_pair(lo, hi, k);
+        cost_new(idx) = cost_k1_k2;
+        code[idx] = shknn_pair_code(shknn_tie_mask(cand, mini));
+        track_pair(new_min_k, new_argmin_k, new_min_both_hap, new_argmin_both_hap,
+                   lo, hi, k, cost_k1_k2);
       }
     }
-    argmin_k_1 = new_argmin_k_1;
-    min_k_1 = new_min_k_1;
-    argmin_k_2 = new_argmin_k_2;
-    min_k_2 = new_min_k_2;
+    cost.swap(cost_new);
+    argmin_k.swap(new_argmin_k);
+    min_k.swap(new_min_k);
     argmin_both_hap = new_argmin_both_hap;
     min_both_hap = new_min_both_hap;
-
   }
   return argmin_both_hap;
 }
-void EstimateSHknn::min_path_ind(int idx_min, Ref< Matrixu8Row> S,
-                              MatrixiCol& graph_s_i_path,
-                              int i, int m, int k) const {
-  int mini_idx = idx_min;
+
+int EstimateSHknn::s_cost_i(Ref< Matrixu8Row> G, Ref< Matrixu8Row> H, Ref< MatrixfRow> A,
+                            Matrixu8Col& path_code,
+                            MatrixiCol& path_argmin,
+                            int i, int k, int m,
+                            float penalty, float small_penalty) const {
+  return shknn_pairs_cost(G, A, path_code, path_argmin, i, k, m, penalty, small_penalty, true);
+}
+
+// Traceback of shknn_pairs_cost from the state idx_min of the last SNP.
+static void shknn_pairs_path(int idx_min, Ref< Matrixu8Row> S,
+                             const Matrixu8Col& path_code,
+                             const MatrixiCol& path_argmin,
+                             int i, int m, int k) {
+  int k1 = get_k1(idx_min, k);
+  int k2 = get_k2(idx_min, k);
 
   for(int j = m-1; j >= 0; --j) {
-    int k1 = get_k1(mini_idx, k);
-    int k2 = get_k2(mini_idx, k);
     S(2*i,j) = k1;
     S(2*i + 1,j) = k2;
-    mini_idx = graph_s_i_path(mini_idx, j);
+    if(j == 0) {
+      break;
+    }
+    uint8_t code = path_code(compact_pair(std::min(k1, k2), std::max(k1, k2), k), j);
+    switch(k1 <= k2 ? code & 7 : code >> 3) {
+    case 1:
+      k1 = path_argmin(k2, j);
+      break;
+    case 2:
+      k2 = path_argmin(k1, j);
+      break;
+    case 3:
+      k1 = get_k1(path_argmin(k, j), k);
+      k2 = get_k2(path_argmin(k, j), k);
+      break;
+    case 4:
+      k1 = other_ind(k1);
+      break;
+    case 5:
+      k2 = other_ind(k2);
+      break;
+    case 6:
+      k1 = other_ind(k1);
+      k2 = other_ind(k2);
+      break;
+    }
   }
 }
 
+void EstimateSHknn::min_path_ind(int idx_min, Ref< Matrixu8Row> S,
+                                 const Matrixu8Col& path_code,
+                                 const MatrixiCol& path_argmin,
+                                 int i, int m, int k) const {
+  shknn_pairs_path(idx_min, S, path_code, path_argmin, i, m, k);
+}
+
 void EstimateSHknn::Run(Ref< Matrixu8Row> G, Ref< Matrixu8Row> H, Ref< MatrixfRow> A, Ref< Matrixu8Row> S,
                         ParameterOptimization &p, float small_penalty, int num_threads) const {
   int n = G.rows();
@@ -603,16 +1173,61 @@ void EstimateSHknn::Run(Ref< Matrixu8Row> G, Ref< Matrixu8Row> H, Ref< MatrixfRo
   #pragma omp parallel for
   for(int i = 0; i < n; ++i) {
 
-      MatrixXf graph_s_i_cost = MatrixXf::Zero(k*k, m);
-      MatrixiCol graph_s_i_path = MatrixiCol::Zero(k*k, m);
+      Matrixu8Col path_code(k*(k + 1)/2, m);
+      MatrixiCol path_argmin(k + 1, m);
 
       int idx_min = this->s_cost_i(G, H, A,
-                                 graph_s_i_cost,
-                                 graph_s_i_path,
+                                 path_code,
+                                 path_argmin,
                                  i, k, m,
                                  penalty, small_penalty);
       this->min_path_ind(idx_min, S,
-                         graph_s_i_path,
+                         path_code,
+                         path_argmin,
                          i, m, k);
   }
 }
+
+// EstimateSH is the recurrence of EstimateSHknn without the small jumps,
+// over the k(k + 1)/2 unordered pairs of references: half the states of
+// the k x k recurrence and one byte of traceback per pair and SNP (see
+// shknn_pairs_cost for its cost).
+int EstimateSH::s_cost_i(Ref< Matrixu8Row> G, Ref< Matrixu8Row> H, Ref< MatrixfRow> A,
+                         Matrixu8Col& path_code,
+                         MatrixiCol& path_argmin,
+                         int i, int k, int m,
+                         float penalty) const {
+  return shknn_pairs_cost(G, A, path_code, path_argmin, i, k, m, penalty, 0.0f, false);
+}
+
+void EstimateSH::min_path_ind(int idx_min, Ref< Matrixu8Row> S,
+                              const Matrixu8Col& path_code,
+                              const MatrixiCol& path_argmin,
+                              int i, int m, int k) const {
+  shknn_pairs_path(idx_min, S, path_code, path_argmin, i, m, k);
+}
+
+void EstimateSH::Run(Ref< Matrixu8Row> G, Ref< Matrixu8Row> H, Ref< MatrixfRow> A, Ref< Matrixu8Row> S,
+                    ParameterOptimization &p) const {
+  int n = G.rows();
+  int m = G.cols();
+
+  int k = p.nbclust;
+  float penalty = p.penalty;
+
+  Matrixu8Col path_code(k*(k + 1)/2, m);
+  MatrixiCol path_argmin(k + 1, m);
+
+  for(int i = 0; i < n; ++i) {
+
+    int idx_min = this->s_cost_i(G, H, A,
+                                 path_code,
+                                 path_argmin,
+                                 i, k, m,
+                                 penalty);
+    this->min_path_ind(idx_min, S,
+                       path_code,
+                       path_argmin,
+                       i, m, k);
+  }
+}
@@ -1,12 +1,27 @@
 #ifndef GRAPH_H
 #define GRAPH_H
 
+#include <vector>
+
 #include "../Eigen/Core"
 #include "../utils/matrixtype.hpp"
 #include "../datastruct/parameter_opti.hpp"
+#include "../utils/bitmatrix.hpp"
+#include "../datastruct/panel.hpp"
 
 using namespace Eigen;
 
+enum SknnKernel {
+  SKNN_KERNEL_AUTO = -1,      // bit-parallel, integer or compact, the first that applies
+  SKNN_KERNEL_FULL = 0,       // k x m cost and path matrices per haplotype
+  SKNN_KERNEL_COMPACT = 1,    // rolling cost column and 1 bit back-pointers
+  SKNN_KERNEL_CHECKPOINT = 2, // cost checkpoints every ~sqrt(m) SNPs, recomputed at traceback
+  SKNN_KERNEL_BITPARALLEL = 3, // bit-planes over 64 references words, unit weights only
+  SKNN_KERNEL_INTEGER = 4      // uint8/uint16 fixed-point relative costs
+};
+
+struct SknnEngines;
+
 class EstimateS {
 public:
   EstimateS() {}
@@ -28,12 +43,112 @@ protected:
                     int i, int m, int k) const;
 };
 
+// Number of windows of `window` SNPs overlapping by `overlap` SNPs needed
+// to cover m SNPs (see EstimateSknn::RunPanelWindows).
+inline int sknn_nb_windows(int m, int window, int overlap) {
+  int step = window - overlap;
+  if(m <= window || step <= 0) {
+    return 1;
+  }
+  return (m - window + step - 1) / step + 1;
+}
+
 class EstimateSknn {
 public:
   EstimateSknn() {}
 
   virtual void Run(Ref< Matrixu8Col> H, Ref< Matrixu8Col> A, Ref< Matrixu32Row> S,
-                   ParameterOptimization &p, Ref< VectorXf> weights, int num_threads) const;
+                   ParameterOptimization &p, Ref< VectorXf> weights, int num_threads,
+                   int kernel = SKNN_KERNEL_AUTO, float tolerance = 0.0,
+                   int block_size = 1) const;
+
+  // Run the Sknn recurrence for every penalty of `penalties` in the same
+  // pass over the reference columns, S(p*n + i, j) is the result of
+  // haplotype i for penalties(p). `A_packed` is A packed as bits if it is
+  // already known (0 x 0 if A is not binary), A is packed when needed
+  // otherwise.
+  virtual void RunMultiPenalty(Ref< Matrixu8Col> H, Ref< Matrixu8Col> A, Ref< Matrixu32Row> S,
+                               Ref< VectorXf> penalties, Ref< VectorXf> weights,
+                               int num_threads, int kernel = SKNN_KERNEL_AUTO,
+                               float tolerance = 0.0, int block_size = 1,
+                               const BitMatrix* A_packed = NULL) const;
+
+  // Same as RunMultiPenalty with the references rows(0), rows(1), ... of A
+  // only, S holds row indices of A. Duplicated rows give the same costs,
+  // so a bootstrap sample of A is solved on its distinct rows.
+  virtual void RunSubset(Ref< Matrixu8Col> H, Ref< Matrixu8Col> A, Ref< VectorXi> rows,
+                         Ref< Matrixu32Row> S, Ref< VectorXf> penalties,
+                         Ref< VectorXf> weights, int num_threads,
+                         int kernel = SKNN_KERNEL_AUTO, float tolerance = 0.0,
+                         int block_size = 1) const;
+
+  // Same as RunSubset on the references of `panel`, in the layouts
+  // prepared by the panel.
+  virtual void RunPanel(Ref< Matrixu8Col> H, ReferencePanel& panel, Ref< VectorXi> rows,
+                        Ref< Matrixu32Row> S, Ref< VectorXf> penalties,
+                        Ref< VectorXf> weights, int num_threads,
+                        int kernel = SKNN_KERNEL_AUTO, float tolerance = 0.0,
+                        int block_size = 1) const;
+
+  // Same as RunPanel but the traceback gives the population of the
+  // references: L(p*n + i, j) is the population of the reference of
+  // haplotype i at SNP j for penalties(p). Reference indices are only kept
+  // for the current block of haplotypes.
+  virtual void RunPanelLabels(Ref< Matrixu8Col> H, ReferencePanel& panel, Ref< VectorXi> rows,
+                              Ref< Matrixu8Row> L, Ref< VectorXf> penalties,
+                              Ref< VectorXf> weights, int num_threads,
+                              int kernel = SKNN_KERNEL_AUTO, float tolerance = 0.0,
+                              int block_size = 1) const;
+
+  // Viterbi populations of RunPanelLabels for a single penalty on all the
+  // references of `panel`, and margins(i, j) the difference between the
+  // cost of the best path of haplotype i constrained to go through another
+  // population than L(i, j) at SNP j and the cost of the best path
+  // (infinite with a single population). The margins are computed with a
+  // forward and a backward pass, the backward costs are kept every sqrt(m)
+  // SNPs and recomputed between them.
+  virtual void RunPanelMargins(Ref< Matrixu8Col> H, ReferencePanel& panel,
+                               Ref< Matrixu8Row> L, Ref< MatrixfRow> margins,
+                               float penalty, Ref< VectorXf> weights, int num_threads,
+                               int kernel = SKNN_KERNEL_AUTO) const;
+
+  // Same as RunPanel for a single penalty on all the references of
+  // `panel`, with the SNPs split into windows of `window` SNPs overlapping
+  // by `overlap` SNPs and solved independently (in parallel). The paths of
+  // two consecutive windows are stitched at the SNP of the overlap where
+  // they are on the same reference, the closest to the middle of the
+  // overlap. If they never are, failed(i, w) is set to 1 for haplotype i
+  // and the seam between windows w and w+1, which is then the middle of
+  // the overlap. The haplotypes identical over a window are solved once in
+  // this window, nb_unique(w) receives the number of distinct ones.
+  virtual void RunPanelWindows(Ref< Matrixu8Col> H, ReferencePanel& panel,
+                               Ref< Matrixu32Row> S, Ref< Matrixu8Row> failed,
+                               Ref< VectorXi> nb_unique,
+                               float penalty, Ref< VectorXf> weights, int window,
+                               int overlap, int num_threads,
+                               int kernel = SKNN_KERNEL_AUTO) const;
+
+  // Solve again the SNPs start to end - 1 of haplotype i for each window
+  // (i, start, end) of `windows` (one window per column), with the
+  // references of S(i, start - 1) to S(i, end) as the only candidates and
+  // S(i, start - 1) and S(i, end) kept (when the window is not at an end
+  // of the SNPs). The windows of a haplotype must not overlap or touch.
+  virtual void RunPanelRefine(Ref< Matrixu8Col> H, ReferencePanel& panel,
+                              Ref< Matrixu32Row> S, Ref< MatrixiCol> windows,
+                              float penalty, Ref< VectorXf> weights,
+                              int num_threads) const;
+
+  // Same as RunPanelWindows without overlap, each window being solved on
+  // the candidate references of pbwt_candidates only (the panel must be
+  // binary). The costs of the candidates of a window that are also
+  // candidates of the previous one are carried over, the other ones start
+  // with a jump, so that the result is the best path through the
+  // candidates. The candidates are built by each thread for a block of
+  // haplotypes at a time.
+  virtual void RunPanelPbwt(Ref< Matrixu8Col> H, ReferencePanel& panel,
+                            Ref< Matrixu32Row> S, float penalty, Ref< VectorXf> weights,
+                            int window, int nb_checkpoints, int nb_neighbours,
+                            int nb_random, unsigned int seed, int num_threads) const;
 
   virtual ~EstimateSknn() {}
 
@@ -42,6 +157,40 @@ protected:
                         Ref< Matrixu32Row> S,
                         int i, Ref< VectorXf> weights,
                         float penalty) const;
+
+  virtual void s_cost_i_checkpoint(Ref< Matrixu8Col> H, Ref< Matrixu8Col> A,
+                                   Ref< Matrixu32Row> S,
+                                   int i, Ref< VectorXf> weights,
+                                   float penalty) const;
+
+  // Choose the kernel for the references A and `penalties` and build the
+  // engine prototypes. `A_packed` is as in RunMultiPenalty.
+  void init_engines(SknnEngines& engines, Ref< Matrixu8Col> A,
+                    Ref< VectorXf> penalties, Ref< VectorXf> weights,
+                    int kernel, float tolerance, const BitMatrix* A_packed) const;
+
+  // Haplotypes i_start to i_end - 1 for all the penalties, with the kernel
+  // chosen by init_engines.
+  void s_cost_engines(Ref< Matrixu8Col> H, Ref< Matrixu8Col> A, Ref< Matrixu32Row> S,
+                      Ref< VectorXf> penalties, Ref< VectorXf> weights,
+                      const SknnEngines& engines, int i_start, int i_end) const;
+
+  // Best path of haplotype i through the candidates of each window (see
+  // RunPanelPbwt), column w of `candidates` for window w.
+  void s_cost_candidates(Ref< Matrixu8Col> H, const ReferencePanel& panel,
+                         Ref< Matrixu32Row> S, Ref< MatrixiCol> candidates, int i,
+                         float penalty, Ref< VectorXf> weights, int window) const;
+
+  // Margins of haplotype i given its populations L.row(i). `forward`,
+  // `backward` and `checkpoints` are buffers of the calling thread.
+  void margins_i(Ref< Matrixu8Col> H, const ReferencePanel& panel,
+                 Ref< Matrixu8Row> L, Ref< MatrixfRow> margins, int i,
+                 float penalty, Ref< VectorXf> weights, std::vector<float>& forward,
+                 std::vector<float>& backward, std::vector<float>& checkpoints) const;
+
+  template <typename ENGINE>
+  void s_cost_block(Ref< Matrixu8Col> H, Ref< Matrixu32Row> S,
+                    const std::vector<ENGINE>& engines, int i_start, int i_end) const;
 };
 
 class EstimateSH {
@@ -55,13 +204,14 @@ public:
 
 protected:
   virtual int s_cost_i(Ref< Matrixu8Row> G, Ref< Matrixu8Row> H, Ref< MatrixfRow> A,
-                       MatrixXf& graph_s_i_cost,
-                       MatrixiCol& graph_s_i_path,
+                       Matrixu8Col& path_code,
+                       MatrixiCol& path_argmin,
                        int i, int k, int m,
                        float penalty) const;
 
   void min_path_ind(int idx_min, Ref< Matrixu8Row> S,
-                    MatrixiCol& graph_s_i_path,
+                    const Matrixu8Col& path_code,
+                    const MatrixiCol& path_argmin,
                     int i, int m, int k) const;
 };
 
@@ -76,13 +226,14 @@ public:
 
 protected:
   virtual int s_cost_i(Ref< Matrixu8Row> G, Ref< Matrixu8Row> H, Ref< MatrixfRow> A,
-                       MatrixXf& graph_s_i_cost,
-                       MatrixiCol& graph_s_i_path,
+                       Matrixu8Col& path_code,
+                       MatrixiCol& path_argmin,
                        int i, int k, int m,
                        float penalty, float small_penalty) const;
 
   void min_path_ind(int idx_min, Ref< Matrixu8Row> S,
-                    MatrixiCol& graph_s_i_path,
+                    const Matrixu8Col& path_code,
+                    const MatrixiCol& path_argmin,
                     int i, int m, int k) const;
 };
 #endif
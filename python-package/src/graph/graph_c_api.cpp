@@ -6,9 +6,11 @@
 
 #include "graph.hpp"
 #include "../datastruct/parameter_opti.hpp"
+#include "../datastruct/panel.hpp"
 
 #include "graph_c_api.h"
 #include "../datastruct/parameter_c_api.h"
+#include "../datastruct/panel_c_api.h"
 #include "../utils/matrixtype.hpp"
 #include "../errorhandler/errorhandler.h"
 
@@ -232,6 +234,9 @@ void estimatesknn_run(HEstimateSknnPtr estsknn,
                       int n,
                       int m,
                       int num_threads,
+                      int kernel,
+                      float tolerance,
+                      int block_size,
                       HParameterOptimizationPtr param,
                       ErrorHandler* eh) {
   try {
@@ -244,7 +249,269 @@ void estimatesknn_run(HEstimateSknnPtr estsknn,
 
     EstimateSknn* estimatesknn_ptr = reinterpret_cast<EstimateSknn*>(estsknn);
     estimatesknn_ptr->Run(H_mat, A_mat, S_mat, *param_opti,
-                          weights_vec, num_threads);
+                          weights_vec, num_threads, kernel, tolerance,
+                          block_size);
+  } catch (std::exception const& e) {
+    if (!eh) {
+      basic_eh(e.what(), NULL);
+      return;
+    } else {
+      eh->eh(e.what(), eh->user_data);
+      return;
+    }
+  }
+}
+
+void estimatesknn_run_multi(HEstimateSknnPtr estsknn,
+                            uint8_t* H,
+                            uint8_t* A,
+                            int* rows,
+                            int nb_rows,
+                            uint32_t* S,
+                            float* weights,
+                            float* penalties,
+                            int n,
+                            int m,
+                            int nb_penalties,
+                            int num_threads,
+                            int kernel,
+                            float tolerance,
+                            int block_size,
+                            HParameterOptimizationPtr param,
+                            ErrorHandler* eh) {
+  try {
+    ParameterOptimization* param_opti = reinterpret_cast<ParameterOptimization*>(param);
+    int k = param_opti->nbclust;
+    MapMatrixu8Col H_mat(H, 2*n, m);
+    MapMatrixu8Col A_mat(A, k, m);
+    Map< VectorXi> rows_vec(rows, nb_rows);
+    MapMatrixu32Row S_mat(S, nb_penalties*2*n, m);
+    Map< VectorXf> weights_vec(weights, m);
+    Map< VectorXf> penalties_vec(penalties, nb_penalties);
+
+    EstimateSknn* estimatesknn_ptr = reinterpret_cast<EstimateSknn*>(estsknn);
+    estimatesknn_ptr->RunSubset(H_mat, A_mat, rows_vec, S_mat, penalties_vec,
+                                weights_vec, num_threads, kernel, tolerance,
+                                block_size);
+  } catch (std::exception const& e) {
+    if (!eh) {
+      basic_eh(e.what(), NULL);
+      return;
+    } else {
+      eh->eh(e.what(), eh->user_data);
+      return;
+    }
+  }
+}
+
+void estimatesknn_run_panel(HEstimateSknnPtr estsknn,
+                            uint8_t* H,
+                            HReferencePanelPtr panel,
+                            int* rows,
+                            int nb_rows,
+                            uint32_t* S,
+                            float* weights,
+                            float* penalties,
+                            int n,
+                            int m,
+                            int nb_penalties,
+                            int num_threads,
+                            int kernel,
+                            float tolerance,
+                            int block_size,
+                            ErrorHandler* eh) {
+  try {
+    ReferencePanel* panel_ptr = reinterpret_cast<ReferencePanel*>(panel);
+    MapMatrixu8Col H_mat(H, 2*n, m);
+    Map< VectorXi> rows_vec(rows, nb_rows);
+    MapMatrixu32Row S_mat(S, nb_penalties*2*n, m);
+    Map< VectorXf> weights_vec(weights, m);
+    Map< VectorXf> penalties_vec(penalties, nb_penalties);
+
+    EstimateSknn* estimatesknn_ptr = reinterpret_cast<EstimateSknn*>(estsknn);
+    estimatesknn_ptr->RunPanel(H_mat, *panel_ptr, rows_vec, S_mat, penalties_vec,
+                               weights_vec, num_threads, kernel, tolerance,
+                               block_size);
+  } catch (std::exception const& e) {
+    if (!eh) {
+      basic_eh(e.what(), NULL);
+      return;
+    } else {
+      eh->eh(e.what(), eh->user_data);
+      return;
+    }
+  }
+}
+
+void estimatesknn_run_panel_labels(HEstimateSknnPtr estsknn,
+                                   uint8_t* H,
+                                   HReferencePanelPtr panel,
+                                   int* rows,
+                                   int nb_rows,
+                                   uint8_t* L,
+                                   float* weights,
+                                   float* penalties,
+                                   int n,
+                                   int m,
+                                   int nb_penalties,
+                                   int num_threads,
+                                   int kernel,
+                                   float tolerance,
+                                   int block_size,
+                                   ErrorHandler* eh) {
+  try {
+    ReferencePanel* panel_ptr = reinterpret_cast<ReferencePanel*>(panel);
+    MapMatrixu8Col H_mat(H, 2*n, m);
+    Map< VectorXi> rows_vec(rows, nb_rows);
+    MapMatrixu8Row L_mat(L, nb_penalties*2*n, m);
+    Map< VectorXf> weights_vec(weights, m);
+    Map< VectorXf> penalties_vec(penalties, nb_penalties);
+
+    EstimateSknn* estimatesknn_ptr = reinterpret_cast<EstimateSknn*>(estsknn);
+    estimatesknn_ptr->RunPanelLabels(H_mat, *panel_ptr, rows_vec, L_mat, penalties_vec,
+                                     weights_vec, num_threads, kernel, tolerance,
+                                     block_size);
+  } catch (std::exception const& e) {
+    if (!eh) {
+      basic_eh(e.what(), NULL);
+      return;
+    } else {
+      eh->eh(e.what(), eh->user_data);
+      return;
+    }
+  }
+}
+
+void estimatesknn_run_panel_margins(HEstimateSknnPtr estsknn,
+                                    uint8_t* H,
+                                    HReferencePanelPtr panel,
+                                    uint8_t* L,
+                                    float* margins,
+                                    float* weights,
+                                    float penalty,
+                                    int n,
+                                    int m,
+                                    int num_threads,
+                                    int kernel,
+                                    ErrorHandler* eh) {
+  try {
+    ReferencePanel* panel_ptr = reinterpret_cast<ReferencePanel*>(panel);
+    MapMatrixu8Col H_mat(H, 2*n, m);
+    MapMatrixu8Row L_mat(L, 2*n, m);
+    MapMatrixfRow margins_mat(margins, 2*n, m);
+    Map< VectorXf> weights_vec(weights, m);
+
+    EstimateSknn* estimatesknn_ptr = reinterpret_cast<EstimateSknn*>(estsknn);
+    estimatesknn_ptr->RunPanelMargins(H_mat, *panel_ptr, L_mat, margins_mat, penalty,
+                                      weights_vec, num_threads, kernel);
+  } catch (std::exception const& e) {
+    if (!eh) {
+      basic_eh(e.what(), NULL);
+      return;
+    } else {
+      eh->eh(e.what(), eh->user_data);
+      return;
+    }
+  }
+}
+
+void estimatesknn_run_panel_windows(HEstimateSknnPtr estsknn,
+                                    uint8_t* H,
+                                    HReferencePanelPtr panel,
+                                    uint32_t* S,
+                                    uint8_t* failed,
+                                    int* nb_unique,
+                                    float* weights,
+                                    float penalty,
+                                    int n,
+                                    int m,
+                                    int window,
+                                    int overlap,
+                                    int num_threads,
+                                    int kernel,
+                                    ErrorHandler* eh) {
+  try {
+    ReferencePanel* panel_ptr = reinterpret_cast<ReferencePanel*>(panel);
+    MapMatrixu8Col H_mat(H, 2*n, m);
+    MapMatrixu32Row S_mat(S, 2*n, m);
+    int nb_windows = sknn_nb_windows(m, window, overlap);
+    MapMatrixu8Row failed_mat(failed, 2*n, nb_windows - 1);
+    Map< VectorXi> nb_unique_vec(nb_unique, nb_windows);
+    Map< VectorXf> weights_vec(weights, m);
+
+    EstimateSknn* estimatesknn_ptr = reinterpret_cast<EstimateSknn*>(estsknn);
+    estimatesknn_ptr->RunPanelWindows(H_mat, *panel_ptr, S_mat, failed_mat, nb_unique_vec,
+                                      penalty, weights_vec, window, overlap, num_threads,
+                                      kernel);
+  } catch (std::exception const& e) {
+    if (!eh) {
+      basic_eh(e.what(), NULL);
+      return;
+    } else {
+      eh->eh(e.what(), eh->user_data);
+      return;
+    }
+  }
+}
+
+void estimatesknn_run_panel_refine(HEstimateSknnPtr estsknn,
+                                   uint8_t* H,
+                                   HReferencePanelPtr panel,
+                                   uint32_t* S,
+                                   int* windows,
+                                   int nb_windows,
+                                   float* weights,
+                                   float penalty,
+                                   int n,
+                                   int m,
+                                   int num_threads,
+                                   ErrorHandler* eh) {
+  try {
+    ReferencePanel* panel_ptr = reinterpret_cast<ReferencePanel*>(panel);
+    MapMatrixu8Col H_mat(H, 2*n, m);
+    MapMatrixu32Row S_mat(S, 2*n, m);
+    MapMatrixiCol windows_mat(windows, 3, nb_windows);
+    Map< VectorXf> weights_vec(weights, m);
+
+    EstimateSknn* estimatesknn_ptr = reinterpret_cast<EstimateSknn*>(estsknn);
+    estimatesknn_ptr->RunPanelRefine(H_mat, *panel_ptr, S_mat, windows_mat, penalty,
+                                     weights_vec, num_threads);
+  } catch (std::exception const& e) {
+    if (!eh) {
+      basic_eh(e.what(), NULL);
+      return;
+    } else {
+      eh->eh(e.what(), eh->user_data);
+      return;
+    }
+  }
+}
+
+void estimatesknn_run_panel_pbwt(HEstimateSknnPtr estsknn,
+                                 uint8_t* H,
+                                 HReferencePanelPtr panel,
+                                 uint32_t* S,
+                                 float* weights,
+                                 float penalty,
+                                 int n,
+                                 int m,
+                                 int window,
+                                 int nb_checkpoints,
+                                 int nb_neighbours,
+                                 int nb_random,
+                                 unsigned int seed,
+                                 int num_threads,
+                                 ErrorHandler* eh) {
+  try {
+    ReferencePanel* panel_ptr = reinterpret_cast<ReferencePanel*>(panel);
+    MapMatrixu8Col H_mat(H, 2*n, m);
+    MapMatrixu32Row S_mat(S, 2*n, m);
+    Map< VectorXf> weights_vec(weights, m);
+
+    EstimateSknn* estimatesknn_ptr = reinterpret_cast<EstimateSknn*>(estsknn);
+    estimatesknn_ptr->RunPanelPbwt(H_mat, *panel_ptr, S_mat, penalty, weights_vec, window,
+                                   nb_checkpoints, nb_neighbours, nb_random, seed,
+                                   num_threads);
   } catch (std::exception const& e) {
     if (!eh) {
       basic_eh(e.what(), NULL);
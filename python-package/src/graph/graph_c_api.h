@@ -3,6 +3,7 @@
 
 #include "../errorhandler/errorhandler.h"
 #include "../datastruct/parameter_c_api.h"
+#include "../datastruct/panel_c_api.h"
 
 struct HEstimateS;
 typedef struct HEstimateS* HEstimateSPtr;
@@ -79,9 +80,122 @@ extern "C" {
                         int n,
                         int m,
                         int num_threads,
+                        int kernel,
+                        float tolerance,
+                        int block_size,
                         HParameterOptimizationPtr param,
                         ErrorHandler* eh);
 
+  void estimatesknn_run_multi(HEstimateSknnPtr graph,
+                              uint8_t* H,
+                              uint8_t* A,
+                              int* rows,
+                              int nb_rows,
+                              uint32_t* S,
+                              float* weights,
+                              float* penalties,
+                              int n,
+                              int m,
+                              int nb_penalties,
+                              int num_threads,
+                              int kernel,
+                              float tolerance,
+                              int block_size,
+                              HParameterOptimizationPtr param,
+                              ErrorHandler* eh);
+
+  void estimatesknn_run_panel(HEstimateSknnPtr graph,
+                              uint8_t* H,
+                              HReferencePanelPtr panel,
+                              int* rows,
+                              int nb_rows,
+                              uint32_t* S,
+                              float* weights,
+                              float* penalties,
+                              int n,
+                              int m,
+                              int nb_penalties,
+                              int num_threads,
+                              int kernel,
+                              float tolerance,
+                              int block_size,
+                              ErrorHandler* eh);
+
+  void estimatesknn_run_panel_labels(HEstimateSknnPtr graph,
+                                     uint8_t* H,
+                                     HReferencePanelPtr panel,
+                                     int* rows,
+                                     int nb_rows,
+                                     uint8_t* L,
+                                     float* weights,
+                                     float* penalties,
+                                     int n,
+                                     int m,
+                                     int nb_penalties,
+                                     int num_threads,
+                                     int kernel,
+                                     float tolerance,
+                                     int block_size,
+                                     ErrorHandler* eh);
+
+  void estimatesknn_run_panel_margins(HEstimateSknnPtr graph,
+                                      uint8_t* H,
+                                      HReferencePanelPtr panel,
+                                      uint8_t* L,
+                                      float* margins,
+                                      float* weights,
+                                      float penalty,
+                                      int n,
+                                      int m,
+                                      int num_threads,
+                                      int kernel,
+                                      ErrorHandler* eh);
+
+  void estimatesknn_run_panel_windows(HEstimateSknnPtr graph,
+                                      uint8_t* H,
+                                      HReferencePanelPtr panel,
+                                      uint32_t* S,
+                                      uint8_t* failed,
+                                      int* nb_unique,
+                                      float* weights,
+                                      float penalty,
+                                      int n,
+                                      int m,
+                                      int window,
+                                      int overlap,
+                                      int num_threads,
+                                      int kernel,
+                                      ErrorHandler* eh);
+
+  void estimatesknn_run_panel_refine(HEstimateSknnPtr graph,
+                                     uint8_t* H,
+                                     HReferencePanelPtr panel,
+                                     uint32_t* S,
+                                     int* windows,
+                                     int nb_windows,
+                                     float* weights,
+                                     float penalty,
+                                     int n,
+                                     int m,
+                                     int num_threads,
+                                     ErrorHandler* eh);
+
+  void estimatesknn_run_panel_pbwt(HEstimateSknnPtr graph,
+                                   uint8_t* H,
+                                   HReferencePanelPtr panel,
+                                   uint32_t* S,
+                                   float* weights,
+                                   float penalty,
+                                   int n,
+                                   int m,
+                                   int window,
+                                   int nb_checkpoints,
+                                   int nb_neighbours,
+                                   int nb_random,
+                                   unsigned int seed,
+                                   int num_threads,
+                                   ErrorHandler* eh);
+
 #ifdef __cplusplus
 }
 #endif
@@ -0,0 +1,46 @@
+#ifndef SHKNN_KERNEL_HPP
+#define SHKNN_KERNEL_HPP
+
+#include <stdint.h>
+#include <algorithm>
+
+/*
+ * Move primitives of the SHknn recurrence shared by the SHknn kernels.
+ *
+ * The back-pointer of a state (k1, k2) is one of 7 moves:
+ *   0: (k1, k2), no jump
+ *   1: (argmin(k2), k2), jump on k1
+ *   2: (k1, argmin(k1)), jump on k2
+ *   3: argmin of both haplotypes, 2 jumps
+ *   4: (other_ind(k1), k2), small jump on k1
+ *   5: (k1, other_ind(k2)), small jump on k2
+ *   6: (other_ind(k1), other_ind(k2)), 2 small jumps
+ * and the first move of minimal cost is kept.
+ */
+
+inline float shknn_min7(const float* cand) {
+  return std::min(std::min(std::min(cand[0], cand[1]), std::min(cand[2], cand[3])),
+                  std::min(std::min(cand[4], cand[5]), cand[6]));
+}
+
+// Bit mask of the moves whose candidate is the minimum `mini`.
+inline int shknn_tie_mask(const float* cand, float mini) {
+  int mask = 0;
+  for(int c = 0; c < 7; ++c) {
+    mask |= (cand[c] == mini) << c;
+  }
+  return mask;
+}
+
+// Same mask for the state (k2, k1): moves 1 and 2, 4 and 5 are swapped.
+inline int shknn_swap_mask(int mask) {
+  return (mask & 0x49) | ((mask & 0x02) << 1) | ((mask & 0x04) >> 1) |
+    ((mask & 0x10) << 1) | ((mask & 0x20) >> 1);
+}
+
+// Moves of the states (k1, k2) and (k2, k1) in the low and high 3 bits.
+inline uint8_t shknn_pair_code(int mask) {
+  return __builtin_ctz(mask) | (__builtin_ctz(shknn_swap_mask(mask)) << 3);
+}
+
+#endif
@@ -0,0 +1,201 @@
+#ifndef SKNN_BITPARALLEL_HPP
+#define SKNN_BITPARALLEL_HPP
+
+#include <stdint.h>
+#include <algorithm>
+#include <cmath>
+#include <vector>
+
+#include "../utils/bitmatrix.hpp"
+
+/*
+ * Bit-parallel Sknn recurrence for unit weights and binary references.
+ *
+ * With unit weights, the cost of a reference minus the column minimum is
+ * a multiple of 1/scale bounded by penalty + 1 (scale makes the penalty an
+ * integer). These relative costs are stored as bit-planes: bit l of plane
+ * b is bit b of the relative cost of reference l, so every operation on a
+ * 64 bits word updates 64 references. Decisions (jumps and argmins) are the
+ * same as the float recurrence of sknn_kernel.hpp as long as float costs
+ * are exact.
+ */
+
+// Find the smallest power of two `scale` (up to 16) such that
+// penalty * scale is an integer. Return false if there is none.
+inline bool sknn_bitparallel_scale(float penalty, int& scale, int& penalty_scaled,
+                                   int& nb_planes) {
+  if(!(penalty >= 0.0f) || penalty > 1e5f) {
+    return false;
+  }
+  for(scale = 1; scale <= 16; scale *= 2) {
+    float p = penalty * scale;
+    if(p == std::floor(p)) {
+      penalty_scaled = static_cast<int>(p);
+      nb_planes = 1;
+      while((1 << nb_planes) <= penalty_scaled + scale) {
+        ++nb_planes;
+      }
+      return true;
+    }
+  }
+  return false;
+}
+
+// Pack a binary reference matrix, return false if a value is not 0 or 1.
+template <typename MAT>
+inline bool sknn_pack_binary(const MAT& A, BitMatrix& A_packed) {
+  int k = A.rows();
+  int m = A.cols();
+  A_packed.resize(k, m);
+  for(int j = 0; j < m; ++j) {
+    for(int l = 0; l < k; ++l) {
+      if(A(l, j) == 1) {
+        A_packed.set(l, j);
+      } else if(A(l, j) != 0) {
+        return false;
+      }
+    }
+  }
+  return true;
+}
+
+class SknnBitPlanes {
+public:
+  SknnBitPlanes(const BitMatrix& A_packed, int scale, int penalty_scaled, int nb_planes)
+    : A_packed(&A_packed) {
+    int k = A_packed.rows();
+    this->k = k;
+    this->nwords = (k + 63) / 64;
+    this->scale = scale;
+    this->penalty_scaled = penalty_scaled;
+    this->nb_planes = nb_planes;
+    this->shift = 0;
+    while((1 << this->shift) < scale) {
+      ++this->shift;
+    }
+    this->planes.assign(static_cast<size_t>(nb_planes) * this->nwords, 0);
+    this->cand.assign(this->nwords, 0);
+    this->valid.assign(this->nwords, ~static_cast<uint64_t>(0));
+    if(k % 64 != 0) {
+      this->valid[this->nwords - 1] = (static_cast<uint64_t>(1) << (k % 64)) - 1;
+    }
+  }
+
+  int size() const { return this->k; }
+
+  // First SNP, return the argmin.
+  int first_col(uint8_t h) {
+    const uint64_t* a = this->A_packed->col(0);
+    std::fill(this->planes.begin(), this->planes.end(), 0);
+    if(h <= 1) {
+      uint64_t hmask = h ? ~static_cast<uint64_t>(0) : 0;
+      for(int w = 0; w < this->nwords; ++w) {
+        this->add_scale(w, (a[w] ^ hmask) & this->valid[w]);
+      }
+    }
+    return this->renormalize();
+  }
+
+  // Move from SNP j-1 to SNP j, `minIndex` is the argmin of SNP j-1 on
+  // entry and of SNP j on exit. `jump` receives the jump bits of SNP j.
+  void next_col(int j, uint8_t h, int& minIndex, uint64_t* jump) {
+    const uint64_t* a = this->A_packed->col(j);
+    bool missing = h > 1;
+    uint64_t hmask = (h == 1) ? ~static_cast<uint64_t>(0) : 0;
+
+    for(int w = 0; w < this->nwords; ++w) {
+      // references with relative cost > penalty jump to the argmin
+      uint64_t gt = 0;
+      uint64_t eq = ~static_cast<uint64_t>(0);
+      for(int b = this->nb_planes - 1; b >= 0; --b) {
+        uint64_t p = this->plane(b)[w];
+        if((this->penalty_scaled >> b) & 1) {
+          eq &= p;
+        } else {
+          gt |= eq & p;
+          eq &= ~p;
+        }
+      }
+      for(int b = 0; b < this->nb_planes; ++b) {
+        uint64_t bit = ((this->penalty_scaled >> b) & 1) ? gt : 0;
+        this->plane(b)[w] = (this->plane(b)[w] & ~gt) | bit;
+      }
+      if(jump) {
+        jump[w] = gt;
+      }
+      if(!missing) {
+        this->add_scale(w, (a[w] ^ hmask) & this->valid[w]);
+      }
+    }
+
+    if(!missing) {
+      minIndex = this->renormalize();
+    }
+  }
+
+private:
+  const BitMatrix* A_packed;
+  int k;
+  int nwords;
+  int scale;
+  int shift;
+  int penalty_scaled;
+  int nb_planes;
+  std::vector<uint64_t> planes;
+  std::vector<uint64_t> cand;
+  std::vector<uint64_t> valid;
+
+  uint64_t* plane(int b) {
+    return &this->planes[static_cast<size_t>(b) * this->nwords];
+  }
+
+  // add `scale` to the references set in `x`
+  void add_scale(int w, uint64_t carry) {
+    for(int b = this->shift; b < this->nb_planes && carry; ++b) {
+      uint64_t p = this->plane(b)[w];
+      this->plane(b)[w] = p ^ carry;
+      carry &= p;
+    }
+  }
+
+  // Subtract the minimum from every relative cost, return the first argmin.
+  int renormalize() {
+    int minval = 0;
+    this->cand = this->valid;
+    for(int b = this->nb_planes - 1; b >= 0; --b) {
+      const uint64_t* p = this->plane(b);
+      uint64_t any = 0;
+      for(int w = 0; w < this->nwords; ++w) {
+        any |= this->cand[w] & ~p[w];
+      }
+      if(any) {
+        for(int w = 0; w < this->nwords; ++w) {
+          this->cand[w] &= ~p[w];
+        }
+      } else {
+        minval |= 1 << b;
+      }
+    }
+
+    if(minval > 0) {
+      for(int w = 0; w < this->nwords; ++w) {
+        uint64_t borrow = 0;
+        for(int b = 0; b < this->nb_planes; ++b) {
+          uint64_t p = this->plane(b)[w];
+          uint64_t s = ((minval >> b) & 1) ? ~static_cast<uint64_t>(0) : 0;
+          this->plane(b)[w] = p ^ s ^ borrow;
+          borrow = (~p & s) | (~(p ^ s) & borrow);
+        }
+      }
+    }
+
+    for(int w = 0; w < this->nwords; ++w) {
+      if(this->cand[w]) {
+        return w * 64 + __builtin_ctzll(this->cand[w]);
+      }
+    }
+    return 0;
+  }
+};
+
+#endif
@@ -0,0 +1,49 @@
+#ifndef SKNN_ENGINES_HPP
+#define SKNN_ENGINES_HPP
+
+#include <stdint.h>
+#include <vector>
+
+#include "../utils/bitmatrix.hpp"
+#include "sknn_kernel.hpp"
+#include "sknn_bitparallel.hpp"
+#include "sknn_integer.hpp"
+
+// Bits of traceback a thread keeps for the tasks (haplotype, penalty) of
+// a block of haplotypes run together (see EstimateSknn::s_cost_block),
+// 128 MB.
+const size_t SKNN_TRACEBACK_BITS = static_cast<size_t>(1) << 30;
+
+/*
+ * Kernel chosen for a reference panel and a list of penalties, with one
+ * engine prototype per penalty (see EstimateSknn::init_engines). The
+ * engines point to `A_packed` and `quant`, so this struct is filled in
+ * place and never copied.
+ */
+struct SknnEngines {
+  int kernel;
+  int max_cost;
+  BitMatrix A_packed;
+  std::vector<SknnQuantization> quant;
+  std::vector<SknnBitPlanes> bitplanes;
+  std::vector<SknnIntLanes<uint8_t> > intlanes8;
+  std::vector<SknnIntLanes<uint16_t> > intlanes16;
+  std::vector<SknnFloatLanes> floatlanes;
+
+  SknnEngines() : kernel(0), max_cost(0) {}
+
+  void clear() {
+    this->A_packed.resize(0, 0);
+    this->quant.clear();
+    this->bitplanes.clear();
+    this->intlanes8.clear();
+    this->intlanes16.clear();
+    this->floatlanes.clear();
+  }
+
+private:
+  SknnEngines(const SknnEngines&);
+  SknnEngines& operator=(const SknnEngines&);
+};
+
+#endif
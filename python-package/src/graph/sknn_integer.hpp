@@ -0,0 +1,143 @@
+#ifndef SKNN_INTEGER_HPP
+#define SKNN_INTEGER_HPP
+
+#include <stdint.h>
+#include <algorithm>
+#include <cmath>
+#include <vector>
+
+#include "sknn_kernel.hpp"
+
+/*
+ * Fixed-point Sknn recurrence on bounded relative costs.
+ *
+ * The cost of a reference minus the column minimum is at most
+ * penalty + max(weights), so once the penalty and the weights are
+ * quantised to multiples of 1/scale the relative costs fit in uint8 or
+ * uint16 lanes: 16 or 8 lanes per SSE register instead of 4 floats.
+ */
+
+struct SknnQuantization {
+  int scale;
+  int penalty;
+  int max_cost;
+  std::vector<uint16_t> weights;
+};
+
+// Find the smallest power of two scale such that the penalty and the
+// weights are quantised with an absolute error <= tolerance and the
+// relative costs fit in 16 bits. Return false if there is none.
+template <typename VEC>
+inline bool sknn_quantize(float penalty, const VEC& weights, float tolerance,
+                          SknnQuantization& quant) {
+  int m = weights.size();
+  float max_weight = 1.0f; // the first SNP has a unit cost
+  for(int j = 0; j < m; ++j) {
+    if(!(weights(j) >= 0.0f)) {
+      return false;
+    }
+    max_weight = std::max(max_weight, static_cast<float>(weights(j)));
+  }
+  if(!(penalty >= 0.0f)) {
+    return false;
+  }
+
+  for(int scale = 1; (penalty + max_weight) * scale <= 65535.0f; scale *= 2) {
+    double error = std::fabs(std::floor(static_cast<double>(penalty) * scale + 0.5) -
+                             static_cast<double>(penalty) * scale);
+    for(int j = 0; j < m && error <= tolerance * scale; ++j) {
+      double w = static_cast<double>(weights(j)) * scale;
+      error = std::max(error, std::fabs(std::floor(w + 0.5) - w));
+    }
+    if(error <= tolerance * scale) {
+      quant.scale = scale;
+      quant.penalty = static_cast<int>(std::floor(static_cast<double>(penalty) * scale + 0.5));
+      quant.weights.resize(m);
+      int max_w = scale;
+      for(int j = 0; j < m; ++j) {
+        quant.weights[j] = static_cast<uint16_t>(std::floor(static_cast<double>(weights(j)) * scale + 0.5));
+        max_w = std::max(max_w, static_cast<int>(quant.weights[j]));
+      }
+      quant.max_cost = quant.penalty + max_w;
+      return quant.max_cost <= 65535;
+    }
+  }
+  return false;
+}
+
+template <typename T>
+class SknnIntLanes {
+public:
+  SknnIntLanes(const uint8_t* A, int k, int stride, const SknnQuantization& quant)
+    : quant(&quant) {
+    this->A = A;
+    this->k = k;
+    this->stride = stride;
+    this->cost.resize(k);
+  }
+
+  int size() const { return this->k; }
+
+  // First SNP, return the argmin.
+  int first_col(uint8_t h) {
+    const uint8_t* a = this->A;
+    T unit = static_cast<T>(this->quant->scale);
+    for(int l = 0; l < this->k; ++l) {
+      this->cost[l] = (h <= 1 && a[l] != h) ? unit : 0;
+    }
+    return this->renormalize();
+  }
+
+  // Move from SNP j-1 to SNP j, `minIndex` is the argmin of SNP j-1 on
+  // entry and of SNP j on exit. `jump` receives the jump bits of SNP j.
+  void next_col(int j, uint8_t h, int& minIndex, uint64_t* jump) {
+    const uint8_t* a = this->A + static_cast<size_t>(j) * this->stride;
+    T limit = static_cast<T>(this->quant->penalty);
+    T w = (h > 1) ? 0 : static_cast<T>(this->quant->weights[j]);
+    uint8_t flags[64];
+
+    for(int l0 = 0; l0 < this->k; l0 += 64) {
+      int nl = (l0 + 64 < this->k) ? 64 : this->k - l0;
+      T* c = &this->cost[l0];
+      const uint8_t* al = a + l0;
+      for(int l = 0; l < nl; ++l) {
+        flags[l] = c[l] > limit;
+        c[l] = std::min(c[l], limit) + ((al[l] != h) ? w : 0);
+      }
+      if(jump) {
+        jump[l0 >> 6] = sknn_pack_flags(flags, nl);
+      }
+    }
+
+    if(h <= 1) {
+      minIndex = this->renormalize();
+    }
+  }
+
+private:
+  const uint8_t* A;
+  int k;
+  int stride;
+  const SknnQuantization* quant;
+  std::vector<T> cost;
+
+  // Subtract the minimum from every relative cost, return the first argmin.
+  int renormalize() {
+    T mini = this->cost[0];
+    for(int l = 1; l < this->k; ++l) {
+      mini = std::min(mini, this->cost[l]);
+    }
+    int minIndex = 0;
+    while(this->cost[minIndex] != mini) {
+      ++minIndex;
+    }
+    if(mini > 0) {
+      for(int l = 0; l < this->k; ++l) {
+        this->cost[l] -= mini;
+      }
+    }
+    return minIndex;
+  }
+};
+
+#endif
@@ -0,0 +1,177 @@
+#ifndef SKNN_KERNEL_HPP
+#define SKNN_KERNEL_HPP
+
+#include <stdint.h>
+#include <limits>
+#include <string.h>
+#include <vector>
+
+/*
+ * Column primitives of the Sknn recurrence shared by the Sknn kernels.
+ *
+ * The cost of reference l at SNP j is
+ *   cost_j(l) = w_j * (A(l,j) != h_j) + min(cost_{j-1}(l), min_l' cost_{j-1}(l') + penalty)
+ * so the back-pointer of l at SNP j is either l itself or the argmin of
+ * column j-1. Missing data (h_j > 1) only applies the jump step.
+ */
+
+inline void sknn_min_col(const float* cost, int k, float& mini, int& minIndex) {
+  mini = cost[0];
+  minIndex = 0;
+  for(int l = 1; l < k; ++l) {
+    if(cost[l] < mini) {
+      mini = cost[l];
+      minIndex = l;
+    }
+  }
+}
+
+// Minimum of cost[0], ..., cost[k-1] in 8 interleaved lanes, so that the
+// reduction is vectorized.
+inline float sknn_min_value(const float* cost, int k) {
+  float lanes[8];
+  for(int q = 0; q < 8; ++q) {
+    lanes[q] = std::numeric_limits<float>::max();
+  }
+  int l = 0;
+  for(; l + 8 <= k; l += 8) {
+    for(int q = 0; q < 8; ++q) {
+      lanes[q] = (cost[l + q] < lanes[q]) ? cost[l + q] : lanes[q];
+    }
+  }
+  for(; l < k; ++l) {
+    lanes[0] = (cost[l] < lanes[0]) ? cost[l] : lanes[0];
+  }
+  float mini = lanes[0];
+  for(int q = 1; q < 8; ++q) {
+    mini = (lanes[q] < mini) ? lanes[q] : mini;
+  }
+  return mini;
+}
+
+// Cost of the first SNP, weights are not applied on the first SNP.
+inline void sknn_first_col(const uint8_t* a, uint8_t h, int k,
+                           float* cost, float& mini, int& minIndex) {
+  if(h <= 1) {
+    for(int l = 0; l < k; ++l) {
+      cost[l] = (a[l] != h) ? 1.0f : 0.0f;
+    }
+  } else { // missing data
+    for(int l = 0; l < k; ++l) {
+      cost[l] = 0.0f;
+    }
+  }
+  sknn_min_col(cost, k, mini, minIndex);
+}
+
+// Pack 64 flags (0 or 1) into a word, flag l is bit l.
+inline uint64_t sknn_pack_flags(const uint8_t* flags, int nflags) {
+  uint64_t word = 0;
+  int l = 0;
+  for(; l + 8 <= nflags; l += 8) {
+    uint64_t bytes;
+    memcpy(&bytes, flags + l, 8);
+    // gather the low bit of each byte into the top byte (little endian)
+    word |= ((bytes * 0x0102040810204080ULL) >> 56) << l;
+  }
+  for(; l < nflags; ++l) {
+    word |= static_cast<uint64_t>(flags[l]) << l;
+  }
+  return word;
+}
+
+// Update `cost` in place from SNP j-1 to SNP j. When `jump` is not NULL,
+// bit l of `jump` is set if reference l jumps to `minIndex` (the argmin of
+// SNP j-1) and cleared if it stays on itself.
+inline void sknn_next_col(const uint8_t* a, uint8_t h, float w, float penalty, int k,
+                          float* cost, float& mini, int& minIndex, uint64_t* jump) {
+  float limit = mini + penalty;
+  float w_eff = (h > 1) ? 0.0f : w;
+  uint8_t flags[64];
+
+  for(int l0 = 0; l0 < k; l0 += 64) {
+    int nl = (l0 + 64 < k) ? 64 : k - l0;
+    float* c = cost + l0;
+    const uint8_t* al = a + l0;
+    for(int l = 0; l < nl; ++l) {
+      bool jumped = c[l] - limit > 0.0f;
+      flags[l] = jumped;
+      c[l] = (jumped ? limit : c[l]) + ((al[l] != h) ? w_eff : 0.0f);
+    }
+    if(jump) {
+      jump[l0 >> 6] = sknn_pack_flags(flags, nl);
+    }
+  }
+
+  if(h <= 1) {
+    sknn_min_col(cost, k, mini, minIndex);
+  }
+}
+
+// Backward step of the recurrence: `cost` holds the cost of the best end
+// of path from SNP j+1 for each reference of SNP j+1 and is replaced by the
+// one from SNP j, with a, h and w the reference column, haplotype value and
+// weight of SNP j+1.
+inline void sknn_prev_col(const uint8_t* a, uint8_t h, float w, float penalty, int k,
+                          float* cost) {
+  float w_eff = (h > 1) ? 0.0f : w;
+  for(int l = 0; l < k; ++l) {
+    cost[l] += (a[l] != h) ? w_eff : 0.0f;
+  }
+  float limit = sknn_min_value(cost, k) + penalty;
+  for(int l = 0; l < k; ++l) {
+    cost[l] = (cost[l] < limit) ? cost[l] : limit;
+  }
+}
+
+inline bool sknn_jumped(const uint64_t* jump, int l) {
+  return (jump[l >> 6] >> (l & 63)) & 1;
+}
+
+/*
+ * Sknn engines hold the forward state of one haplotype and read the
+ * reference columns themselves:
+ *   int first_col(uint8_t h)  -- SNP 0, return the argmin
+ *   void next_col(int j, uint8_t h, int& minIndex, uint64_t* jump)
+ *                             -- SNP j-1 to SNP j, update the argmin and
+ *                                write the jump bits of SNP j
+ * so the drivers (per haplotype, blocks of haplotypes, ...) do not depend
+ * on the cost representation.
+ */
+class SknnFloatLanes {
+public:
+  SknnFloatLanes(const uint8_t* A, int k, int stride,
+                 const float* weights, float penalty) {
+    this->A = A;
+    this->k = k;
+    this->stride = stride;
+    this->weights = weights;
+    this->penalty = penalty;
+    this->cost.resize(k);
+    this->mini = 0.0f;
+  }
+
+  int size() const { return this->k; }
+
+  int first_col(uint8_t h) {
+    int minIndex;
+    sknn_first_col(this->A, h, this->k, &this->cost[0], this->mini, minIndex);
+    return minIndex;
+  }
+
+  void next_col(int j, uint8_t h, int& minIndex, uint64_t* jump) {
+    sknn_next_col(this->A + static_cast<size_t>(j) * this->stride, h, this->weights[j],
+                  this->penalty, this->k, &this->cost[0], this->mini, minIndex, jump);
+  }
+
+private:
+  const uint8_t* A;
+  int k;
+  int stride;
+  const float* weights;
+  float penalty;
+  std::vector<float> cost;
+  float mini;
+};
+
+#endif
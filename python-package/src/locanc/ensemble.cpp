@@ -0,0 +1,222 @@
+#include <stdint.h>
+#include <vector>
+#include <algorithm>
+#include <random>
+
+#include "../omp.h"
+#include "ensemble.hpp"
+#include "../graph/sknn_engines.hpp"
+
+void bootstrap_rows(const ReferencePanel& panel, std::mt19937& rng, VectorXi& rows) {
+  int k = panel.nbref();
+  // references before the removal of the duplicates, if any
+  int k_drawn = panel.draw_rows.empty() ? k : panel.draw_rows.size();
+  std::vector<int> identity;
+  if(panel.draw_rows.empty()) {
+    identity.resize(k);
+    for(int l = 0; l < k; ++l) {
+      identity[l] = l;
+    }
+  }
+  const std::vector<int>& row_of = panel.draw_rows.empty() ? identity : panel.draw_rows;
+  std::vector<bool> drawn(k, false);
+  rows.resize(k);
+  int nb_rows = 0;
+
+  // populations are stacked, each one is sampled with replacement
+  for(int start = 0; start < k_drawn; ) {
+    int end = start;
+    while(end < k_drawn && panel.labels[row_of[end]] == panel.labels[row_of[start]]) {
+      ++end;
+    }
+    std::uniform_int_distribution<int> dist(start, end - 1);
+    for(int l = start; l < end; ++l) {
+      int r = row_of[dist(rng)];
+      if(!drawn[r]) {
+        drawn[r] = true;
+        rows(nb_rows++) = r;
+      }
+    }
+    start = end;
+  }
+  rows.conservativeResize(nb_rows);
+}
+
+// True if no SNP of the counts `c` (m x nb_pops) can change of population
+// with `remaining` more votes, or if the population with the most votes
+// has at least a fraction `confidence` of the votes at every SNP.
+template<typename T>
+inline bool decided(const T* c, int m, int nb_pops, int remaining, float confidence) {
+  for(int j = 0; j < m; ++j) {
+    const T* cj = c + static_cast<size_t>(j) * nb_pops;
+    int first = 0;
+    int second = 0;
+    int total = 0;
+    for(int pop = 0; pop < nb_pops; ++pop) {
+      total += cj[pop];
+      if(cj[pop] > first) {
+        second = first;
+        first = cj[pop];
+      } else if(cj[pop] > second) {
+        second = cj[pop];
+      }
+    }
+    if(first - second <= remaining && first < confidence * total) {
+      return false;
+    }
+  }
+  return true;
+}
+
+void LocalAncestryEnsemble::Run(Ref< Matrixu8Col> H, ReferencePanel& panel, Ref< VectorXf> penalties,
+                                int nb_bagging, unsigned int seed,
+                                Ref< Matrixu8Row> ancestry, Ref< Matrixu16Row> votes,
+                                Ref< VectorXi> runs, bool adaptive, float confidence,
+                                int num_threads, int kernel, float tolerance,
+                                int block_size) const {
+  panel.check_snps(H.cols());
+  // as new_counts in loter/locanc/local_ancestry.py, 160 votes by default
+  if(std::max(1, nb_bagging) * penalties.size() <= 255) {
+    this->run_counts<uint8_t>(H, panel, penalties, nb_bagging, seed, ancestry, votes, runs,
+                              adaptive, confidence, num_threads, kernel, tolerance, block_size);
+  } else {
+    this->run_counts<uint16_t>(H, panel, penalties, nb_bagging, seed, ancestry, votes, runs,
+                               adaptive, confidence, num_threads, kernel, tolerance, block_size);
+  }
+}
+
+template<typename T>
+void LocalAncestryEnsemble::run_counts(Ref< Matrixu8Col> H, ReferencePanel& panel,
+                                       Ref< VectorXf> penalties,
+                                       int nb_bagging, unsigned int seed,
+                                       Ref< Matrixu8Row> ancestry, Ref< Matrixu16Row> votes,
+                                       Ref< VectorXi> runs, bool adaptive, float confidence,
+                                       int num_threads, int kernel, float tolerance,
+                                       int block_size) const {
+  int n = H.rows();
+  int m = H.cols();
+  int nb_penalties = penalties.size();
+  int nb_pops = panel.nb_pops;
+  bool bagging = nb_bagging > 1;
+  int nb_runs = std::max(1, nb_bagging);
+  VectorXf weights = VectorXf::Ones(m);
+
+  // counts(i, j, pop) of the votes, pop is the fastest index
+  std::vector<T> counts(static_cast<size_t>(n) * m * nb_pops, 0);
+
+  // reference panel of the current bag, shared by all the threads
+  VectorXi rows;
+  Matrixu8Col A_sub;
+  Matrixu8Col* A_run = &panel.A;
+  std::vector<uint8_t> labels_run(panel.labels);
+  SknnEngines engines;
+
+  // haplotypes still voting, they are gathered in H_active once some of
+  // them are decided
+  std::vector<int> active(n);
+  std::vector<char> is_decided(n);
+  for(int i = 0; i < n; ++i) {
+    active[i] = i;
+  }
+  int nb_active = n;
+  Matrixu8Col H_active;
+  runs.setZero();
+
+  block_size = std::max(1, block_size);
+  int nb_blocks = 0;
+
+  omp_set_num_threads(num_threads);
+  #pragma omp parallel
+  {
+    Matrixu32Row S(nb_penalties * block_size, m);
+
+    for(int b = 0; b < nb_runs && nb_active > 0; ++b) {
+      #pragma omp single
+      {
+        engines.clear();
+        if(bagging) {
+          std::seed_seq seq = {seed, static_cast<unsigned int>(b)};
+          std::mt19937 rng(seq);
+          bootstrap_rows(panel, rng, rows);
+          panel.subset(rows, A_sub, labels_run);
+          A_run = &A_sub;
+          this->init_engines(engines, A_sub, penalties, weights, kernel, tolerance, NULL);
+        } else {
+          this->init_engines(engines, panel.A, penalties, weights, kernel, tolerance,
+                             &panel.A_packed);
+        }
+        nb_blocks = (nb_active + block_size - 1) / block_size;
+      }
+
+      #pragma omp for schedule(dynamic)
+      for(int blk = 0; blk < nb_blocks; ++blk) {
+        int i_start = blk * block_size;
+        int nb = std::min(nb_active, i_start + block_size) - i_start;
+        if(nb_active == n) {
+          this->s_cost_engines(H.middleRows(i_start, nb), *A_run, S.topRows(nb_penalties * nb),
+                               penalties, weights, engines, 0, nb);
+        } else {
+          this->s_cost_engines(H_active.middleRows(i_start, nb), *A_run, S.topRows(nb_penalties * nb),
+                               penalties, weights, engines, 0, nb);
+        }
+
+        for(int t = 0; t < nb_penalties * nb; ++t) {
+          int i = active[i_start + t % nb];
+          T* c = &counts[static_cast<size_t>(i) * m * nb_pops];
+          for(int j = 0; j < m; ++j) {
+            ++c[j * nb_pops + labels_run[S(t, j)]];
+          }
+        }
+        for(int a = i_start; a < i_start + nb; ++a) {
+          runs(active[a]) += nb_penalties;
+        }
+      }
+
+      if(adaptive && b + 1 < nb_runs) {
+        int remaining = nb_penalties * (nb_runs - b - 1);
+        #pragma omp for schedule(dynamic)
+        for(int a = 0; a < nb_active; ++a) {
+          int i = active[a];
+          is_decided[i] = decided(&counts[static_cast<size_t>(i) * m * nb_pops], m, nb_pops,
+                                  remaining, confidence);
+        }
+
+        #pragma omp single
+        {
+          int nb_left = 0;
+          for(int a = 0; a < nb_active; ++a) {
+            if(!is_decided[active[a]]) {
+              active[nb_left++] = active[a];
+            }
+          }
+          if(nb_left < nb_active) {
+            nb_active = nb_left;
+            H_active.resize(nb_active, m);
+            for(int a = 0; a < nb_active; ++a) {
+              H_active.row(a) = H.row(active[a]);
+            }
+          }
+        }
+      }
+    }
+
+    // votes of the haplotypes decided early are scaled to the number of
+    // runs of the others
+    int total = nb_runs * nb_penalties;
+    #pragma omp for
+    for(int i = 0; i < n; ++i) {
+      const T* c = &counts[static_cast<size_t>(i) * m * nb_pops];
+      for(int j = 0; j < m; ++j) {
+        int best = 0;
+        for(int pop = 1; pop < nb_pops; ++pop) {
+          if(c[j * nb_pops + pop] > c[j * nb_pops + best]) {
+            best = pop;
+          }
+        }
+        ancestry(i, j) = best;
+        votes(i, j) = (runs(i) == total) ? c[j * nb_pops + best] :
+          (c[j * nb_pops + best] * total + runs(i) / 2) / runs(i);
+      }
+    }
+  }
+}
@@ -0,0 +1,62 @@
+#ifndef ENSEMBLE_HPP
+#define ENSEMBLE_HPP
+
+#include <stdint.h>
+#include <random>
+
+#include "../Eigen/Core"
+#include "../utils/matrixtype.hpp"
+#include "../datastruct/panel.hpp"
+#include "../graph/graph.hpp"
+
+using namespace Eigen;
+
+// Indices of the distinct rows of a bootstrap sample of each population
+// of `panel`, in order of first draw (see bootstrap_rows in
+// loter/locanc/local_ancestry.py).
+void bootstrap_rows(const ReferencePanel& panel, std::mt19937& rng, VectorXi& rows);
+
+/*
+ * Bagging ensemble of Sknn for local ancestry. Every (bag, penalty,
+ * haplotype) path votes for the population of its reference at each SNP,
+ * votes are counted in place so only the result goes back to the caller.
+ */
+class LocalAncestryEnsemble : public EstimateSknn {
+public:
+  LocalAncestryEnsemble() {}
+
+  // Bag b is drawn with the seed (seed, b), the whole panel is used once
+  // if nb_bagging <= 1. A bag is shared by all the penalties, so the
+  // ensemble has nb_bagging resamples of the panel, not one per (bag,
+  // penalty): the votes of a bag are correlated and the vote fractions
+  // vary more between seeds than with a bag per penalty. `ancestry` receives the population with the most
+  // votes (the first one on ties) and `votes` its number of votes, which
+  // must fit in 16 bits. `runs` receives the number of runs of each
+  // haplotype.
+  //
+  // If `adaptive`, a haplotype gets no more bags once its populations can
+  // no longer change at any SNP, or once the population with the most
+  // votes has at least a fraction `confidence` of the votes at every SNP
+  // (confidence > 1 keeps the first rule only). Its votes are then scaled
+  // to nb_bagging runs.
+  virtual void Run(Ref< Matrixu8Col> H, ReferencePanel& panel, Ref< VectorXf> penalties,
+                   int nb_bagging, unsigned int seed,
+                   Ref< Matrixu8Row> ancestry, Ref< Matrixu16Row> votes,
+                   Ref< VectorXi> runs, bool adaptive, float confidence,
+                   int num_threads, int kernel = SKNN_KERNEL_AUTO,
+                   float tolerance = 0.0, int block_size = 1) const;
+
+  virtual ~LocalAncestryEnsemble() {}
+
+protected:
+  // Run with the votes of each haplotype, SNP and population counted in
+  // the type T, uint8_t when the nb_bagging * penalties votes fit in it.
+  template<typename T>
+  void run_counts(Ref< Matrixu8Col> H, ReferencePanel& panel, Ref< VectorXf> penalties,
+                  int nb_bagging, unsigned int seed,
+                  Ref< Matrixu8Row> ancestry, Ref< Matrixu16Row> votes,
+                  Ref< VectorXi> runs, bool adaptive, float confidence,
+                  int num_threads, int kernel, float tolerance, int block_size) const;
+};
+
+#endif
@@ -0,0 +1,132 @@
+#include <exception>
+#include <algorithm>
+#include <random>
+
+#include "ensemble.hpp"
+#include "../datastruct/panel.hpp"
+
+#include "ensemble_c_api.h"
+#include "../utils/matrixtype.hpp"
+#include "../utils/uniquerows.hpp"
+#include "../errorhandler/errorhandler.h"
+
+HLocalAncestryEnsemblePtr ensemble_create(ErrorHandler* eh) {
+  try {
+    LocalAncestryEnsemble* ensemble = new LocalAncestryEnsemble();
+    return reinterpret_cast<HLocalAncestryEnsemblePtr>(ensemble);
+  } catch (std::exception const& e) {
+    if(!eh) {
+      basic_eh(e.what(), NULL);
+      return NULL;
+    } else {
+      eh->eh(e.what(), eh->user_data);
+      return NULL;
+    }
+  }
+}
+
+void ensemble_destroy(HLocalAncestryEnsemblePtr p,
+                      ErrorHandler* eh) {
+  try {
+    delete reinterpret_cast<LocalAncestryEnsemble*>(p);
+  } catch (std::exception const& e) {
+    if(!eh) {
+      basic_eh(e.what(), NULL);
+      return;
+    } else {
+      eh->eh(e.what(), eh->user_data);
+      return;
+    }
+  }
+}
+
+void ensemble_run(HLocalAncestryEnsemblePtr ensemble,
+                  uint8_t* H,
+                  HReferencePanelPtr panel,
+                  float* penalties,
+                  uint8_t* ancestry,
+                  uint16_t* votes,
+                  int* runs,
+                  int n,
+                  int m,
+                  int nb_penalties,
+                  int nb_bagging,
+                  unsigned int seed,
+                  int adaptive,
+                  float confidence,
+                  int num_threads,
+                  int kernel,
+                  float tolerance,
+                  int block_size,
+                  ErrorHandler* eh) {
+  try {
+    ReferencePanel* panel_ptr = reinterpret_cast<ReferencePanel*>(panel);
+    MapMatrixu8Col H_mat(H, n, m);
+    Map< VectorXf> penalties_vec(penalties, nb_penalties);
+    MapMatrixu8Row ancestry_mat(ancestry, n, m);
+    MapMatrixu16Row votes_mat(votes, n, m);
+    Map< VectorXi> runs_vec(runs, n);
+
+    LocalAncestryEnsemble* ensemble_ptr = reinterpret_cast<LocalAncestryEnsemble*>(ensemble);
+    ensemble_ptr->Run(H_mat, *panel_ptr, penalties_vec, nb_bagging, seed,
+                      ancestry_mat, votes_mat, runs_vec, adaptive != 0, confidence,
+                      num_threads, kernel, tolerance, block_size);
+  } catch (std::exception const& e) {
+    if (!eh) {
+      basic_eh(e.what(), NULL);
+      return;
+    } else {
+      eh->eh(e.what(), eh->user_data);
+      return;
+    }
+  }
+}
+
+int ensemble_bootstrap_rows(HReferencePanelPtr panel,
+                            unsigned int seed,
+                            int b,
+                            int* rows,
+                            ErrorHandler* eh) {
+  try {
+    ReferencePanel* panel_ptr = reinterpret_cast<ReferencePanel*>(panel);
+    // same draws as the bootstrap sample b of LocalAncestryEnsemble::Run
+    std::seed_seq seq = {seed, static_cast<unsigned int>(b)};
+    std::mt19937 rng(seq);
+    VectorXi rows_vec;
+    bootstrap_rows(*panel_ptr, rng, rows_vec);
+    std::copy(rows_vec.data(), rows_vec.data() + rows_vec.size(), rows);
+    return rows_vec.size();
+  } catch (std::exception const& e) {
+    if (!eh) {
+      basic_eh(e.what(), NULL);
+      return 0;
+    } else {
+      eh->eh(e.what(), eh->user_data);
+      return 0;
+    }
+  }
+}
+
+int ensemble_unique_rows(uint8_t* H,
+                         int n,
+                         int m,
+                         int* first,
+                         int* group,
+                         ErrorHandler* eh) {
+  try {
+    MapMatrixu8Col H_mat(H, n, m);
+    std::vector<int> first_vec, group_vec;
+    int nb = unique_rows(H_mat, first_vec, group_vec);
+    std::copy(first_vec.begin(), first_vec.end(), first);
+    std::copy(group_vec.begin(), group_vec.end(), group);
+    return nb;
+  } catch (std::exception const& e) {
+    if (!eh) {
+      basic_eh(e.what(), NULL);
+      return 0;
+    } else {
+      eh->eh(e.what(), eh->user_data);
+      return 0;
+    }
+  }
+}
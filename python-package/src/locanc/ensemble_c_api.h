@@ -0,0 +1,56 @@
+#ifndef ENSEMBLE_C_API_H
+#define ENSEMBLE_C_API_H
+
+#include <stdint.h>
+
+#include "../errorhandler/errorhandler.h"
+#include "../datastruct/panel_c_api.h"
+
+struct HLocalAncestryEnsemble;
+typedef struct HLocalAncestryEnsemble* HLocalAncestryEnsemblePtr;
+
+#ifdef __cplusplus
+extern "C" {
+#endif
+  HLocalAncestryEnsemblePtr ensemble_create(ErrorHandler* eh);
+
+  void ensemble_destroy(HLocalAncestryEnsemblePtr p,
+                        ErrorHandler* eh);
+
+  void ensemble_run(HLocalAncestryEnsemblePtr ensemble,
+                    uint8_t* H,
+                    HReferencePanelPtr panel,
+                    float* penalties,
+                    uint8_t* ancestry,
+                    uint16_t* votes,
+                    int* runs,
+                    int n,
+                    int m,
+                    int nb_penalties,
+                    int nb_bagging,
+                    unsigned int seed,
+                    int adaptive,
+                    float confidence,
+                    int num_threads,
+                    int kernel,
+                    float tolerance,
+                    int block_size,
+                    ErrorHandler* eh);
+
+  int ensemble_bootstrap_rows(HReferencePanelPtr panel,
+                              unsigned int seed,
+                              int b,
+                              int* rows,
+                              ErrorHandler* eh);
+
+  int ensemble_unique_rows(uint8_t* H,
+                           int n,
+                           int m,
+                           int* first,
+                           int* group,
+                           ErrorHandler* eh);
+#ifdef __cplusplus
+}
+#endif
+
+#endif
@@ -0,0 +1,243 @@
+#include <stdint.h>
+#include <string.h>
+#include <vector>
+#include <algorithm>
+#include <limits>
+
+#include "../omp.h"
+#include "phasecorrection.hpp"
+#include "../graph/shknn_kernel.hpp"
+#include "../utils/missingdata.hpp"
+
+// Genotype errors of the pairs {0, 0}, {0, 1} and {1, 1}, heterozygous
+// unless g is 0 or 2.
+inline void pair_errors(uint8_t g, float* error) {
+  if(g == 0) {
+    error[0] = 0; error[1] = 1; error[2] = 2;
+  } else if(g == 2) {
+    error[0] = 2; error[1] = 1; error[2] = 0;
+  } else {
+    error[0] = 1; error[1] = 0; error[2] = 1;
+  }
+}
+
+// Moves with a candidate equal to the minimum `mini` (see shknn_tie_mask).
+inline int tie_mask(float mini, float c0, float c1, float c2, float c3,
+                        float c4, float c5, float c6) {
+  return (c0 == mini) | ((c1 == mini) << 1) | ((c2 == mini) << 2) | ((c3 == mini) << 3) |
+    ((c4 == mini) << 4) | ((c5 == mini) << 5) | ((c6 == mini) << 6);
+}
+
+// Min tracking of EstimateSHknn::s_cost_i, which reduces to comparisons
+// of the 3 costs: argmin(0) is 1 iff cost{0, 1} <= cost{0, 0}, and so on.
+inline void track_lanes(const float* c00, const float* c01, const float* c11,
+                        float* min_0, float* min_1, float* min_both, int* argmins) {
+  for(int l = 0; l < PC_LANES; ++l) {
+    min_0[l] = std::min(c00[l], c01[l]);
+    min_1[l] = std::min(c01[l], c11[l]);
+    min_both[l] = std::min(min_0[l], c11[l]);
+    int argmin_0 = c01[l] <= c00[l];
+    int argmin_1 = c11[l] <= c01[l];
+    int both_1 = c11[l] <= min_0[l];
+    // argmin of both haplotypes: (1, 1) = 3, (1, 0) = 2 or (0, 0)
+    argmins[l] = argmin_0 | (argmin_1 << 1) | ((both_1 * 3 + (1 - both_1) * 2 * argmin_0) << 2);
+  }
+}
+
+void PhaseCorrection::s_cost_lanes(const uint8_t* g, int m, const float* penalties,
+                                   uint8_t* path, int* idx_min) const {
+  // The pairs {0, 0}, {0, 1} and {1, 1} are indexed by k1 + k2. For each
+  // SNP, path holds PC_LANES bytes with the argmins of the previous SNP
+  // (argmin(0), argmin(1) and the argmin of both haplotypes in bits 0, 1
+  // and 2-3), then PC_LANES bytes with the tie masks of each pair.
+  const int L = PC_LANES;
+  float c00[L], c01[L], c11[L];
+  float min_0[L], min_1[L], min_both[L];
+  int argmins[L];
+  float error[3];
+
+  pair_errors(g[0], error);
+  for(int l = 0; l < L; ++l) {
+    c00[l] = error[0];
+    c01[l] = error[1];
+    c11[l] = error[2];
+  }
+  track_lanes(c00, c01, c11, min_0, min_1, min_both, argmins);
+
+  for(int j = 1; j < m; ++j) {
+    uint8_t* p = path + 4 * L * static_cast<size_t>(j);
+    for(int l = 0; l < L; ++l) {
+      p[l] = argmins[l];
+    }
+    uint8_t* mask_00 = p + L;
+    uint8_t* mask_01 = p + 2 * L;
+    uint8_t* mask_11 = p + 3 * L;
+
+    if(g[j] == NaN) {
+      // the k x k recurrence sees the cost of its last state everywhere
+      memset(mask_00, 1, 3 * L);
+      for(int l = 0; l < L; ++l) {
+        min_0[l] = min_1[l] = min_both[l] = c11[l];
+        argmins[l] = 1 | (1 << 1) | (3 << 2);
+      }
+      continue;
+    }
+
+    // masks are computed in 32 bits lanes, as the costs, and narrowed
+    // afterwards so that the loop is vectorised
+    int masks[3][L];
+    pair_errors(g[j], error);
+    for(int l = 0; l < L; ++l) {
+      float penalty = penalties[l];
+      float jump_0 = penalty + min_0[l];
+      float jump_1 = penalty + min_1[l];
+      float double_jump = 2 * penalty + min_both[l];
+      float small_00 = c00[l] + penalty;
+      float small_01 = c01[l] + penalty;
+      float small_11 = c11[l] + penalty;
+
+      // {0, 0}, other_ind(0) = 1
+      float mini_00 = std::min(std::min(std::min(c00[l], jump_0), double_jump),
+                               std::min(small_01, small_11));
+      masks[0][l] = tie_mask(mini_00, c00[l], jump_0, jump_0, double_jump,
+                               small_01, small_01, small_11);
+      // {0, 1}
+      float mini_01 = std::min(std::min(std::min(c01[l], jump_1), std::min(jump_0, double_jump)),
+                               std::min(std::min(small_11, small_00), small_01));
+      masks[1][l] = tie_mask(mini_01, c01[l], jump_1, jump_0, double_jump,
+                               small_11, small_00, small_01);
+      // {1, 1}
+      float mini_11 = std::min(std::min(std::min(c11[l], jump_1), double_jump),
+                               std::min(small_01, small_00));
+      masks[2][l] = tie_mask(mini_11, c11[l], jump_1, jump_1, double_jump,
+                               small_01, small_01, small_00);
+
+      c00[l] = mini_00 + error[0];
+      c01[l] = mini_01 + error[1];
+      c11[l] = mini_11 + error[2];
+    }
+    for(int l = 0; l < L; ++l) {
+      mask_00[l] = masks[0][l];
+      mask_01[l] = masks[1][l];
+      mask_11[l] = masks[2][l];
+    }
+    track_lanes(c00, c01, c11, min_0, min_1, min_both, argmins);
+  }
+
+  for(int l = 0; l < L; ++l) {
+    idx_min[l] = argmins[l] >> 2;
+  }
+}
+
+int PhaseCorrection::min_path_ind(int idx_min, const uint8_t* g, const uint8_t* path,
+                                  int lane, int m, uint8_t* s1, uint8_t* s2) const {
+  const int L = PC_LANES;
+  int k1 = idx_min / 2;
+  int k2 = idx_min % 2;
+  int nb_equal = 0;
+
+  for(int j = m-1; j >= 0; --j) {
+    s1[j] = k1;
+    s2[j] = k2;
+    nb_equal += (k1 + k2 == g[j]);
+    if(j == 0) {
+      break;
+    }
+    const uint8_t* p = path + 4 * L * static_cast<size_t>(j);
+    uint8_t argmins = p[lane];
+    int mask = p[(1 + k1 + k2) * L + lane];
+    switch(__builtin_ctz(k1 <= k2 ? mask : shknn_swap_mask(mask))) {
+    case 1:
+      k1 = (argmins >> k2) & 1;
+      break;
+    case 2:
+      k2 = (argmins >> k1) & 1;
+      break;
+    case 3:
+      k1 = argmins >> 3;
+      k2 = (argmins >> 2) & 1;
+      break;
+    case 4:
+      k1 = 1 - k1;
+      break;
+    case 5:
+      k2 = 1 - k2;
+      break;
+    case 6:
+      k1 = 1 - k1;
+      k2 = 1 - k2;
+      break;
+    }
+  }
+  return nb_equal;
+}
+
+void PhaseCorrection::Run(Ref< Matrixu8Row> G, Ref< Matrixu8Row> S, Ref< VectorXd> lambdas,
+                          double threshold, double min_lambda, double max_lambda,
+                          int num_threads) const {
+  const int L = PC_LANES;
+  int n = G.rows();
+  int m = G.cols();
+
+  omp_set_num_threads(num_threads);
+  #pragma omp parallel
+  {
+    std::vector<uint8_t> path(4 * L * static_cast<size_t>(m));
+    std::vector<uint8_t> s1(m), s2(m);
+    float penalties[L];
+    int idx_min[L];
+    double lo_node[L - 1], hi_node[L - 1];
+
+    #pragma omp for schedule(dynamic)
+    for(int i = 0; i < n; ++i) {
+      const uint8_t* g = &G(i, 0);
+      uint8_t* out1 = &S(2*i, 0);
+      uint8_t* out2 = &S(2*i + 1, 0);
+      double lo = min_lambda;
+      double hi = max_lambda;
+
+      // Each pass computes the 7 midpoints of the next 3 levels of the
+      // bisection from [lo, hi] (node c has the children 2c + 1 when the
+      // upper half is dropped and 2c + 2 when it is kept), then follows
+      // the bisection. The lower bound is the last lane of the first pass.
+      for(bool first = true; first || hi - lo > 1; first = false) {
+        lo_node[0] = lo;
+        hi_node[0] = hi;
+        for(int c = 0; c < 3; ++c) {
+          double mean = (hi_node[c] - lo_node[c]) / 2 + lo_node[c];
+          lo_node[2*c + 1] = lo_node[c];
+          hi_node[2*c + 1] = hi_node[c] - (hi_node[c] - lo_node[c]) / 2;
+          lo_node[2*c + 2] = mean;
+          hi_node[2*c + 2] = hi_node[c];
+        }
+        for(int c = 0; c < L - 1; ++c) {
+          penalties[c] = (hi_node[c] - lo_node[c]) / 2 + lo_node[c];
+        }
+        penalties[L - 1] = min_lambda;
+
+        this->s_cost_lanes(g, m, penalties, path.data(), idx_min);
+
+        // keep the upper half while the phased ancestries give back more
+        // than `threshold` of the genotypes
+        for(int c = 0; c < L - 1 && hi - lo > 1; ) {
+          double mean = (hi - lo) / 2 + lo;
+          int nb_equal = this->min_path_ind(idx_min[c], g, path.data(), c, m,
+                                            s1.data(), s2.data());
+          if(nb_equal / static_cast<double>(m) > threshold) {
+            lo = mean;
+            memcpy(out1, s1.data(), m);
+            memcpy(out2, s2.data(), m);
+            c = 2*c + 2;
+          } else {
+            hi = hi - (hi - lo) / 2;
+            c = 2*c + 1;
+          }
+        }
+        if(first && lo == min_lambda) {
+          this->min_path_ind(idx_min[L - 1], g, path.data(), L - 1, m, out1, out2);
+        }
+      }
+      lambdas(i) = lo;
+    }
+  }
+}
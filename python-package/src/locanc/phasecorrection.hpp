@@ -0,0 +1,48 @@
+#ifndef PHASECORRECTION_HPP
+#define PHASECORRECTION_HPP
+
+#include <stdint.h>
+
+#include "../Eigen/Core"
+#include "../utils/matrixtype.hpp"
+
+using namespace Eigen;
+
+// Number of penalties of a forward pass: the 7 midpoints of 3 levels of
+// the bisection and the lower bound of the search.
+#define PC_LANES 8
+
+/*
+ * Phase correction of local ancestries with 2 populations. The ancestry
+ * genotypes G (number of haplotypes from the population 1, 255 if unknown)
+ * are phased by the SHknn recurrence of EstimateSHknn with the 2 references
+ * [0 ... 0] and [1 ... 1], whose only states are the pairs (0, 0), (0, 1),
+ * (1, 0) and (1, 1). The penalty of each individual is found by the
+ * bisection of find_lambda in loter/locanc/local_ancestry.py.
+ */
+class PhaseCorrection {
+public:
+  PhaseCorrection() {}
+
+  // `S` receives the 2 haplotypes of each individual and `lambdas` the
+  // penalty found for it.
+  virtual void Run(Ref< Matrixu8Row> G, Ref< Matrixu8Row> S, Ref< VectorXd> lambdas,
+                   double threshold, double min_lambda, double max_lambda,
+                   int num_threads) const;
+
+  virtual ~PhaseCorrection() {}
+
+protected:
+  // Forward pass for PC_LANES penalties at once (small_penalty = penalty),
+  // `path` receives 4 * PC_LANES bytes per SNP and `idx_min` the final
+  // state k1 * 2 + k2 of each penalty.
+  void s_cost_lanes(const uint8_t* g, int m, const float* penalties, uint8_t* path,
+                    int* idx_min) const;
+
+  // Backtracking of the penalty `lane` from the final state `idx_min`,
+  // return the number of SNPs where s1 + s2 is g.
+  int min_path_ind(int idx_min, const uint8_t* g, const uint8_t* path, int lane, int m,
+                   uint8_t* s1, uint8_t* s2) const;
+};
+
+#endif
@@ -0,0 +1,67 @@
+#include <exception>
+
+#include "phasecorrection.hpp"
+
+#include "phasecorrection_c_api.h"
+#include "../utils/matrixtype.hpp"
+#include "../errorhandler/errorhandler.h"
+
+HPhaseCorrectionPtr phasecorrection_create(ErrorHandler* eh) {
+  try {
+    PhaseCorrection* pc = new PhaseCorrection();
+    return reinterpret_cast<HPhaseCorrectionPtr>(pc);
+  } catch (std::exception const& e) {
+    if(!eh) {
+      basic_eh(e.what(), NULL);
+      return NULL;
+    } else {
+      eh->eh(e.what(), eh->user_data);
+      return NULL;
+    }
+  }
+}
+
+void phasecorrection_destroy(HPhaseCorrectionPtr p,
+                             ErrorHandler* eh) {
+  try {
+    delete reinterpret_cast<PhaseCorrection*>(p);
+  } catch (std::exception const& e) {
+    if(!eh) {
+      basic_eh(e.what(), NULL);
+      return;
+    } else {
+      eh->eh(e.what(), eh->user_data);
+      return;
+    }
+  }
+}
+
+void phasecorrection_run(HPhaseCorrectionPtr pc,
+                         uint8_t* G,
+                         uint8_t* S,
+                         double* lambdas,
+                         int n,
+                         int m,
+                         double threshold,
+                         double min_lambda,
+                         double max_lambda,
+                         int num_threads,
+                         ErrorHandler* eh) {
+  try {
+    MapMatrixu8Row G_mat(G, n, m);
+    MapMatrixu8Row S_mat(S, 2*n, m);
+    Map< VectorXd> lambdas_vec(lambdas, n);
+
+    PhaseCorrection* pc_ptr = reinterpret_cast<PhaseCorrection*>(pc);
+    pc_ptr->Run(G_mat, S_mat, lambdas_vec, threshold, min_lambda, max_lambda,
+                num_threads);
+  } catch (std::exception const& e) {
+    if (!eh) {
+      basic_eh(e.what(), NULL);
+      return;
+    } else {
+      eh->eh(e.what(), eh->user_data);
+      return;
+    }
+  }
+}
@@ -0,0 +1,34 @@
+#ifndef PHASECORRECTION_C_API_H
+#define PHASECORRECTION_C_API_H
+
+#include <stdint.h>
+
+#include "../errorhandler/errorhandler.h"
+
+struct HPhaseCorrection;
+typedef struct HPhaseCorrection* HPhaseCorrectionPtr;
+
+#ifdef __cplusplus
+extern "C" {
+#endif
+  HPhaseCorrectionPtr phasecorrection_create(ErrorHandler* eh);
+
+  void phasecorrection_destroy(HPhaseCorrectionPtr p,
+                               ErrorHandler* eh);
+
+  void phasecorrection_run(HPhaseCorrectionPtr pc,
+                           uint8_t* G,
+                           uint8_t* S,
+                           double* lambdas,
+                           int n,
+                           int m,
+                           double threshold,
+                           double min_lambda,
+                           double max_lambda,
+                           int num_threads,
+                           ErrorHandler* eh);
+#ifdef __cplusplus
+}
+#endif
+
+#endif
@@ -0,0 +1,162 @@
+#include <stdint.h>
+#include <vector>
+#include <algorithm>
+#include <stdexcept>
+
+#include "../omp.h"
+#include "sknnstream.hpp"
+#include "../graph/sknn_kernel.hpp"
+#include "../utils/matrixtype.hpp"
+
+SknnStream::SknnStream(int n, int k, float penalty, int lag) {
+  if(k <= 0) {
+    throw std::invalid_argument("The stream needs at least one reference");
+  }
+  this->n = n;
+  this->k = k;
+  this->nwords = (k + 63) / 64;
+  this->lag = lag;
+  this->penalty = penalty;
+  this->nb_snps = 0;
+  this->haps.resize(n);
+  for(int i = 0; i < n; ++i) {
+    this->haps[i].cost.resize(k);
+    this->haps[i].mini = 0.0f;
+    this->haps[i].minIndex = 0;
+  }
+}
+
+void SknnStream::Push(Ref< Matrixu8Col> H, Ref< Matrixu8Col> A, Ref< VectorXf> weights,
+                      int num_threads) {
+  int c = H.cols();
+  if(H.rows() != this->n || A.rows() != this->k || A.cols() != c || weights.size() != c) {
+    throw std::invalid_argument("The chunk does not match the haplotypes and references of the stream");
+  }
+  if(c == 0) {
+    return;
+  }
+
+  omp_set_num_threads(num_threads);
+  #pragma omp parallel for schedule(dynamic)
+  for(int i = 0; i < this->n; ++i) {
+    Haplotype& hap = this->haps[i];
+    size_t pending = hap.jump_to.size();
+    hap.jump.resize((pending + c) * this->nwords, 0);
+    hap.jump_to.resize(pending + c, 0);
+    for(int j = 0; j < c; ++j) {
+      const uint8_t* a = A.col(j).data();
+      if(this->nb_snps == 0 && j == 0) {
+        sknn_first_col(a, H(i, 0), this->k, &hap.cost[0], hap.mini, hap.minIndex);
+      } else {
+        hap.jump_to[pending + j] = hap.minIndex;
+        sknn_next_col(a, H(i, j), weights(j), this->penalty, this->k, &hap.cost[0],
+                      hap.mini, hap.minIndex, &hap.jump[(pending + j) * this->nwords]);
+      }
+    }
+    this->settle(hap, false);
+  }
+  this->nb_snps += c;
+}
+
+void SknnStream::Finish(int num_threads) {
+  omp_set_num_threads(num_threads);
+  #pragma omp parallel for schedule(dynamic)
+  for(int i = 0; i < this->n; ++i) {
+    this->settle(this->haps[i], true);
+  }
+}
+
+int SknnStream::ready() const {
+  if(this->n == 0) {
+    return 0;
+  }
+  size_t nb = this->haps[0].done.size();
+  for(int i = 1; i < this->n; ++i) {
+    nb = std::min(nb, this->haps[i].done.size());
+  }
+  return nb;
+}
+
+void SknnStream::Pop(Ref< Matrixu32Row> S) {
+  int c = S.cols();
+  if(c > this->ready()) {
+    throw std::invalid_argument("Not enough final SNPs in the stream");
+  }
+  for(int i = 0; i < this->n; ++i) {
+    std::vector<uint32_t>& done = this->haps[i].done;
+    std::copy(done.begin(), done.begin() + c, &S(i, 0));
+    done.erase(done.begin(), done.begin() + c);
+  }
+}
+
+void SknnStream::settle(Haplotype& hap, bool finish) const {
+  int nb_pending = hap.jump_to.size();
+  if(nb_pending == 0) {
+    return;
+  }
+  int last = nb_pending - 1;
+  if(finish) {
+    this->emit(hap, last, hap.minIndex);
+    return;
+  }
+
+  // references of the SNPs p = last, last - 1, ... reached by the chains
+  // of all the references of the last SNP, until a single one is left
+  std::vector<uint64_t> reached(this->nwords, ~0ULL);
+  if(this->k % 64) {
+    reached[this->nwords - 1] = (1ULL << (this->k % 64)) - 1;
+  }
+  for(int p = last; p >= 0; --p) {
+    int nb_nonzero = 0, w_nonzero = 0;
+    for(int w = 0; w < this->nwords; ++w) {
+      if(reached[w]) {
+        ++nb_nonzero;
+        w_nonzero = w;
+      }
+    }
+    uint64_t word = reached[w_nonzero];
+    if(nb_nonzero == 1 && !(word & (word - 1))) {
+      this->emit(hap, p, w_nonzero * 64 + __builtin_ctzll(word));
+      break;
+    }
+    if(p == 0) {
+      break;
+    }
+    const uint64_t* jump = &hap.jump[static_cast<size_t>(p) * this->nwords];
+    bool jumped = false;
+    for(int w = 0; w < this->nwords; ++w) {
+      jumped = jumped || (reached[w] & jump[w]);
+      reached[w] &= ~jump[w];
+    }
+    if(jumped) {
+      reached[hap.jump_to[p] >> 6] |= 1ULL << (hap.jump_to[p] & 63);
+    }
+  }
+
+  nb_pending = hap.jump_to.size();
+  if(this->lag > 0 && nb_pending > this->lag) {
+    // reference at SNP c of the path ending at the best reference
+    int c = nb_pending - this->lag - 1;
+    int state = hap.minIndex;
+    for(int p = nb_pending - 1; p > c; --p) {
+      if(sknn_jumped(&hap.jump[static_cast<size_t>(p) * this->nwords], state)) {
+        state = hap.jump_to[p];
+      }
+    }
+    this->emit(hap, c, state);
+  }
+}
+
+void SknnStream::emit(Haplotype& hap, int c, int state) const {
+  size_t offset = hap.done.size();
+  hap.done.resize(offset + c + 1);
+  hap.done[offset + c] = state;
+  for(int p = c; p > 0; --p) {
+    if(sknn_jumped(&hap.jump[static_cast<size_t>(p) * this->nwords], state)) {
+      state = hap.jump_to[p];
+    }
+    hap.done[offset + p - 1] = state;
+  }
+  hap.jump.erase(hap.jump.begin(), hap.jump.begin() + static_cast<size_t>(c + 1) * this->nwords);
+  hap.jump_to.erase(hap.jump_to.begin(), hap.jump_to.begin() + c + 1);
+}
@@ -0,0 +1,72 @@
+#ifndef SKNNSTREAM_HPP
+#define SKNNSTREAM_HPP
+
+#include <stdint.h>
+#include <vector>
+
+#include "../Eigen/Core"
+#include "../utils/matrixtype.hpp"
+
+using namespace Eigen;
+
+/*
+ * Sknn recurrence of EstimateSknn (float costs) over a stream of SNPs:
+ * the columns of the haplotypes and of the references are pushed chunk by
+ * chunk and only the back-pointers of the SNPs that are not final yet are
+ * kept. The reference of a haplotype at SNP j is final once the
+ * back-pointer chains of all the references of the last SNP go through the
+ * same reference at SNP j, it is then the reference of the path of the
+ * whole stream. With a lag, the SNPs more than `lag` SNPs behind the last
+ * one are made final from the best reference of the last SNP, so that at
+ * most `lag` SNPs are kept.
+ */
+class SknnStream {
+public:
+  // `lag` <= 0 keeps the SNPs until the chains meet.
+  SknnStream(int n, int k, float penalty, int lag);
+
+  // Forward pass over the next SNPs, H (n x c) and A (k x c) hold the
+  // haplotypes and the references and `weights` the weights of these SNPs
+  // (not applied on the first SNP of the stream).
+  virtual void Push(Ref< Matrixu8Col> H, Ref< Matrixu8Col> A, Ref< VectorXf> weights,
+                    int num_threads);
+
+  // End of the stream: the remaining SNPs are traced back from the best
+  // reference of the last SNP.
+  virtual void Finish(int num_threads);
+
+  // Number of SNPs that are final for every haplotype and not popped yet.
+  int ready() const;
+
+  // Move the next S.cols() final references of each haplotype to S.
+  void Pop(Ref< Matrixu32Row> S);
+
+  virtual ~SknnStream() {}
+
+protected:
+  struct Haplotype {
+    std::vector<float> cost;
+    float mini;
+    int minIndex;
+    std::vector<uint64_t> jump;   // jump bits of the pending SNPs, nwords per SNP
+    std::vector<int> jump_to;     // argmin of the SNP before each pending SNP
+    std::vector<uint32_t> done;   // final references not popped yet
+  };
+
+  // Make final the pending SNPs up to the last one where the chains meet
+  // (or the SNPs behind the lag, or all of them with `finish`).
+  void settle(Haplotype& hap, bool finish) const;
+
+  // Make final the pending SNPs 0 to c, with `state` the reference of SNP c.
+  void emit(Haplotype& hap, int c, int state) const;
+
+  int n;
+  int k;
+  int nwords;
+  int lag;
+  float penalty;
+  long nb_snps;
+  std::vector<Haplotype> haps;
+};
+
+#endif
@@ -0,0 +1,118 @@
+#include <exception>
+
+#include "sknnstream.hpp"
+
+#include "sknnstream_c_api.h"
+#include "../utils/matrixtype.hpp"
+#include "../errorhandler/errorhandler.h"
+
+HSknnStreamPtr sknnstream_create(int n,
+                                 int k,
+                                 float penalty,
+                                 int lag,
+                                 ErrorHandler* eh) {
+  try {
+    SknnStream* stream = new SknnStream(n, k, penalty, lag);
+    return reinterpret_cast<HSknnStreamPtr>(stream);
+  } catch (std::exception const& e) {
+    if (!eh) {
+      basic_eh(e.what(), NULL);
+      return NULL;
+    } else {
+      eh->eh(e.what(), eh->user_data);
+      return NULL;
+    }
+  }
+}
+
+void sknnstream_destroy(HSknnStreamPtr p,
+                        ErrorHandler* eh) {
+  try {
+    delete reinterpret_cast<SknnStream*>(p);
+  } catch (std::exception const& e) {
+    if (!eh) {
+      basic_eh(e.what(), NULL);
+      return;
+    } else {
+      eh->eh(e.what(), eh->user_data);
+      return;
+    }
+  }
+}
+
+void sknnstream_push(HSknnStreamPtr stream,
+                     uint8_t* H,
+                     uint8_t* A,
+                     float* weights,
+                     int n,
+                     int k,
+                     int c,
+                     int num_threads,
+                     ErrorHandler* eh) {
+  try {
+    MapMatrixu8Col H_mat(H, n, c);
+    MapMatrixu8Col A_mat(A, k, c);
+    Map< VectorXf> weights_vec(weights, c);
+
+    SknnStream* stream_ptr = reinterpret_cast<SknnStream*>(stream);
+    stream_ptr->Push(H_mat, A_mat, weights_vec, num_threads);
+  } catch (std::exception const& e) {
+    if (!eh) {
+      basic_eh(e.what(), NULL);
+      return;
+    } else {
+      eh->eh(e.what(), eh->user_data);
+      return;
+    }
+  }
+}
+
+void sknnstream_finish(HSknnStreamPtr stream,
+                       int num_threads,
+                       ErrorHandler* eh) {
+  try {
+    reinterpret_cast<SknnStream*>(stream)->Finish(num_threads);
+  } catch (std::exception const& e) {
+    if (!eh) {
+      basic_eh(e.what(), NULL);
+      return;
+    } else {
+      eh->eh(e.what(), eh->user_data);
+      return;
+    }
+  }
+}
+
+int sknnstream_ready(HSknnStreamPtr stream,
+                     ErrorHandler* eh) {
+  try {
+    return reinterpret_cast<SknnStream*>(stream)->ready();
+  } catch (std::exception const& e) {
+    if (!eh) {
+      basic_eh(e.what(), NULL);
+      return 0;
+    } else {
+      eh->eh(e.what(), eh->user_data);
+      return 0;
+    }
+  }
+}
+
+void sknnstream_pop(HSknnStreamPtr stream,
+                    uint32_t* S,
+                    int n,
+                    int c,
+                    ErrorHandler* eh) {
+  try {
+    MapMatrixu32Row S_mat(S, n, c);
+    reinterpret_cast<SknnStream*>(stream)->Pop(S_mat);
+  } catch (std::exception const& e) {
+    if (!eh) {
+      basic_eh(e.what(), NULL);
+      return;
+    } else {
+      eh->eh(e.what(), eh->user_data);
+      return;
+    }
+  }
+}
@@ -0,0 +1,49 @@
+#ifndef SKNNSTREAM_C_API_H
+#define SKNNSTREAM_C_API_H
+
+#include <stdint.h>
+
+#include "../errorhandler/errorhandler.h"
+
+struct HSknnStream;
+typedef struct HSknnStream* HSknnStreamPtr;
+
+#ifdef __cplusplus
+extern "C" {
+#endif
+  HSknnStreamPtr sknnstream_create(int n,
+                                   int k,
+                                   float penalty,
+                                   int lag,
+                                   ErrorHandler* eh);
+
+  void sknnstream_destroy(HSknnStreamPtr p,
+                          ErrorHandler* eh);
+
+  void sknnstream_push(HSknnStreamPtr stream,
+                       uint8_t* H,
+                       uint8_t* A,
+                       float* weights,
+                       int n,
+                       int k,
+                       int c,
+                       int num_threads,
+                       ErrorHandler* eh);
+
+  void sknnstream_finish(HSknnStreamPtr stream,
+                         int num_threads,
+                         ErrorHandler* eh);
+
+  int sknnstream_ready(HSknnStreamPtr stream,
+                       ErrorHandler* eh);
+
+  void sknnstream_pop(HSknnStreamPtr stream,
+                      uint32_t* S,
+                      int n,
+                      int c,
+                      ErrorHandler* eh);
+#ifdef __cplusplus
+}
+#endif
+
+#endif
@@ -0,0 +1,51 @@
+#ifndef BITMATRIX_HPP
+#define BITMATRIX_HPP
+
+#include <stdint.h>
+#include <vector>
+
+/*
+ * Column-major matrix of bits. Each column is padded to a whole number
+ * of 64 bits words so that a column can be read or written word by word.
+ */
+class BitMatrix {
+public:
+  BitMatrix(int rows = 0, int cols = 0) {
+    this->resize(rows, cols);
+  }
+
+  void resize(int rows, int cols) {
+    this->nrows = rows;
+    this->ncols = cols;
+    this->nwords = (rows + 63) / 64;
+    this->data.assign(static_cast<size_t>(this->nwords) * cols, 0);
+  }
+
+  int rows() const { return this->nrows; }
+  int cols() const { return this->ncols; }
+  int words_per_col() const { return this->nwords; }
+
+  uint64_t* col(int j) {
+    return &this->data[static_cast<size_t>(j) * this->nwords];
+  }
+
+  const uint64_t* col(int j) const {
+    return &this->data[static_cast<size_t>(j) * this->nwords];
+  }
+
+  bool get(int i, int j) const {
+    return (this->col(j)[i >> 6] >> (i & 63)) & 1;
+  }
+
+  void set(int i, int j) {
+    this->col(j)[i >> 6] |= (static_cast<uint64_t>(1) << (i & 63));
+  }
+
+private:
+  int nrows;
+  int ncols;
+  int nwords;
+  std::vector<uint64_t> data;
+};
+
+#endif
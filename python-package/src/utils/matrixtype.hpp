@@ -13,6 +13,8 @@ typedef Matrix<uint8_t, Dynamic, Dynamic, ColMajor> Matrixu8Col;
 typedef Map<Matrix<uint8_t, Dynamic, Dynamic, ColMajor> > MapMatrixu8Col;
 typedef Matrix<int, Dynamic, Dynamic, ColMajor> MatrixiCol;
 typedef Map<Matrix<int, Dynamic, Dynamic, ColMajor> > MapMatrixiCol;
+typedef Matrix<uint16_t, Dynamic, Dynamic, RowMajor> Matrixu16Row;
+typedef Map<Matrix<uint16_t, Dynamic, Dynamic, RowMajor> > MapMatrixu16Row;
 typedef Matrix<uint32_t, Dynamic, Dynamic, ColMajor> Matrixu32Col;
 typedef Map<Matrix<uint32_t, Dynamic, Dynamic, ColMajor> > MapMatrixu32Col;
 typedef Matrix<uint32_t, Dynamic, Dynamic, RowMajor> Matrixu32Row;
@@ -0,0 +1,51 @@
+#ifndef UNIQUEROWS_HPP
+#define UNIQUEROWS_HPP
+
+#include <stdint.h>
+#include <vector>
+#include <unordered_map>
+
+#include "../Eigen/Core"
+#include "matrixtype.hpp"
+
+using namespace Eigen;
+
+/*
+ * Group the identical rows of H: group[i] is the group of row i and
+ * first[g] the first row of group g, the groups are numbered in order of
+ * first occurrence. The rows are hashed column by column (FNV-1a, so that
+ * the column-major matrix is read contiguously) and compared only when
+ * their hashes are equal. Return the number of groups.
+ */
+inline int unique_rows(Ref< Matrixu8Col> H, std::vector<int>& first, std::vector<int>& group) {
+  int n = H.rows();
+  int m = H.cols();
+  std::vector<uint64_t> hash(n, 14695981039346656037ULL);
+  for(int j = 0; j < m; ++j) {
+    const uint8_t* h = H.col(j).data();
+    for(int i = 0; i < n; ++i) {
+      hash[i] = (hash[i] ^ h[i]) * 1099511628211ULL;
+    }
+  }
+
+  std::unordered_map<uint64_t, std::vector<int> > groups_of_hash;
+  first.clear();
+  group.resize(n);
+  for(int i = 0; i < n; ++i) {
+    std::vector<int>& candidates = groups_of_hash[hash[i]];
+    group[i] = -1;
+    for(size_t c = 0; c < candidates.size() && group[i] < 0; ++c) {
+      if(H.row(i) == H.row(first[candidates[c]])) {
+        group[i] = candidates[c];
+      }
+    }
+    if(group[i] < 0) {
+      group[i] = first.size();
+      candidates.push_back(group[i]);
+      first.push_back(i);
+    }
+  }
+  return first.size();
+}
+
+#endif
@@ -0,0 +1,274 @@
+from __future__ import division
+
+import unittest
+import numpy as np
+
+import loter.graph as estimates
+import loter.locanc.ensemble as ensemble
+import loter.locanc.local_ancestry as lc
+from loter.datastruct.panel import ReferencePanel, compact_panel, hamming_medoids
+
+class LocalAncestryEnsembleTest(unittest.TestCase):
+
+    def setUp(self):
+        rs = np.random.RandomState(7)
+        m = 400
+        self.l_H = [rs.randint(0, 2, size=(k, m)).astype(np.uint8) for k in (15, 22, 9)]
+        A = np.vstack(self.l_H)
+        # admixed haplotypes switching between references
+        h_adm = A[rs.randint(len(A), size=(7, 1)), np.arange(m)]
+        h_adm[:, 200:] = A[rs.randint(len(A), size=(7, 1)), np.arange(200, m)]
+        h_adm[rs.rand(7, m) < 0.02] = 3
+        self.h_adm = h_adm.astype(np.uint8)
+        self.penalties = [1.5, 2.5, 4.0]
+
+    def test_ensemble_no_bagging(self):
+        panel = ReferencePanel(self.l_H)
+        n, m = self.h_adm.shape
+        counts = np.zeros((panel.nb_pops, n, m))
+        for penalty in self.penalties:
+            data = {"H": np.vstack([self.h_adm, np.zeros((1, m), dtype=np.uint8)])}
+            param = {"penalties": [penalty], "num_threads": 1,
+                     "weights": np.ones(m, dtype=np.float32)}
+            estimates.EstimateSknn().run_panel(data, param, panel)
+            labels = panel.labels[data["S"][0][:n]]
+            for pop in range(panel.nb_pops):
+                counts[pop][labels == pop] += 1
+
+        ancestry, votes = ensemble.LocalAncestryEnsemble().run(panel, self.h_adm,
+                                                               self.penalties,
+                                                               nb_bagging=1)
+        self.assertTrue(np.array_equal(ancestry, np.argmax(counts, axis=0)))
+        self.assertTrue(np.array_equal(votes, np.max(counts, axis=0)))
+
+    def test_ensemble_counts(self):
+        panel = ReferencePanel(self.l_H)
+        h_adm = self.h_adm[:6]
+        counts = lc.boostrap_loter_multiple_lambdas(panel, h_adm, self.penalties, None,
+                                                    nbrun=1, num_threads=1)
+        self.assertEqual(counts.dtype, np.uint8)
+        ancestry, votes = lc.mode(counts)
+        res = ensemble.LocalAncestryEnsemble().run(panel, h_adm, self.penalties,
+                                                   nb_bagging=1)
+        self.assertTrue(np.array_equal(ancestry, res[0]))
+        self.assertTrue(np.array_equal(votes, res[1]))
+
+        # same bootstrap samples as the native ensemble for a seed
+        for l_H in [panel, compact_panel(self.l_H)]:
+            counts = lc.boostrap_loter_multiple_lambdas(l_H, h_adm, self.penalties, None,
+                                                        nbrun=3, num_threads=1, seed=4)
+            res = ensemble.LocalAncestryEnsemble().run(l_H, h_adm, self.penalties,
+                                                       nb_bagging=3, seed=4)
+            self.assertTrue(np.array_equal(lc.mode(counts)[0], res[0]))
+            self.assertTrue(np.array_equal(lc.mode(counts)[1], res[1]))
+        counts = lc.boostrap_loter_multiple_lambdas(panel, h_adm, self.penalties, None,
+                                                    nbrun=1, num_threads=1)
+
+        # same votes as one boolean mask per population
+        counts_ref = counts.astype(np.float64)
+        arr = np.random.RandomState(0).randint(0, 3, size=h_adm.shape)
+        for p in range(3):
+            counts_ref[p][arr == p] += 1
+        lc.update_counts(counts, arr, 3)
+        self.assertTrue(np.array_equal(counts, counts_ref))
+        self.assertTrue(np.array_equal(lc.mode(counts_ref)[0], np.argmax(counts_ref, axis=0)))
+
+    def test_vote_and_impute(self):
+        arr = np.array([[0, 255, 255, 255, 3, 255, 255, 5, 255],
+                        [255] * 9], dtype=np.uint8)
+        self.assertTrue(np.array_equal(lc.fill_nearest(arr),
+                                       [[0, 0, 3, 3, 3, 3, 5, 5, 5], [255] * 9]))
+
+        ancestry = np.array([[0, 1, 2, 1], [1, 1, 0, 2]], dtype=np.uint8)
+        votes = np.array([[9, 9, 1, 9], [9, 9, 9, 9]], dtype=np.uint16)
+        res = lc.vote_and_impute((ancestry, votes), 0.5)
+        self.assertEqual(res.dtype, np.float64)
+        self.assertTrue(np.array_equal(res, [[1, 2, 4, 4]]))
+        res = lc.vote_and_impute((ancestry, np.array([[9, 9, 9, 9], [1, 1, 1, 1]])), 0.5)
+        self.assertTrue(np.all(np.isnan(res)))
+
+    def test_ensemble_coarse(self):
+        ancestry, votes, refined = lc.loter_local_ancestry_coarse(self.l_H, self.h_adm,
+                                                                  self.penalties,
+                                                                  nb_bagging=3, stride=8,
+                                                                  num_threads=1, seed=0)
+        self.assertEqual(ancestry.shape, self.h_adm.shape)
+        self.assertTrue(np.all(votes <= 3 * len(self.penalties)))
+        self.assertTrue(0 < refined < 1)
+
+        # same paths as the full resolution with a window over all the SNPs
+        result, S, refined = lc.locanc_h_knn_coarse(self.l_H, self.h_adm[:6], 2.5,
+                                                    stride=1, margin=400, num_threads=1)
+        self.assertEqual(refined, 1)
+        res_full, S_full = lc.locanc_h_knn_multi(self.l_H, self.h_adm[:6], [2.5],
+                                                 num_threads=1)
+        self.assertTrue(np.array_equal(result, res_full[0]))
+
+        # same bootstrap samples as the native ensemble, other options checked
+        panel = ReferencePanel(self.l_H)
+        rows = ensemble.bootstrap_rows(panel, 3, 0)
+        self.assertEqual(len(np.unique(rows)), len(rows))
+        self.assertTrue(np.array_equal(np.unique(panel.labels[rows]), [0, 1, 2]))
+        res = lc.loter_local_ancestry(self.l_H, self.h_adm, self.penalties, nb_bagging=3,
+                                      num_threads=1, seed=3, stride=8, budget=5)
+        self.assertEqual(res[0].shape, self.h_adm.shape)
+        with self.assertRaises(ValueError):
+            lc.loter_local_ancestry(self.l_H, self.h_adm, self.penalties, stride=8,
+                                    adaptive=True)
+        with self.assertRaises(ValueError):
+            lc.loter_local_ancestry(self.l_H, self.h_adm, self.penalties, confidence=0.9)
+        with self.assertRaises(ValueError):
+            ensemble.LocalAncestryEnsemble().run(panel, self.h_adm, self.penalties,
+                                                 confidence=0.9)
+        for l_H in [panel, compact_panel(self.l_H)]:
+            with self.assertRaises(ValueError):
+                ensemble.LocalAncestryEnsemble().run(l_H, self.h_adm[:, :-1], self.penalties)
+
+        # no change of reference in the coarse paths: nothing to refine
+        A = np.vstack(self.l_H)
+        result, S, refined = lc.locanc_h_knn_coarse(self.l_H, A[[1, 20]], 2.0, stride=16,
+                                                    num_threads=1)
+        self.assertEqual(refined, 0)
+        self.assertTrue(np.array_equal(S, [[1] * A.shape[1], [20] * A.shape[1]]))
+        self.assertEqual(lc.breakpoint_windows(S, np.arange(A.shape[1]), A.shape[1], 4).shape,
+                         (0, 3))
+
+    def test_ensemble_compact(self):
+        rs = np.random.RandomState(3)
+        # duplicated references and SNPs without variation in the panel
+        l_H = [H[rs.randint(len(H), size=2 * len(H))] for H in self.l_H]
+        for H in l_H:
+            H[:, 100:150] = 0
+            H[:, -5:] = 1
+        panel = compact_panel(l_H)
+        self.assertEqual(len(panel.snps), self.h_adm.shape[1] - 55)
+        self.assertTrue(panel.nbref <= sum(len(H) for H in self.l_H))
+        self.assertEqual(panel.multiplicity.sum(), sum(len(H) for H in l_H))
+        self.assertTrue(np.array_equal(panel.A[panel.draw_rows],
+                                       np.vstack(l_H)[:, panel.snps]))
+
+        ens = ensemble.LocalAncestryEnsemble()
+        for nb_bagging in (1, 5):
+            res = ens.run(l_H, self.h_adm, self.penalties, nb_bagging=nb_bagging,
+                          seed=3, num_threads=1)
+            res_compact = ens.run(panel, self.h_adm, self.penalties, nb_bagging=nb_bagging,
+                                  seed=3, num_threads=1)
+            self.assertTrue(np.array_equal(res[0], res_compact[0]))
+            self.assertTrue(np.array_equal(res[1], res_compact[1]))
+        res = lc.loter_local_ancestry(l_H, self.h_adm, self.penalties, nb_bagging=5,
+                                      num_threads=1, seed=3, compact=False)
+        res_compact = lc.loter_local_ancestry(l_H, self.h_adm, self.penalties, nb_bagging=5,
+                                              num_threads=1, seed=3)
+        self.assertTrue(np.array_equal(res[0], res_compact[0]))
+
+        # the helpers taking a panel solve the SNPs kept
+        A = np.vstack(l_H)
+        h_adm = self.h_adm[:6]
+        res = lc.locanc_h_knn_multi(l_H, h_adm, [2.0], num_threads=1)
+        res_compact = lc.locanc_h_knn_multi(panel, h_adm, [2.0], num_threads=1)
+        self.assertTrue(np.array_equal(res[0], res_compact[0]))
+        self.assertTrue(np.array_equal(A[res[1], np.arange(A.shape[1])],
+                                       A[res_compact[1], np.arange(A.shape[1])]))
+        L = lc.locanc_h_knn_margins(l_H, h_adm, 2.0, num_threads=1)[0]
+        self.assertTrue(np.array_equal(L, lc.locanc_h_knn_margins(panel, h_adm, 2.0,
+                                                                  num_threads=1)[0]))
+        counts = lc.boostrap_loter_multiple_lambdas(l_H, h_adm, [2.0], None, nbrun=1,
+                                                    num_threads=1)
+        self.assertTrue(np.array_equal(counts, lc.boostrap_loter_multiple_lambdas(
+            panel, h_adm, [2.0], None, nbrun=1, num_threads=1)))
+        self.assertEqual(lc.locanc_h_knn_pbwt(panel, h_adm, 2.0, window=50,
+                                              num_threads=1)[0].shape, h_adm.shape)
+        with self.assertRaises(ValueError):
+            lc.locanc_h_knn_multi(panel, h_adm[:, 1:], [2.0], num_threads=1)
+        with self.assertRaises(ValueError):
+            lc.locanc_h_knn(panel, h_adm)
+
+    def test_ensemble_budget(self):
+        rs = np.random.RandomState(5)
+        # 4 clusters of references in each population
+        l_H = []
+        for k in (30, 12):
+            founders = rs.randint(0, 2, size=(4, 400)).astype(np.uint8)
+            H = founders[np.arange(k) % 4]
+            H[rs.rand(k, 400) < 0.01] ^= 1
+            l_H.append(H)
+        medoids, assignment, distance = hamming_medoids(l_H[0], np.ones(30), 4)
+        self.assertTrue(np.array_equal(np.sort(assignment[medoids]), np.arange(4)))
+        # the clusters are the founders
+        self.assertTrue(np.array_equal(assignment, assignment[np.arange(30) % 4]))
+        self.assertTrue(np.array_equal(distance, (l_H[0] != l_H[0][medoids[assignment]]).sum(axis=1)))
+
+        panel = compact_panel(l_H, budget=4)
+        self.assertEqual(panel.sizes, [4, 4])
+        self.assertEqual(panel.full_sizes, [30, 12])
+        self.assertTrue(np.array_equal(np.sort(panel.multiplicity[:4]), [7, 7, 8, 8]))
+        self.assertTrue(np.array_equal(panel.multiplicity[4:], [3, 3, 3, 3]))
+        A = np.vstack(l_H)
+        self.assertTrue(np.array_equal(panel.distance,
+                                       (A != A[panel.rows[panel.draw_rows]]).sum(axis=1)))
+        self.assertEqual(panel.coverage[0]["representatives"], 4)
+        self.assertIs(compact_panel(panel), panel)
+        self.assertIs(compact_panel(panel, budget=4), panel)
+        with self.assertRaises(ValueError):
+            lc.loter_local_ancestry(panel, A[::3], self.penalties, budget=3)
+        self.assertTrue(panel.coverage[0]["max_distance"] < 0.05)
+
+        ancestry = lc.loter_local_ancestry(l_H, A[::3], self.penalties, nb_bagging=3,
+                                           num_threads=1, seed=0, budget=4)[0]
+        self.assertTrue(np.mean(ancestry == (np.arange(0, 42, 3) >= 30)[:, None]) > 0.99)
+
+    def test_ensemble_unique(self):
+        h_adm = self.h_adm[[0, 1, 0, 2, 1, 0]]
+        first, inverse = ensemble.unique_rows(h_adm)
+        self.assertTrue(np.array_equal(first, [0, 1, 3]))
+        self.assertTrue(np.array_equal(inverse, [0, 1, 0, 2, 1, 0]))
+        X = np.random.RandomState(0).randint(0, 2, size=(300, 6)).astype(np.uint8)
+        first, inverse = ensemble.unique_rows(X)
+        self.assertEqual(len(first), len(np.unique(X, axis=0)))
+        self.assertTrue(np.array_equal(X[first][inverse], X))
+        self.assertTrue(np.all(np.diff(first) > 0))
+
+        ens = ensemble.LocalAncestryEnsemble()
+        res = ens.run(self.l_H, h_adm, self.penalties, nb_bagging=5, seed=3,
+                      num_threads=1, adaptive=True)
+        self.assertEqual(ens.dedup_ratio, 2)
+        runs = ens.runs
+        res_all = ens.run(self.l_H, h_adm, self.penalties, nb_bagging=5, seed=3,
+                          num_threads=1, adaptive=True, unique=False)
+        self.assertEqual(ens.dedup_ratio, 1)
+        self.assertTrue(np.array_equal(res[0], res_all[0]))
+        self.assertTrue(np.array_equal(res[1], res_all[1]))
+        self.assertTrue(np.array_equal(runs, ens.runs))
+
+    def test_ensemble_seed(self):
+        ens = ensemble.LocalAncestryEnsemble()
+        res1 = ens.run(self.l_H, self.h_adm, self.penalties, nb_bagging=5,
+                       seed=3, num_threads=1)
+        res2 = ens.run(self.l_H, self.h_adm, self.penalties, nb_bagging=5,
+                       seed=3, num_threads=2, block_size=2)
+        res3 = ens.run(self.l_H, self.h_adm, self.penalties, nb_bagging=5,
+                       seed=4, num_threads=1)
+        self.assertTrue(np.array_equal(res1[0], res2[0]))
+        self.assertTrue(np.array_equal(res1[1], res2[1]))
+        self.assertFalse(np.array_equal(res1[1], res3[1]))
+        self.assertTrue(np.all(res1[1] <= 5 * len(self.penalties)))
+        self.assertTrue(np.all(res1[1] * 3 >= 5 * len(self.penalties)))
+
+    def test_ensemble_adaptive(self):
+        ens = ensemble.LocalAncestryEnsemble()
+        nb_runs = 10 * len(self.penalties)
+        ancestry, votes = ens.run(self.l_H, self.h_adm, self.penalties, nb_bagging=10,
+                                  seed=3, num_threads=1)
+        self.assertTrue(np.all(ens.runs == nb_runs))
+        res = ens.run(self.l_H, self.h_adm, self.penalties, nb_bagging=10,
+                      seed=3, num_threads=2, block_size=2, adaptive=True)
+        runs = ens.runs
+        # the remaining runs could not have changed the ancestry
+        self.assertTrue(np.array_equal(res[0], ancestry))
+        self.assertTrue(np.all(runs % len(self.penalties) == 0))
+        self.assertTrue(np.all(runs <= nb_runs))
+        self.assertTrue(np.all(res[1] <= nb_runs))
+        ens.run(self.l_H, self.h_adm, self.penalties, nb_bagging=10,
+                seed=3, num_threads=1, adaptive=True, confidence=0.5)
+        self.assertTrue(np.all(ens.runs <= runs))
+        self.assertTrue(np.any(ens.runs < nb_runs))
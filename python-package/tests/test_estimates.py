@@ -1,9 +1,14 @@
 from __future__ import division
 
+import contextlib
+import ctypes as C
+import io
 import unittest
 import numpy as np
 
 import loter.graph as estimates
+from loter.find_lib import _LIB
+from loter.datastruct.panel import ReferencePanel
 import tests.generate_input as gen
 
 class EstimateSTest(unittest.TestCase):
@@ -122,3 +127,380 @@ class EstimateSHTest(unittest.TestCase):
                         [ 0,  0,  0,  0]])
 
         self.assertTrue(np.allclose(res, self.data["S"], atol=0.01))
+
+class EstimateSHknnTest(unittest.TestCase):
+
+    def test_estimateshknn(self):
+        A = np.array([[1,1,1,1,0,0,0,0],
+                      [0,0,0,0,1,1,1,1],
+                      [1,1,1,1,1,1,1,1],
+                      [0,0,0,0,0,0,0,0]], dtype=np.float32)
+        G = np.array([[2,2,2,2,1,1,1,1],
+                      [1,1,3,1,2,2,2,2],
+                      [0,0,0,0,0,0,0,0]], dtype=np.uint8)
+        data = {"G": G, "H": np.zeros((6,8), dtype=np.uint8), "A": A,
+                "S": np.zeros((6,8), dtype=np.uint8)}
+        param = {"penalty": 1.5, "nbclust": 4, "nb_iter": 1, "w_h": 1,
+                 "small_penalty": 0, "num_threads": 2}
+        estimates.EstimateSHknn().run(data, param)
+        res = np.array([[2,2,2,2,3,3,3,3],
+                        [2,2,2,2,2,2,2,2],
+                        [3,3,3,3,2,2,2,2],
+                        [2,2,2,2,2,2,2,2],
+                        [3,3,3,3,3,3,3,3],
+                        [3,3,3,3,3,3,3,3]])
+        self.assertTrue(np.array_equal(res, data["S"]))
+
+    def test_estimateshknn_pairs(self):
+        # odd number of references and missing genotypes
+        rs = np.random.RandomState(3)
+        k, m = 7, 120
+        A = rs.randint(0, 2, size=(k, m)).astype(np.float32)
+        pairs = np.array([[1, 4], [6, 2], [0, 5]])
+        G = (A[pairs[:, 0]] + A[pairs[:, 1]]).astype(np.uint8)
+        G[:, 10:15] = 3
+        data = {"G": G, "H": np.zeros((6, m), dtype=np.uint8), "A": A,
+                "S": np.zeros((6, m), dtype=np.uint8)}
+        param = {"penalty": 4, "nbclust": k, "nb_iter": 1, "w_h": 1,
+                 "small_penalty": 0, "num_threads": 2}
+        estimates.EstimateSHknn().run(data, param)
+        S = data["S"]
+        H = A[S, np.arange(m)]
+        self.assertTrue(np.array_equal((H[::2] + H[1::2])[G != 3], G[G != 3]))
+        self.assertTrue(np.array_equal(np.sort(S[:, 60].reshape(3, 2), axis=1),
+                                       np.sort(pairs, axis=1)))
+
+class EstimateSknnTest(unittest.TestCase):
+
+    def setUp(self):
+        rs = np.random.RandomState(42)
+        k, n, m = 37, 4, 300
+        self.A = rs.randint(0, 2, size=(k, m)).astype(np.uint8)
+        # admixed haplotypes copied from a few references with noise
+        H = self.A[rs.randint(k, size=(2*n, 1)), np.arange(m)]
+        H[:, 150:] = self.A[rs.randint(k, size=(2*n, 1)), np.arange(150, m)]
+        noise = rs.rand(2*n, m) < 0.05
+        H[noise] = 1 - H[noise]
+        H[rs.rand(2*n, m) < 0.02] = 3
+        self.H = np.ascontiguousarray(H).astype(np.uint8)
+        self.G = self.H[::2] + self.H[1::2]
+        self.param = {
+            "penalty": 2.5,
+            "nbclust": k,
+            "nb_iter": 1,
+            "w_h": 1,
+            "num_threads": 2,
+            "weights": np.ones(m, dtype=np.float32)
+        }
+
+    def run_kernel(self, kernel, **kwargs):
+        data = {
+            "G": self.G,
+            "H": self.H,
+            "A": self.A,
+            "S": np.zeros(self.H.shape, dtype=np.uint32),
+        }
+        param = dict(self.param, kernel=kernel, **kwargs)
+        estimates.EstimateSknn().run(data, param)
+        return data["S"]
+
+    def test_estimatesknn(self):
+        A = np.array([[1,1,1,0,0,0],
+                      [0,0,0,1,1,1]], dtype=np.uint8)
+        H = np.array([[1,1,1,1,1,1],
+                      [1,1,0,1,1,1],
+                      [0,0,0,1,1,1],
+                      [0,0,0,3,0,0]], dtype=np.uint8)
+        data = {"G": H[::2] + H[1::2], "H": H, "A": A,
+                "S": np.zeros(H.shape, dtype=np.uint32)}
+        param = dict(self.param, penalty=1.5, nbclust=2,
+                     weights=np.ones(6, dtype=np.float32))
+        estimates.EstimateSknn().run(data, param)
+        res = np.array([[0,0,0,1,1,1],
+                        [0,0,1,1,1,1],
+                        [1,1,1,1,1,1],
+                        [1,1,1,0,0,0]])
+        self.assertTrue(np.array_equal(res, data["S"]))
+
+    def test_estimatesknn_compact(self):
+        S_full = self.run_kernel("full")
+        S_compact = self.run_kernel("compact")
+        self.assertTrue(np.array_equal(S_full, S_compact))
+
+        weights = np.random.RandomState(0).rand(self.A.shape[1]).astype(np.float32)
+        S_full = self.run_kernel("full", weights=weights)
+        S_compact = self.run_kernel("compact", weights=weights)
+        self.assertTrue(np.array_equal(S_full, S_compact))
+
+    def test_estimatesknn_checkpoint(self):
+        S_full = self.run_kernel("full")
+        S_checkpoint = self.run_kernel("checkpoint")
+        self.assertTrue(np.array_equal(S_full, S_checkpoint))
+
+        # number of SNPs not a multiple of the checkpoint step
+        self.H = np.ascontiguousarray(self.H[:, :290])
+        self.A = np.ascontiguousarray(self.A[:, :290])
+        self.G = self.H[::2] + self.H[1::2]
+        self.param["weights"] = self.param["weights"][:290]
+        S_full = self.run_kernel("full")
+        S_checkpoint = self.run_kernel("checkpoint")
+        self.assertTrue(np.array_equal(S_full, S_checkpoint))
+
+    def test_estimatesknn_bitparallel(self):
+        for penalty in [0.0, 1.5, 2.5, 3.25, 40.0]:
+            self.param["penalty"] = penalty
+            S_full = self.run_kernel("full")
+            S_bitparallel = self.run_kernel("bitparallel")
+            self.assertTrue(np.array_equal(S_full, S_bitparallel))
+
+    def test_estimatesknn_integer(self):
+        weights = np.random.RandomState(0).randint(1, 9, self.A.shape[1]) / 4.0
+        for penalty in [0.0, 2.5, 3.25, 40.0, 100.0]:
+            self.param["penalty"] = penalty
+            S_full = self.run_kernel("full", weights=weights.astype(np.float32))
+            S_integer = self.run_kernel("integer", weights=weights.astype(np.float32))
+            self.assertTrue(np.array_equal(S_full, S_integer))
+
+        # not exactly quantised, falls back to the float kernel
+        weights = np.random.RandomState(0).rand(self.A.shape[1]).astype(np.float32)
+        S_full = self.run_kernel("full", weights=weights)
+        S_integer = self.run_kernel("integer", weights=weights)
+        self.assertTrue(np.array_equal(S_full, S_integer))
+
+    def test_estimatesknn_block(self):
+        S_full = self.run_kernel("full")
+        for kernel in ["compact", "bitparallel", "integer"]:
+            S_block = self.run_kernel(kernel, block_size=3)
+            self.assertTrue(np.array_equal(S_full, S_block))
+
+    def test_estimatesknn_multi(self):
+        penalties = [1.5, 2.0, 3.5, 40.0]
+        for kernel in ["full", "compact", "checkpoint", "bitparallel", "integer"]:
+            data = {"G": self.G, "H": self.H, "A": self.A}
+            param = dict(self.param, kernel=kernel, penalties=penalties, block_size=3)
+            estimates.EstimateSknn().run_multi(data, param)
+            self.assertEqual(data["S"].shape, (len(penalties),) + self.H.shape)
+            for p, penalty in enumerate(penalties):
+                S = self.run_kernel("full", penalty=penalty)
+                self.assertTrue(np.array_equal(S, data["S"][p]))
+
+    def test_estimatesknn_rows(self):
+        # a bootstrap sample solved on its distinct rows gives the same
+        # references as the materialised sample
+        k = self.A.shape[0]
+        draw = np.random.RandomState(1).randint(k, size=k)
+        _, first = np.unique(draw, return_index=True)
+        rows = draw[np.sort(first)]
+        penalties = [1.5, 4.0]
+        for kernel in ["full", "compact", "bitparallel", "integer"]:
+            param = dict(self.param, kernel=kernel, penalties=penalties, nbclust=k)
+            data = {"G": self.G, "H": self.H, "A": self.A[draw]}
+            estimates.EstimateSknn().run_multi(data, param)
+            S_sample = draw[data["S"]]
+            data = {"G": self.G, "H": self.H, "A": self.A}
+            estimates.EstimateSknn().run_multi(data, dict(param, rows=rows))
+            self.assertTrue(np.array_equal(S_sample, data["S"]))
+
+    def test_estimatesknn_panel(self):
+        k = self.A.shape[0]
+        l_H = [self.A[:20], self.A[20:]]
+        panel = ReferencePanel(l_H)
+        self.assertEqual(panel.nb_pops, 2)
+        self.assertTrue(panel.is_binary)
+        self.assertTrue(np.array_equal(panel.labels, [0]*20 + [1]*(k-20)))
+        self.assertTrue(np.array_equal(panel.populations[1], l_H[1]))
+
+        rows = np.array([3, 1, 30, 2, 25])
+        param = dict(self.param, penalties=[1.5, 4.0])
+        for kernel in ["compact", "bitparallel", "integer"]:
+            for p in [{}, {"rows": rows}]:
+                data = {"G": self.G, "H": self.H, "A": self.A}
+                estimates.EstimateSknn().run_multi(data, dict(param, kernel=kernel, **p))
+                S = data["S"]
+                data = {"H": np.asfortranarray(self.H)}
+                estimates.EstimateSknn().run_panel(data, dict(param, kernel=kernel, **p), panel)
+                self.assertTrue(np.array_equal(S, data["S"]))
+
+    def test_estimatesknn_panel_snps(self):
+        panel = ReferencePanel([self.A[:20], self.A[20:]])
+        self.assertEqual((panel.nbref, panel.nbsnp), self.A.shape)
+        self.assertTrue(np.array_equal(panel.A, self.A))
+        self.assertTrue(np.array_equal(panel.populations[1], self.A[20:]))
+        H = np.hstack([self.H, self.H])
+        param = dict(self.param, penalties=[1.5], penalty=1.5, window=50,
+                     weights=np.ones(H.shape[1], dtype=np.float32))
+        est = estimates.EstimateSknn()
+        for run in [lambda d: est.run_panel(d, param, panel),
+                    lambda d: est.run_panel(d, param, panel, labels=True),
+                    lambda d: est.run_margins(d, param, panel),
+                    lambda d: est.run_windows(d, param, panel),
+                    lambda d: est.run_refine(d, param, panel, [[0, 1, 2]]),
+                    lambda d: est.run_pbwt(d, param, panel)]:
+            with self.assertRaises(ValueError):
+                run({"H": H, "S": np.zeros(H.shape, dtype=np.uint32)})
+
+        # the native panel rejects them too
+        S = np.zeros((1,) + H.shape, dtype=np.uint32)
+        out = io.StringIO()
+        with contextlib.redirect_stdout(out):
+            _LIB.estimatesknn_run_panel(est.obj, np.ascontiguousarray(H.T), panel.obj,
+                                        np.arange(panel.nbref, dtype=np.int32), panel.nbref,
+                                        S, param["weights"], np.array([1.5], dtype=np.float32),
+                                        len(H) // 2, H.shape[1], 1, 1, 0, 0.0, 1,
+                                        C.byref(est._EH))
+        self.assertIn("SNPs", out.getvalue())
+        self.assertFalse(S.any())
+
+    def test_estimatesknn_panel_labels(self):
+        l_H = [self.A[:10], self.A[10:25], self.A[25:]]
+        panel = ReferencePanel(l_H)
+        rows = np.array([3, 1, 30, 12, 2, 25, 18])
+        param = dict(self.param, penalties=[1.5, 4.0], block_size=3)
+        for kernel in ["full", "compact", "bitparallel"]:
+            for p in [{}, {"rows": rows}]:
+                data = {"H": self.H}
+                estsknn = estimates.EstimateSknn()
+                estsknn.run_panel(data, dict(param, kernel=kernel, **p), panel)
+                estsknn.run_panel(data, dict(param, kernel=kernel, **p), panel, labels=True)
+                self.assertEqual(data["L"].dtype, np.uint8)
+                self.assertTrue(np.array_equal(panel.labels[data["S"]], data["L"]))
+
+    def test_estimatesknn_panel_margins(self):
+        l_H = [self.A[:10, :60], self.A[10:25, :60], self.A[25:, :60]]
+        panel = ReferencePanel(l_H)
+        H = self.H[:, :60]
+        A = np.vstack(l_H)
+        k, m = A.shape
+        weights = np.linspace(0.5, 2, m).astype(np.float32)
+        param = dict(self.param, penalty=1.5, weights=weights)
+        data = {"H": H}
+        estimates.EstimateSknn().run_margins(data, param, panel)
+        labels = {"H": H}
+        estimates.EstimateSknn().run_panel(labels, dict(param, penalties=[1.5]), panel,
+                                           labels=True)
+        self.assertTrue(np.array_equal(labels["L"][0], data["L"]))
+
+        def best_cost(h, j=None, allowed=None):
+            # best path cost, restricted to the references `allowed` at SNP j
+            cost = np.zeros(k)
+            for t in range(m):
+                if t > 0:
+                    cost = np.minimum(cost, cost.min() + 1.5)
+                if h[t] <= 1:
+                    cost += (A[:, t] != h[t]) * (1.0 if t == 0 else weights[t])
+                if t == j:
+                    cost[~allowed] = np.inf
+            return cost.min()
+
+        for i in [0, 5]:
+            best = best_cost(H[i])
+            for j in range(0, m, 7):
+                other = best_cost(H[i], j, panel.labels != data["L"][i, j])
+                self.assertAlmostEqual(data["margins"][i, j], other - best, places=4)
+
+        # a single population is never contradicted
+        data = {"H": H}
+        estimates.EstimateSknn().run_margins(data, param, ReferencePanel([A]))
+        self.assertTrue(np.all(np.isinf(data["margins"])))
+
+    def test_estimatesknn_panel_windows(self):
+        panel = ReferencePanel([self.A[:20], self.A[20:]])
+        param = dict(self.param, penalties=[2.5])
+        data = {"H": self.H}
+        estimates.EstimateSknn().run_panel(data, param, panel)
+        S = data["S"][0]
+        for kernel in ["compact", "bitparallel"]:
+            data = {"H": self.H}
+            estimates.EstimateSknn().run_windows(data, dict(param, window=80, overlap=20,
+                                                            kernel=kernel), panel)
+            self.assertEqual(data["seams"].shape, (len(self.H), 4))
+            self.assertFalse(data["seams"].any())
+            self.assertTrue(np.array_equal(data["S"], S))
+
+        # without overlap the paths can not be checked
+        data = {"H": self.H}
+        estimates.EstimateSknn().run_windows(data, dict(param, window=100, overlap=0), panel)
+        self.assertTrue(data["seams"].all())
+        data = {"H": self.H}
+        estimates.EstimateSknn().run_windows(data, dict(param, window=400), panel)
+        self.assertEqual(data["seams"].shape, (len(self.H), 0))
+        self.assertTrue(np.array_equal(data["S"], S))
+
+        # the haplotypes identical over a window are solved once in it, the
+        # last one is the same as the third one in the last window
+        n = len(self.H)
+        H = np.vstack([self.H, self.H[:2]])
+        H[-1, 200:] = self.H[2, 200:]
+        data = {"H": np.asfortranarray(H)}
+        estimates.EstimateSknn().run_windows(data, dict(param, window=80, overlap=20), panel)
+        self.assertTrue(np.array_equal(data["unique"], [n, n, n, n + 1, n]))
+        self.assertAlmostEqual(data["dedup_ratio"], 5 * (n + 2) / (5 * n + 1.0))
+        self.assertTrue(np.array_equal(data["S"][:n], S))
+        self.assertTrue(np.array_equal(data["S"][n], S[0]))
+
+    def test_estimatesknn_panel_refine(self):
+        panel = ReferencePanel([self.A[:20], self.A[20:]])
+        param = dict(self.param, penalties=[2.5], kernel="compact")
+        data = {"H": self.H}
+        estimates.EstimateSknn().run_panel(data, param, panel)
+        S = data["S"][0]
+        m = S.shape[1]
+
+        def path_cost(S):
+            cols = np.arange(m)
+            err = (self.A[S, cols] != self.H) & (self.H <= 1)
+            err = err * np.r_[1, self.param["weights"][1:]]
+            return err.sum(axis=1) + 2.5 * (S[:, 1:] != S[:, :-1]).sum(axis=1)
+
+        # the optimal paths are kept in windows with their own references
+        windows = [[i, start, end] for i in range(len(S))
+                   for start, end in [(0, 40), (90, 160), (200, m)]]
+        data["S"] = S.copy()
+        estimates.EstimateSknn().run_refine(data, dict(param, penalty=2.5), panel, windows)
+        self.assertTrue(np.allclose(path_cost(data["S"]), path_cost(S)))
+
+        # an interval of a wrong reference is removed
+        S_wrong = S.copy()
+        S_wrong[:, 120:130] = (S[:, 120:121] + 1) % len(self.A)
+        data["S"] = S_wrong
+        windows = [[i, 110, 140] for i in range(len(S))]
+        estimates.EstimateSknn().run_refine(data, dict(param, penalty=2.5), panel, windows)
+        self.assertTrue(np.all(path_cost(data["S"]) <= path_cost(S_wrong)))
+        self.assertTrue(np.allclose(path_cost(data["S"]), path_cost(S)))
+
+    def test_estimatesknn_panel_pbwt(self):
+        panel = ReferencePanel([self.A[:20], self.A[20:]])
+        k, m = self.A.shape
+        weights = np.linspace(0.5, 2, m).astype(np.float32)
+        param = dict(self.param, penalties=[2.5], weights=weights, kernel="compact")
+        data = {"H": self.H}
+        estimates.EstimateSknn().run_panel(data, param, panel)
+
+        # with all the references as candidates
+        for window in [30, 77, m]:
+            pbwt = {"H": self.H}
+            estimates.EstimateSknn().run_pbwt(pbwt, dict(param, penalty=2.5, window=window,
+                                                         checkpoints=1, neighbours=k,
+                                                         random=0), panel)
+            self.assertTrue(np.array_equal(pbwt["S"], data["S"][0]))
+
+        # copies of references are found
+        rows = np.array([[3, 17], [30, 8]])
+        H = np.hstack([self.A[rows[:, 0], :150], self.A[rows[:, 1], 150:]])
+        pbwt = {"H": H}
+        estimates.EstimateSknn().run_pbwt(pbwt, dict(param, penalty=2.5, window=50,
+                                                     checkpoints=5, neighbours=2,
+                                                     random=1), panel)
+        self.assertTrue(np.array_equal(pbwt["S"][:, :140], np.repeat(rows[:, :1], 140, axis=1)))
+        self.assertTrue(np.array_equal(pbwt["S"][:, 160:], np.repeat(rows[:, 1:], m - 160, axis=1)))
+
+        # the candidates built by blocks of haplotypes do not depend on them
+        l_S = []
+        for num_threads in [1, 3]:
+            pbwt = {"H": self.H}
+            estimates.EstimateSknn().run_pbwt(pbwt, dict(param, penalty=2.5, window=40,
+                                                         checkpoints=3, neighbours=2,
+                                                         random=2, num_threads=num_threads),
+                                              panel)
+            l_S.append(pbwt["S"])
+        self.assertTrue(np.array_equal(l_S[0], l_S[1]))
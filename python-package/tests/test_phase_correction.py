@@ -0,0 +1,48 @@
+from __future__ import division
+
+import unittest
+import numpy as np
+
+import loter.graph as estimates
+from loter.locanc.phase_correction import PhaseCorrection
+
+class PhaseCorrectionTest(unittest.TestCase):
+
+    def setUp(self):
+        rs = np.random.RandomState(11)
+        n, m = 5, 300
+        # ancestry genotypes by segments, with errors and unknown values
+        G = np.zeros((n, m), dtype=np.uint8)
+        for i in range(n):
+            cuts = np.sort(rs.randint(0, m, size=4))
+            G[i] = np.repeat(rs.randint(0, 3, size=5), np.diff(np.r_[0, cuts, m]))
+        noise = rs.rand(n, m) < 0.1
+        G[noise] = rs.randint(0, 3, size=noise.sum())
+        G[rs.rand(n, m) < 0.03] = 255
+        G[3] = 255
+        self.G = G
+
+    def test_phase_correction(self):
+        S, lambdas = PhaseCorrection().run(self.G, threshold=0.9, num_threads=2)
+        n, m = self.G.shape
+        self.assertEqual(S.shape, (2*n, m))
+        self.assertEqual(lambdas[3], 1)
+
+        # same paths as EstimateSHknn with the references [0 ... 0] and
+        # [1 ... 1] at the penalties found
+        A = np.vstack([np.zeros(m), np.ones(m)]).astype(np.float32)
+        for i in range(n):
+            data = {"G": self.G[i:i+1], "H": np.zeros((2, m), dtype=np.uint8),
+                    "A": A, "S": np.zeros((2, m), dtype=np.uint8)}
+            param = {"penalty": lambdas[i], "nbclust": 2, "nb_iter": 1, "w_h": 1,
+                     "small_penalty": lambdas[i], "num_threads": 1}
+            estimates.EstimateSHknn().run(data, param)
+            self.assertTrue(np.array_equal(data["S"], S[2*i:2*i+2]))
+
+    def test_phase_correction_exact(self):
+        # ancestries without errors are given back
+        G = np.array([[0]*20 + [1]*20 + [2]*20,
+                      [2]*30 + [1]*30], dtype=np.uint8)
+        S, lambdas = PhaseCorrection().run(G, threshold=0.9, num_threads=1)
+        self.assertTrue(np.array_equal(S[::2] + S[1::2], G))
+        self.assertTrue(np.all(lambdas > 1))
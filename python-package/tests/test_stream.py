@@ -0,0 +1,64 @@
+from __future__ import division
+
+import unittest
+import numpy as np
+
+import loter.graph as estimates
+from loter.datastruct.panel import ReferencePanel
+from loter.locanc.stream import SknnStream, locanc_stream
+
+class SknnStreamTest(unittest.TestCase):
+
+    def setUp(self):
+        rs = np.random.RandomState(5)
+        k, n, m = 30, 6, 500
+        self.A = rs.randint(0, 2, size=(k, m)).astype(np.uint8)
+        # admixed haplotypes copied from a few references with noise
+        H = self.A[rs.randint(k, size=(n, 1)), np.arange(m)]
+        H[:, 250:] = self.A[rs.randint(k, size=(n, 1)), np.arange(250, m)]
+        noise = rs.rand(n, m) < 0.05
+        H[noise] = 1 - H[noise]
+        H[rs.rand(n, m) < 0.02] = 255
+        self.H = H.astype(np.uint8)
+        self.weights = (rs.rand(m) + 0.5).astype(np.float32)
+
+        panel = ReferencePanel([self.A[:12], self.A[12:]])
+        data = {"H": self.H}
+        param = {"penalties": [2.5], "num_threads": 1, "weights": self.weights,
+                 "kernel": "compact"}
+        estimates.EstimateSknn().run_panel(data, param, panel)
+        self.S = data["S"][0]
+        self.labels = panel.labels
+
+    def stream(self, chunk, lag):
+        stream = SknnStream(len(self.H), len(self.A), 2.5, lag, num_threads=2)
+        l_S = []
+        for start in range(0, self.H.shape[1], chunk):
+            end = start + chunk
+            l_S.append(stream.push(self.H[:, start:end], self.A[:, start:end],
+                                   self.weights[start:end]))
+        l_S.append(stream.finish())
+        return l_S
+
+    def test_stream(self):
+        for chunk in [1, 37, 500]:
+            S = np.hstack(self.stream(chunk, 0))
+            self.assertTrue(np.array_equal(S, self.S))
+
+    def test_stream_lag(self):
+        l_S = self.stream(10, 5)
+        # at most lag + chunk SNPs are waiting after each chunk
+        done = np.cumsum([S.shape[1] for S in l_S[:-1]])
+        pushed = np.minimum(10 * np.arange(1, len(done) + 1), self.H.shape[1])
+        self.assertTrue(np.all(pushed - done <= 5))
+        self.assertEqual(np.hstack(l_S).shape, self.H.shape)
+
+    def test_locanc_stream(self):
+        m = self.H.shape[1]
+        chunks = ((self.H[:, s:s+64], self.A[:, s:s+64]) for s in range(0, m, 64))
+        ancestry = np.hstack(list(locanc_stream(chunks, [12, 18], 2.5, num_threads=1)))
+        weights = self.weights
+        self.weights = np.ones(m, dtype=np.float32)
+        S = np.hstack(self.stream(64, 0))
+        self.weights = weights
+        self.assertTrue(np.array_equal(ancestry, self.labels[S]))